@@ -0,0 +1,63 @@
+"""
+带连接池的 MySQL 数据库后端，在 DATABASES 中配置:
+
+    'ENGINE': 'backend.mysqlpool',
+    'CONN_MAX_AGE': 0,
+    'OPTIONS': {
+        ...,
+        'pool': {'size': 10, 'recycle': 3600, 'timeout': 10, 'ping_interval': 30},
+    },
+
+Django 在请求结束时关闭连接，这里改为归还给连接池，下一个请求直接复用，
+省去每次请求的 TCP 连接和认证握手
+"""
+from django.db.backends.mysql import base as mysql_base
+from django.utils.asyncio import async_unsafe
+
+from backend.mysqlpool.pool import getPool
+
+
+class DatabaseWrapper(mysql_base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pooled_connection = None
+
+    @property
+    def pool(self):
+        return getPool(
+            self.alias,
+            ping=lambda connection: connection.ping(),
+            **self.settings_dict['OPTIONS'].get('pool', {}),
+        )
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        # 连接池的配置不传给驱动
+        conn_params.pop('pool', None)
+        return conn_params
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        self._pooled_connection = self.pool.checkout(
+            connect=lambda: super(DatabaseWrapper, self).get_new_connection(conn_params),
+        )
+        return self._pooled_connection.connection
+
+    def _close(self):
+        pooled, self._pooled_connection = self._pooled_connection, None
+
+        if pooled is None:
+            return super()._close()
+
+        # 发生过数据库错误的连接状态未知，不再复用；未结束的事务先回滚，避免带到下一个请求
+        discard = self.errors_occurred
+
+        if not discard and (self.in_atomic_block or not self.autocommit):
+            try:
+                with self.wrap_database_errors:
+                    self.connection.rollback()
+            except Exception:
+                discard = True
+
+        self.pool.checkin(pooled, discard=discard)
@@ -0,0 +1,198 @@
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """
+    等待空闲连接超时
+    """
+    pass
+
+
+class PooledConnection(object):
+    """
+    池中的一条连接及其创建、归还时间
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool(object):
+    """
+    进程内的数据库连接池，与具体的数据库驱动无关。
+    空闲连接按后进先出复用，使最近用过的连接保持活跃、长时间不用的连接自然过期
+    """
+
+    def __init__(self, size=10, recycle=3600, timeout=10, ping_interval=30, ping=None):
+        """
+        :param size: 最大连接数（包括借出和空闲的）
+        :param recycle: 连接创建后超过该秒数不再复用，应小于 MySQL 的 wait_timeout
+        :param timeout: 连接全部借出时等待归还的最长秒数
+        :param ping_interval: 连接空闲超过该秒数后，借出前先做一次健康检查
+        :param ping: 健康检查函数，参数为驱动的连接对象，失败时抛出异常
+        """
+        self.size = size
+        self.recycle = recycle
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.ping = ping
+
+        self._idle = []
+        self._opened = 0
+        self._condition = threading.Condition()
+
+        self._stats = {
+            'checkouts': 0,         # 借出次数
+            'waits': 0,             # 借出时需要等待的次数
+            'wait_timeouts': 0,     # 等待超时的次数
+            'opened': 0,            # 新建连接数
+            'closed': 0,            # 关闭连接数（含下面三类）
+            'recycled': 0,          # 超过 recycle 被关闭
+            'ping_failures': 0,     # 健康检查失败被关闭
+            'discarded': 0,         # 使用方报告不可用被关闭
+        }
+
+    def checkout(self, connect) -> PooledConnection:
+        """
+        借出一条连接，优先复用空闲连接
+
+        :param connect: 需要新建连接时调用的无参函数，返回驱动的连接对象
+        :return: 借出的连接，用完后必须调用 checkin 归还
+        :raise PoolTimeout: 超过 timeout 仍没有可用连接
+        """
+        deadline = time.monotonic() + self.timeout
+        waited = False
+
+        with self._condition:
+            self._stats['checkouts'] += 1
+
+        while True:
+            with self._condition:
+                while not self._idle and self._opened >= self.size:
+                    remaining = deadline - time.monotonic()
+
+                    if remaining <= 0:
+                        self._stats['wait_timeouts'] += 1
+                        raise PoolTimeout('no connection available in {} seconds'.format(self.timeout))
+
+                    if not waited:
+                        self._stats['waits'] += 1
+                        waited = True
+
+                    self._condition.wait(remaining)
+
+                if self._idle:
+                    pooled = self._idle.pop()
+                else:
+                    pooled = None
+                    self._opened += 1
+
+            if pooled is None:
+                return self._open(connect)
+
+            # 健康检查在锁外进行，失败时丢弃该连接并重试
+            if self._isReusable(pooled):
+                return pooled
+
+    def checkin(self, pooled: PooledConnection, discard=False):
+        """
+        归还借出的连接
+
+        :param pooled: checkout 返回的连接
+        :param discard: 连接已不可用（如发生了数据库错误），直接关闭
+        """
+        if discard:
+            self._close(pooled, 'discarded')
+            return
+
+        if time.monotonic() - pooled.created_at > self.recycle:
+            self._close(pooled, 'recycled')
+            return
+
+        pooled.last_used = time.monotonic()
+
+        with self._condition:
+            self._idle.append(pooled)
+            self._condition.notify()
+
+    def stats(self) -> dict:
+        """
+        :return: 计数器以及当前的空闲、借出连接数
+        """
+        with self._condition:
+            return dict(
+                self._stats,
+                size=self.size,
+                idle=len(self._idle),
+                in_use=self._opened - len(self._idle),
+            )
+
+    def _open(self, connect) -> PooledConnection:
+        try:
+            connection = connect()
+        except Exception:
+            with self._condition:
+                self._opened -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._stats['opened'] += 1
+
+        return PooledConnection(connection)
+
+    def _isReusable(self, pooled: PooledConnection) -> bool:
+        now = time.monotonic()
+
+        if now - pooled.created_at > self.recycle:
+            self._close(pooled, 'recycled')
+            return False
+
+        if self.ping is not None and now - pooled.last_used > self.ping_interval:
+            try:
+                self.ping(pooled.connection)
+            except Exception:
+                self._close(pooled, 'ping_failures')
+                return False
+
+        return True
+
+    def _close(self, pooled: PooledConnection, reason: str):
+        try:
+            pooled.connection.close()
+        except Exception:
+            pass
+
+        with self._condition:
+            self._opened -= 1
+            self._stats['closed'] += 1
+            self._stats[reason] += 1
+            self._condition.notify()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def getPool(alias: str, **pool_options) -> ConnectionPool:
+    """
+    :param alias: 数据库别名，每个别名一个进程内单例
+    :param pool_options: 第一次创建时传给 ConnectionPool 的参数
+    :return: 连接池
+    """
+    if alias not in _pools:
+        with _pools_lock:
+            if alias not in _pools:
+                _pools[alias] = ConnectionPool(**pool_options)
+
+    return _pools[alias]
+
+
+def getPoolStats() -> dict:
+    """
+    :return: 本进程内各数据库别名的连接池统计，未使用连接池时为空
+    """
+    return {alias: pool.stats() for alias, pool in list(_pools.items())}
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,6 +49,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'utils.jwtAuth.JwtAuthMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -75,14 +77,31 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# 数据库连接方式，由环境变量 DB_CONNECTION_MODE 选择:
+# persistent（默认）: 每个工作线程保持一个长连接，DB_CONN_MAX_AGE 秒后重建，请求中第一次使用前检查连接是否可用
+# pool: 使用 backend.mysqlpool 连接池，请求结束时把连接归还给池，池的大小和回收时间见 DB_POOL_OPTIONS
+DB_CONNECTION_MODE = os.environ.get('DB_CONNECTION_MODE', 'persistent')
+
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+
+DB_POOL_OPTIONS = {
+    'size': int(os.environ.get('DB_POOL_SIZE', 10)),  # 每个进程的最大连接数
+    'recycle': int(os.environ.get('DB_POOL_RECYCLE', 3600)),  # 秒，应小于 MySQL 的 wait_timeout
+    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),  # 秒，连接全部借出时的最长等待时间
+    'ping_interval': 30,  # 秒，空闲超过该时间的连接借出前先 ping
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'backend.mysqlpool' if DB_CONNECTION_MODE == 'pool' else 'django.db.backends.mysql',
         'NAME': 'musicplayer',
         'USER': 'root',
         'PASSWORD': 'root1234',
         'HOST': '121.41.59.174',
         'PORT': 3306,
+        # 使用连接池时由池负责复用，Django 在每个请求结束时"关闭"（归还）连接
+        'CONN_MAX_AGE': 0 if DB_CONNECTION_MODE == 'pool' else DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONNECTION_MODE != 'pool',
         'OPTIONS': {
             'charset': 'utf8mb4',
             'use_unicode': True,
@@ -91,6 +110,37 @@ DATABASES = {
     }
 }
 
+if DB_CONNECTION_MODE == 'pool':
+    DATABASES['default']['OPTIONS']['pool'] = DB_POOL_OPTIONS
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# entity 缓存热点实体（歌曲、创作者、歌单）序列化后的响应数据。
+# 设置环境变量 ENTITY_CACHE_REDIS_URL 时使用 Redis（多个进程共享），否则使用进程内缓存
+ENTITY_CACHE_REDIS_URL = os.environ.get('ENTITY_CACHE_REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'entity': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': ENTITY_CACHE_REDIS_URL,
+        'KEY_PREFIX': 'musicplayer',
+    } if ENTITY_CACHE_REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'entity',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+ENTITY_CACHE_ALIAS = 'entity'
+ENTITY_CACHE_TIMEOUT = 300  # 秒，跨实体的变化（如歌曲改名后包含它的歌单）依赖过期时间更新
+ENTITY_CACHE_VERSION = 5  # 缓存数据的结构变化时递增
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -143,3 +193,110 @@ EMAIL_HOST_USER = 'yulo25541733@163.com'
 # jwt令牌的密钥
 JWT_SECRET_KEY = 'web_musicplayer'
 
+# jwt 鉴权用户缓存：开启后令牌校验命中进程内缓存时不再查询数据库
+# 修改用户信息的接口会更换实体缓存(ENTITY_CACHE_ALIAS)中用户的代数，所有进程的缓存在下一次请求时失效，
+# 多进程部署时实体缓存需要使用 Redis
+JWT_USER_CACHE_ENABLED = True
+JWT_USER_CACHE_MAX_SIZE = 4096
+JWT_USER_CACHE_TTL = 60  # 秒
+
+# 歌曲搜索后端：'mysql' 使用 ngram 全文索引；'memory' 使用进程内倒排索引，适合开发和测试
+SONG_SEARCH_BACKEND = 'mysql'
+
+
+# 上传流水线：上传接口把文件暂存到本地后立即返回任务id，由后台线程池上传到对象存储
+# UPLOAD_STORAGE_BACKEND 为 'oss' 时上传到阿里云 oss；'local' 时复制到 UPLOAD_LOCAL_ROOT，适合开发和测试
+UPLOAD_STORAGE_BACKEND = os.environ.get('UPLOAD_STORAGE_BACKEND', 'oss')
+UPLOAD_STAGING_DIR = os.environ.get('UPLOAD_STAGING_DIR', str(BASE_DIR / 'upload_staging'))
+UPLOAD_LOCAL_ROOT = str(BASE_DIR / 'media')
+UPLOAD_LOCAL_URL = 'http://127.0.0.1:8000/media/'
+UPLOAD_WORKERS = 4  # 每个进程的上传线程数，0 表示在请求线程中同步上传
+UPLOAD_MAX_ATTEMPTS = 3
+UPLOAD_RETRY_DELAY = 2  # 秒，第 n 次重试前等待 UPLOAD_RETRY_DELAY * 2^(n-1) 秒
+# 上传中的任务每秒更新进度，超过该时间没有更新视为所在进程已退出，resume_upload_jobs 才会重新提交
+UPLOAD_STALE_TIMEOUT = 600  # 秒
+
+# 阿里云 oss 访问密钥。配置 ALIYUN_CREDENTIALS_FILE 时从该 JSON 文件读取，文件修改后几秒内生效，不需要重启；
+# 否则使用环境变量中的密钥
+ALIYUN_CREDENTIALS_FILE = os.environ.get('ALIYUN_CREDENTIALS_FILE')
+ALIYUN_ACCESS_KEY_ID = os.environ.get('ALIYUN_ACCESS_KEY_ID', '')
+ALIYUN_ACCESS_KEY_SECRET = os.environ.get('ALIYUN_ACCESS_KEY_SECRET', '')
+
+# oss 客户端在进程内共用，HTTP 连接池应不小于同时上传的线程数 UPLOAD_WORKERS * OSS_UPLOAD_THREADS
+OSS_HTTP_POOL_SIZE = 16
+OSS_TIMEOUT = 60  # 秒，连接和读取超时
+
+# oss 分片上传：超过阈值的文件按 OSS_PART_SIZE 分片，OSS_UPLOAD_THREADS 个线程并行上传，
+# 检查点保存在 OSS_CHECKPOINT_DIR 中，失败重试时从断点继续
+OSS_MULTIPART_THRESHOLD = 10 * 1024 * 1024
+OSS_PART_SIZE = 5 * 1024 * 1024
+OSS_UPLOAD_THREADS = 4
+OSS_CHECKPOINT_DIR = os.path.join(UPLOAD_STAGING_DIR, 'checkpoints')
+
+# 浏览器分片上传：客户端按 CHUNKED_UPLOAD_CHUNK_SIZE 切分文件逐片上传，全部到齐后进入上传流水线
+CHUNKED_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+
+# 浏览器直传：客户端用预签名地址把文件直接上传到 oss，地址 DIRECT_UPLOAD_EXPIRES 秒后失效。
+# 本地存储时预签名地址指向本服务的 UPLOAD_LOCAL_DIRECT_URL
+DIRECT_UPLOAD_EXPIRES = 900
+UPLOAD_LOCAL_DIRECT_URL = 'http://127.0.0.1:8000/api/localDirectUpload/'
+
+# 分片上传和直传的文件大小上限
+UPLOAD_MAX_SIZE = 1024 * 1024 * 1024
+
+# 封面、头像上传成功后在上传线程池中生成缩略图，规格见 utils.imagePipeline.IMAGE_VARIANTS
+IMAGE_VARIANT_QUALITY = 80  # WebP/JPEG 的压缩质量
+
+# 歌曲音频上传成功后转码为多个码率和 HLS 分段，规格见 utils.audioTranscode.AUDIO_RENDITIONS。
+# 转码在 TRANSCODE_WORKERS 个进程的进程池中执行，0 表示在上传线程中直接执行
+FFMPEG_BINARY = os.environ.get('FFMPEG_BINARY', 'ffmpeg')
+TRANSCODE_WORKERS = 2
+TRANSCODE_TIMEOUT = 1800  # 秒
+HLS_SEGMENT_SECONDS = 10
+
+# 音频流代理 streamSong：热门音频缓存在本地磁盘，命中时用 sendfile 发送，未命中时从 oss 分块转发。
+# 同一文件未命中 STREAM_CACHE_ADMIT_HITS 次后在后台下载进缓存，总大小超过上限时淘汰最近最少使用的文件
+STREAM_CACHE_DIR = os.environ.get('STREAM_CACHE_DIR', str(BASE_DIR / 'stream_cache'))
+STREAM_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+STREAM_CACHE_ADMIT_HITS = 2
+STREAM_CACHE_FILL_WORKERS = 2  # 0 表示在请求线程中同步下载
+STREAM_CHUNK_SIZE = 256 * 1024
+# 响应的 Cache-Control max-age，单位秒。重新上传音频后地址不变，CDN 最多延迟该时间，之后凭 ETag 重新验证
+STREAM_MAX_AGE = 3600
+
+# 收听事件：上报接口把事件放入进程内缓冲区，后台线程每 LISTENING_EVENT_FLUSH_INTERVAL 秒或攒够
+# LISTENING_EVENT_BATCH_SIZE 条时 bulk_create 写入，并累加小时、天汇总。0 表示在请求线程中立即写入。
+# 缓冲区超过 LISTENING_EVENT_BUFFER_MAX 条（数据库长时间不可用）时丢弃最早的事件；进程被强制结束时缓冲区中的事件丢失
+LISTENING_EVENT_FLUSH_INTERVAL = 5  # 秒
+LISTENING_EVENT_BATCH_SIZE = 500
+LISTENING_EVENT_BUFFER_MAX = 100000
+LISTENING_EVENT_MAX_PER_REQUEST = 100
+
+# 排行榜：收听、收藏、评论、关注时累加实体当天的得分，并增量更新实体缓存中各窗口的前 CHART_TOP_K 名，
+# 读取榜单不扫描得分表。增量更新的偏差由定期执行的 recompute_charts 命令（如每小时一次）按源表纠正
+CHART_TOP_K = 100
+CHART_CACHE_TIMEOUT = 2 * 24 * 3600  # 秒，键中带有窗口起始日期，跨天后旧榜单自然过期
+CHART_RETENTION_DAYS = 30  # recompute_charts 删除更早的得分，不应小于最长的窗口（7 天）
+
+# 点赞：点赞记录立即写入，点赞数的增量在进程内按目标合并，每 LIKE_FLUSH_INTERVAL 秒用一条 F() 更新写入，
+# 热门评论的点赞不会集中在同一行的行锁上。0 表示在请求线程中立即写入
+LIKE_FLUSH_INTERVAL = 2  # 秒
+
+# 社群动态：关注人数少于 FEED_FANOUT_MAX_MEMBERS 的社群发帖时写入每个关注者的时间线，
+# 更大的社群在读取动态时合并。时间线由定期执行的 trim_feeds 命令截断到 FEED_TIMELINE_MAX 条，
+# 关注社群时补入最近的 FEED_BACKFILL_COUNT 条帖子
+FEED_FANOUT_MAX_MEMBERS = 1000
+FEED_TIMELINE_MAX = 500
+FEED_BACKFILL_COUNT = 20
+
+# 热门社群：按最近 COMMUNITY_ACTIVITY_DAYS 天的发帖、评论、新增关注汇总活跃度，
+# 前 COMMUNITY_TOP_MAX 名在实体缓存中保存 COMMUNITY_TOP_CACHE_TIMEOUT 秒
+COMMUNITY_ACTIVITY_DAYS = 7
+COMMUNITY_TOP_MAX = 20
+COMMUNITY_TOP_CACHE_TIMEOUT = 60  # 秒
+
+# 批量关注、批量收藏接口每次请求最多的id数
+BATCH_OPERATION_MAX_ITEMS = 500
+
+# 导入歌单时最多读取的行数
+SONGLIST_IMPORT_MAX_ITEMS = 10000
@@ -22,6 +22,11 @@ from musicplayer import views_producer_center as views_pc
 from musicplayer import views_user_center as views_uc
 from musicplayer import views_display as views_dp
 from musicplayer import views_community as views_cc
+from musicplayer import views_monitor as views_mo
+from musicplayer import views_upload as views_ul
+from musicplayer import views_event as views_ev
+from musicplayer import views_chart as views_ch
+from musicplayer import views_like as views_lk
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -40,11 +45,16 @@ urlpatterns = [
     path('api/querySongByCondition/', views_dp.querySongByCondition),
 
     path('api/querySongById/', views_dp.querySongById),
+    path('api/streamSong/', views_dp.streamSong),
     path('api/createSongList/', views_dp.createSongList),
     path('api/modifySongList/', views_dp.modifySongList),
     path('api/querySongList/', views_dp.querySongList),
 
     path('api/addSongToSongList/', views_dp.addSongToSongList),
+    path('api/batchAddSongToSongList/', views_dp.batchAddSongToSongList),
+    path('api/reorderSongList/', views_dp.reorderSongList),
+    path('api/exportSongList/', views_dp.exportSongList),
+    path('api/importSongList/', views_dp.importSongList),
     path('api/dropSongFromSongList/', views_dp.dropSongToSongList),
 
     path('api/createSongComment/', views_dp.createSongComment),
@@ -53,6 +63,7 @@ urlpatterns = [
 
     path('api/queryProducerByCondition/', views_dp.queryProducerByCondition),
     path('api/followProducer/', views_dp.followProducer),
+    path('api/batchFollowProducer/', views_dp.batchFollowProducer),
     path('api/cancelFollowProducer/', views_dp.cancelFollowProducer),
 
 
@@ -84,7 +95,37 @@ urlpatterns = [
     # communityCenter 社群中心
     path('api/createCommunity/',views_cc.createCommunity),
     path('api/UserFollowCommunity/',views_cc.UserFollowCommunity),
+    path('api/batchFollowCommunity/', views_cc.batchFollowCommunity),
     path('api/getUserAllCommunity/',views_cc.getUserAllCommunity),
-    path('api/',views_cc.showTop5Community) # 未完成
+    path('api/createBlog/', views_cc.createBlog),
+    path('api/createBlogComment/', views_cc.createBlogComment),
+    path('api/queryCommunityFeed/', views_cc.queryCommunityFeed),
+    path('api/showTop5Community/', views_cc.showTop5Community),
+    path('api/',views_cc.showTop5Community),
+
+    # upload 文件上传
+    path('api/queryUploadJob/', views_ul.queryUploadJob),
+    path('api/initChunkedUpload/', views_ul.initChunkedUpload),
+    path('api/uploadChunk/', views_ul.uploadChunk),
+    path('api/completeChunkedUpload/', views_ul.completeChunkedUpload),
+    path('api/requestDirectUpload/', views_ul.requestDirectUpload),
+    path('api/completeDirectUpload/', views_ul.completeDirectUpload),
+    path('api/localDirectUpload/', views_ul.localDirectUpload),
+
+    # event 收听事件
+    path('api/recordListeningEvents/', views_ev.recordListeningEvents),
+
+    # chart 排行榜
+    path('api/queryChart/', views_ch.queryChart),
+
+    # like 点赞
+    path('api/like/', views_lk.like),
+    path('api/cancelLike/', views_lk.cancelLike),
+
+    # monitor 运维监控
+    path('api/monitor/entityCacheStats/', views_mo.queryEntityCacheStats),
+    path('api/monitor/databasePoolStats/', views_mo.queryDatabasePoolStats),
+    path('api/monitor/streamCacheStats/', views_mo.queryStreamCacheStats),
+    path('api/monitor/listeningEventStats/', views_mo.queryListeningEventStats),
 
 ]
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from utils.charts import recomputeCharts
+
+
+class Command(BaseCommand):
+    help = '按源表重新计算排行榜得分并重建缓存中的榜单，纠正增量更新的偏差，应定期（如每小时）执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='重新计算最近多少天，默认为最长的窗口')
+
+    def handle(self, *args, **options):
+        score_counts = recomputeCharts(options['days'])
+
+        for chart, score_count in score_counts.items():
+            self.stdout.write('{}: {} scores'.format(chart, score_count))
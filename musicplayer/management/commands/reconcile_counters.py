@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from utils.counters import reconcileCounters
+from utils.likes import flushLikes
+
+
+class Command(BaseCommand):
+    help = (
+        '按关系表的实际记录数修复粉丝数、评论数、收藏数、社群人数等计数的偏差，可以在服务运行时执行。'
+        '点赞数在各服务进程内缓冲，只有加上 --include-likes 时修复，此时必须先停止所有服务进程'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--include-likes', action='store_true',
+            help='同时修复点赞数，只能在所有服务进程停止后使用，否则缓冲中的点赞会被重复计算',
+        )
+
+    def handle(self, *args, **options):
+        if options['include_likes']:
+            # 本进程缓冲中的增量先写入，其余进程应已停止并在退出时写入
+            flushLikes()
+
+        repaired = reconcileCounters(include_buffered=options['include_likes'])
+
+        for counter, repaired_count in repaired.items():
+            self.stdout.write('{}: repaired {} rows'.format(counter, repaired_count))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from utils.uploadPipeline import resumeUploadJobs
+
+
+class Command(BaseCommand):
+    help = '重新上传进程退出时没有完成的上传任务，只处理超过 UPLOAD_STALE_TIMEOUT 秒没有更新的任务，可以在服务运行时执行'
+
+    def handle(self, *args, **options):
+        resumed_count = resumeUploadJobs()
+        self.stdout.write('resumed {} upload jobs'.format(resumed_count))
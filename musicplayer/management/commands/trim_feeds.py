@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from utils.communityFeed import trimTimelines
+
+
+class Command(BaseCommand):
+    help = '把每个用户的社群动态时间线截断到 settings.FEED_TIMELINE_MAX 条，应定期（如每天）执行'
+
+    def handle(self, *args, **options):
+        deleted_count = trimTimelines()
+        self.stdout.write('deleted {} feed items'.format(deleted_count))
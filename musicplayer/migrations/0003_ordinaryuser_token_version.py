@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0002_songandproducer_create_time_songandproducer_status_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordinaryuser',
+            name='token_version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def createFulltextIndex(apps, schema_editor):
+    # ngram 全文索引只有 MySQL 支持
+    if schema_editor.connection.vendor != 'mysql':
+        return
+
+    schema_editor.execute(
+        'ALTER TABLE musicplayer_songsearchdocument '
+        'ADD FULLTEXT INDEX song_search_fulltext (sname, aname, producer_name) WITH PARSER ngram'
+    )
+
+
+def dropFulltextIndex(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+
+    schema_editor.execute(
+        'ALTER TABLE musicplayer_songsearchdocument DROP INDEX song_search_fulltext'
+    )
+
+
+def buildSearchDocuments(apps, schema_editor):
+    Song = apps.get_model('musicplayer', 'Song')
+    SongSearchDocument = apps.get_model('musicplayer', 'SongSearchDocument')
+
+    song_rows = Song.objects.values_list('sid', 'sname', 'album__aname', 'producer__ordinaryuser__username')
+
+    SongSearchDocument.objects.bulk_create(
+        [
+            SongSearchDocument(
+                song_id=sid,
+                sname=sname or '',
+                aname=aname or '',
+                producer_name=producer_name or '',
+            )
+            for sid, sname, aname, producer_name in song_rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0003_ordinaryuser_token_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongSearchDocument',
+            fields=[
+                ('song', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='musicplayer.song')),
+                ('sname', models.CharField(default='', max_length=45)),
+                ('aname', models.CharField(default='', max_length=45)),
+                ('producer_name', models.CharField(default='', max_length=45)),
+                ('update_time', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+        migrations.RunPython(createFulltextIndex, dropFulltextIndex),
+        migrations.RunPython(buildSearchDocuments, migrations.RunPython.noop),
+    ]
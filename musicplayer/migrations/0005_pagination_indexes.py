@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0004_songsearchdocument'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='album',
+            index=models.Index(fields=['producer', 'create_time', 'aid'], name='album_producer_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['producer', 'create_time', 'sid'], name='song_producer_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='songandproducer',
+            index=models.Index(fields=['producer', 'create_time', 'id'], name='songproducer_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='songcomment',
+            index=models.Index(fields=['song', 'release_time', 'scid'], name='songcomment_page_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userfollowproducer',
+            index=models.Index(fields=['producer', 'follow_time', 'id'], name='followproducer_page_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0005_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='songandsonglist',
+            index=models.Index(fields=['songList', 'collect_time', 'id'], name='songandsonglist_page_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:34
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0006_songandsonglist_page_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('jid', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('target', models.CharField(max_length=30)),
+                ('target_id', models.CharField(max_length=36)),
+                ('oss_key', models.CharField(max_length=200)),
+                ('staged_path', models.CharField(max_length=500)),
+                ('status', models.CharField(default='p', max_length=1)),
+                ('bytes_total', models.BigIntegerField(default=0)),
+                ('bytes_uploaded', models.BigIntegerField(default=0)),
+                ('attempts', models.IntegerField(default=0)),
+                ('url', models.URLField(null=True)),
+                ('error', models.CharField(max_length=200, null=True)),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('update_time', models.DateTimeField(auto_now=True)),
+                ('ordinaryUser', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='musicplayer.ordinaryuser')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0007_uploadjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='chunk_size',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0008_uploadjob_chunk_size'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadjob',
+            name='staged_path',
+            field=models.CharField(default='', max_length=500),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0009_uploadjob_staged_path_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='album',
+            name='cover_thumb_url',
+            field=models.URLField(null=True),
+        ),
+        migrations.AddField(
+            model_name='community',
+            name='profile_picture_thumb_url',
+            field=models.URLField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ordinaryuser',
+            name='profile_picture_thumb_url',
+            field=models.URLField(null=True),
+        ),
+        migrations.AddField(
+            model_name='songlist',
+            name='cover_thumb_url',
+            field=models.URLField(null=True),
+        ),
+    ]
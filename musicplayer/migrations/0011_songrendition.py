@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:44
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0010_image_thumb_urls'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongRendition',
+            fields=[
+                ('rid', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('quality', models.CharField(max_length=10)),
+                ('codec', models.CharField(max_length=10)),
+                ('bitrate', models.IntegerField()),
+                ('url', models.URLField()),
+                ('bytes', models.BigIntegerField(default=0)),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicplayer.song')),
+            ],
+            options={
+                'unique_together': {('song', 'quality')},
+            },
+        ),
+    ]
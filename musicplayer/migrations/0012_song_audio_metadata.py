@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0011_songrendition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='bitrate',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='duration_ms',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='loudness_db',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='sample_rate',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='waveform_peaks',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0012_song_audio_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListeningEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('event_type', models.CharField(max_length=1)),
+                ('position_ms', models.IntegerField(null=True)),
+                ('event_time', models.DateTimeField()),
+                ('ordinaryUser', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='musicplayer.ordinaryuser')),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicplayer.song')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['song', 'event_time'], name='listeningevent_song_time_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SongPlayDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('play_count', models.IntegerField(default=0)),
+                ('skip_count', models.IntegerField(default=0)),
+                ('complete_count', models.IntegerField(default=0)),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicplayer.song')),
+            ],
+            options={
+                'unique_together': {('song', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SongPlayHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('play_count', models.IntegerField(default=0)),
+                ('skip_count', models.IntegerField(default=0)),
+                ('complete_count', models.IntegerField(default=0)),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicplayer.song')),
+            ],
+            options={
+                'unique_together': {('song', 'hour')},
+            },
+        ),
+    ]
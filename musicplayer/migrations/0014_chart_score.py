@@ -0,0 +1,27 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0013_listening_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChartScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chart', models.CharField(max_length=10)),
+                ('entity_id', models.UUIDField()),
+                ('day', models.DateField()),
+                ('score', models.IntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['chart', 'day', 'score'], name='chartscore_chart_day_idx')],
+                'unique_together': {('chart', 'entity_id', 'day')},
+            },
+        ),
+    ]
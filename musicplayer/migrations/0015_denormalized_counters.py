@@ -0,0 +1,56 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:55
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fillCounters(apps, schema_editor):
+    # 已有的数据按关系表计数一次，之后由视图增量维护
+    for counter_model_name, counter_field, relation_model_name, relation_field in (
+            ('Producer', 'follower_count', 'UserFollowProducer', 'producer'),
+            ('Song', 'comment_count', 'SongComment', 'song'),
+            ('Song', 'songlist_count', 'SongAndSongList', 'song'),
+            ('Community', 'member_count', 'UserFollowCommunity', 'community'),
+    ):
+        counter_model = apps.get_model('musicplayer', counter_model_name)
+        relation_model = apps.get_model('musicplayer', relation_model_name)
+
+        counter_model.objects.update(**{counter_field: Coalesce(Subquery(
+            relation_model.objects.filter(
+                **{relation_field: OuterRef('pk')}
+            ).order_by().values(relation_field).annotate(
+                count=Count('pk'),
+            ).values('count')
+        ), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0014_chart_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='community',
+            name='member_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='producer',
+            name='follower_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='comment_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='songlist_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fillCounters, migrations.RunPython.noop),
+    ]
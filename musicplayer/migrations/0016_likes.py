@@ -0,0 +1,81 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0015_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BlogCommentLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('like_time', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BlogLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('like_time', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SongCommentLike',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('like_time', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='songcomment',
+            index=models.Index(fields=['song', 'likes', 'scid'], name='songcomment_likes_idx'),
+        ),
+        migrations.AddField(
+            model_name='blogcommentlike',
+            name='blogComment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicplayer.blogcomment'),
+        ),
+        migrations.AddField(
+            model_name='blogcommentlike',
+            name='ordinaryUser',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicplayer.ordinaryuser'),
+        ),
+        migrations.AddField(
+            model_name='bloglike',
+            name='blog',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicplayer.blog'),
+        ),
+        migrations.AddField(
+            model_name='bloglike',
+            name='ordinaryUser',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicplayer.ordinaryuser'),
+        ),
+        migrations.AddField(
+            model_name='songcommentlike',
+            name='ordinaryUser',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicplayer.ordinaryuser'),
+        ),
+        migrations.AddField(
+            model_name='songcommentlike',
+            name='songComment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicplayer.songcomment'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='blogcommentlike',
+            unique_together={('blogComment', 'ordinaryUser')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='bloglike',
+            unique_together={('blog', 'ordinaryUser')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='songcommentlike',
+            unique_together={('songComment', 'ordinaryUser')},
+        ),
+    ]
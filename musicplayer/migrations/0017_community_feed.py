@@ -0,0 +1,43 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0016_likes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('create_time', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='blog',
+            index=models.Index(fields=['community', 'create_time', 'bid'], name='blog_community_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='feeditem',
+            name='blog',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicplayer.blog'),
+        ),
+        migrations.AddField(
+            model_name='feeditem',
+            name='ordinaryUser',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicplayer.ordinaryuser'),
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['ordinaryUser', 'create_time', 'blog'], name='feeditem_timeline_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='feeditem',
+            unique_together={('ordinaryUser', 'blog')},
+        ),
+    ]
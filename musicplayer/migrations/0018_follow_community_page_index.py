@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0017_community_feed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userfollowcommunity',
+            index=models.Index(fields=['ordinaryUser', 'follow_time', 'id'], name='followcommunity_user_page_idx'),
+        ),
+    ]
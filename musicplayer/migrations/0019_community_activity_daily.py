@@ -0,0 +1,70 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:00
+
+from collections import Counter
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def fillActivity(apps, schema_editor):
+    # 按已有的帖子、评论、关注汇总最近 7 天，之后由视图增量累加
+    CommunityActivityDaily = apps.get_model('musicplayer', 'CommunityActivityDaily')
+    start_day = timezone.localdate() - timedelta(days=6)
+
+    activity_counts = Counter()
+
+    for model_name, community_field, time_field, count_field in (
+            ('Blog', 'community', 'create_time', 'post_count'),
+            ('BlogComment', 'blog__community', 'release_time', 'comment_count'),
+            ('UserFollowCommunity', 'community', 'follow_time', 'new_member_count'),
+    ):
+        activity_rows = apps.get_model('musicplayer', model_name).objects.filter(
+            **{time_field + '__date__gte': start_day}
+        ).annotate(
+            day=TruncDate(time_field),
+        ).values(community_field, 'day').annotate(
+            count=Count('pk'),
+        ).values_list(community_field, 'day', 'count')
+
+        for community_cid, day, count in activity_rows:
+            activity_counts[(community_cid, day, count_field)] += count
+
+    activity_rows = {}
+
+    for (community_cid, day, count_field), count in activity_counts.items():
+        activity_row = activity_rows.setdefault(
+            (community_cid, day), CommunityActivityDaily(community_id=community_cid, day=day),
+        )
+        setattr(activity_row, count_field, count)
+
+    CommunityActivityDaily.objects.bulk_create(activity_rows.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0018_follow_community_page_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommunityActivityDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('post_count', models.IntegerField(default=0)),
+                ('comment_count', models.IntegerField(default=0)),
+                ('new_member_count', models.IntegerField(default=0)),
+                ('community', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='musicplayer.community')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='communityactivity_day_idx')],
+                'unique_together': {('community', 'day')},
+            },
+        ),
+        migrations.RunPython(fillActivity, migrations.RunPython.noop),
+    ]
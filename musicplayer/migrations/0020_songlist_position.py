@@ -0,0 +1,53 @@
+# Generated by Django 5.0.6 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+def fillPositions(apps, schema_editor):
+    # 已有的歌曲按收藏顺序排列，间隔与 utils.songListOrder.POSITION_GAP 相同
+    SongAndSongList = apps.get_model('musicplayer', 'SongAndSongList')
+    position_gap = 1 << 16
+
+    songlist_slid = None
+    position = 0
+    changed_rows = []
+
+    for record in SongAndSongList.objects.order_by('songList', 'collect_time', 'id').only('id', 'songList'):
+        if record.songList_id != songlist_slid:
+            songlist_slid = record.songList_id
+            position = 0
+
+        position += position_gap
+        record.position = position
+        changed_rows.append(record)
+
+    SongAndSongList.objects.bulk_update(changed_rows, ['position'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('musicplayer', '0019_community_activity_daily'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='songandsonglist',
+            name='songandsonglist_page_idx',
+        ),
+        migrations.AddField(
+            model_name='songandsonglist',
+            name='position',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fillPositions, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='songandsonglist',
+            name='collect_time',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AddIndex(
+            model_name='songandsonglist',
+            index=models.Index(fields=['songList', 'position', 'id'], name='songandsonglist_order_idx'),
+        ),
+    ]
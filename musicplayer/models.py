@@ -23,12 +23,15 @@ from django.db import models
 
 
     profile_picture_url - 用户头像图片的URL
+    profile_picture_thumb_url - 用户头像缩略图的URL，上传后由后台生成
     sex - 性别， 'm' = 男
     'f' = 女
     birthday - 生日
     region - 用户地区
     introduction - 用户简介
 
+    token_version - jwt令牌版本，修改密码后递增，使此前签发的令牌失效
+
     create_time - 用户注册时间
     update_time - 用户信息最后修改时间
 """
@@ -45,11 +48,14 @@ class OrdinaryUser(models.Model):
     phone = models.CharField(max_length=11, null=True)
 
     profile_picture_url = models.URLField(null=True)
+    profile_picture_thumb_url = models.URLField(null=True)
     gender = models.CharField(max_length=1, null=True)
     birthday = models.DateField(null=True)
     region = models.CharField(max_length=45, null=True)
     introduction = models.CharField(max_length=200, null=True)
 
+    token_version = models.IntegerField(default=0)
+
     create_time = models.DateTimeField(auto_now_add=True)
     update_time = models.DateTimeField(auto_now=True)
 
@@ -65,6 +71,7 @@ class OrdinaryUser(models.Model):
     例如：歌手、制作人、乐手
     title - 创作者的荣誉称号
     authentication - 认证信息，仿照b站up主的认证信息机制
+    follower_count - 粉丝数，关注、取消关注时在同一事务中增减
 
     create_time - 创作者入驻时间
     update_time - 创作者信息最后修改时间
@@ -78,6 +85,8 @@ class Producer(models.Model):
     title = models.CharField(max_length=90, null=True)
     authentication = models.CharField(max_length=90, null=True)
 
+    follower_count = models.IntegerField(default=0)
+
     create_time = models.DateTimeField(auto_now_add=True)
     update_time = models.DateTimeField(auto_now=True)
 
@@ -103,6 +112,17 @@ class Producer(models.Model):
     demo版等
     song_url - 歌曲音频资源地址
 
+    duration_ms - 时长，单位毫秒
+    sample_rate - 采样率，单位Hz
+    bitrate - 原始音频的码率，单位kbps
+    loudness_db - 响度，全曲的 RMS 电平，单位dBFS
+    waveform_peaks - 波形峰值，每个字节为一段的峰值（0~255，相对满幅），用于绘制进度条
+    以上由上传音频后的后台任务从音频中提取，提取前为空
+
+    comment_count - 评论数
+    songlist_count - 被收进歌单的次数
+    以上两个计数在评论、收藏的增删时于同一事务中增减，偏差由 reconcile_counters 命令修复
+
     language_type - 歌曲语种
     music_style   - 音乐风格
     metadata：     - 歌曲的元信息，以json字符串存储歌曲的作词作曲编曲混音母带等信息
@@ -123,6 +143,15 @@ class Song(models.Model):
     audio_url = models.URLField(null=True)
     lyrics_url = models.URLField(null=True)
 
+    duration_ms = models.IntegerField(null=True)
+    sample_rate = models.IntegerField(null=True)
+    bitrate = models.IntegerField(null=True)
+    loudness_db = models.FloatField(null=True)
+    waveform_peaks = models.BinaryField(null=True)
+
+    comment_count = models.IntegerField(default=0)
+    songlist_count = models.IntegerField(default=0)
+
     sname = models.CharField(max_length=45)
     stype = models.CharField(max_length=20, null=True)
     sversion = models.CharField(max_length=20, null=True)
@@ -135,6 +164,46 @@ class Song(models.Model):
     create_time = models.DateTimeField(auto_now_add=True)
     update_time = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # 创作者歌曲列表的分页排序
+            models.Index(fields=['producer', 'create_time', 'sid'], name='song_producer_page_idx'),
+        ]
+
+
+"""
+    表名：歌曲转码表
+    描述：记录歌曲音频转码后的各个规格
+    类型：实体
+    说明：上传音频后由后台转码生成，重新上传音频时整体替换；querySongById 按客户端的要求选择播放地址
+    字段：
+    rid - 主键
+    song_sid - 歌曲id
+    quality - 规格，low / medium / high 为单个文件，hls 为分段播放列表
+    codec - 编码，如 aac
+    bitrate - 码率，单位kbps
+    url - 播放地址，hls 为播放列表 index.m3u8 的地址
+    bytes - 文件总大小，hls 为播放列表和全部分段之和
+
+    create_time - 转码完成时间
+"""
+
+
+class SongRendition(models.Model):
+    rid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    song = models.ForeignKey('Song', on_delete=models.CASCADE)
+
+    quality = models.CharField(max_length=10)
+    codec = models.CharField(max_length=10)
+    bitrate = models.IntegerField()
+    url = models.URLField()
+    bytes = models.BigIntegerField(default=0)
+
+    create_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [['song', 'quality'], ]
+
 
 """
     表名：歌曲投稿信息表
@@ -165,6 +234,10 @@ class SongAndProducer(models.Model):
 
     class Meta:
         unique_together = [['producer', 'song'], ]
+        indexes = [
+            # 联合投稿列表的分页排序
+            models.Index(fields=['producer', 'create_time', 'id'], name='songproducer_page_idx'),
+        ]
 
 
 """
@@ -179,6 +252,7 @@ class SongAndProducer(models.Model):
     atype               - 专辑类型 ？？？
     aversion            - 专辑版本
     cover_picture_url   - 封面图片地址
+    cover_thumb_url     - 封面缩略图地址，上传后由后台生成
     release_date        - 专辑发布时间
     introduction        - 专辑简介
 
@@ -197,10 +271,17 @@ class Album(models.Model):
 
     introduction = models.CharField(max_length=200, null=True)
     cover_url = models.URLField(null=True)
+    cover_thumb_url = models.URLField(null=True)
 
     create_time = models.DateTimeField(auto_now_add=True)
     update_time = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # 创作者专辑列表的分页排序
+            models.Index(fields=['producer', 'create_time', 'aid'], name='album_producer_page_idx'),
+        ]
+
 
 """
     表名：歌单
@@ -213,6 +294,7 @@ class Album(models.Model):
 
     title               - 歌单标题
     cover_picture_url   - 封面歌单地址
+    cover_thumb_url     - 封面缩略图地址，上传后由后台生成
 
     create_time			- 歌曲创建时间
     update_time	- 歌曲信息最后修改时间
@@ -225,6 +307,7 @@ class SongList(models.Model):
 
     title = models.CharField(max_length=45)
     cover_picture_url = models.URLField(null=True)
+    cover_thumb_url = models.URLField(null=True)
 
     create_time = models.DateTimeField(auto_now_add=True)
     update_time = models.DateTimeField(auto_now=True)
@@ -239,16 +322,22 @@ class SongList(models.Model):
     song_list_slid      - 歌单id
     song_sid            - 歌曲id
     collect_time        - 用户将歌曲收集进歌单的时间
+    position            - 歌曲在歌单中的顺序，相邻歌曲之间留有间隔，移动歌曲时只修改被移动的行
 """
 
 
 class SongAndSongList(models.Model):
     songList = models.ForeignKey('SongList', on_delete=models.CASCADE)
     song = models.ForeignKey('Song', on_delete=models.CASCADE)
-    collect_time = models.DateTimeField(auto_now=True)
+    collect_time = models.DateTimeField(auto_now_add=True)
+    position = models.BigIntegerField(default=0)
 
     class Meta:
         unique_together = [['songList', 'song'], ]
+        indexes = [
+            # 歌单歌曲列表按用户排列的顺序分页
+            models.Index(fields=['songList', 'position', 'id'], name='songandsonglist_order_idx'),
+        ]
 
 
 """
@@ -276,6 +365,14 @@ class SongComment(models.Model):
     comment = models.CharField(max_length=400)
     release_time = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # 歌曲评论列表的分页排序
+            models.Index(fields=['song', 'release_time', 'scid'], name='songcomment_page_idx'),
+            # 歌曲热门评论按点赞数分页
+            models.Index(fields=['song', 'likes', 'scid'], name='songcomment_likes_idx'),
+        ]
+
 
 """
     表名：用户-创作者关注列表
@@ -296,6 +393,10 @@ class UserFollowProducer(models.Model):
 
     class Meta:
         unique_together = [['producer', 'ordinaryUser'], ]
+        indexes = [
+            # 粉丝列表的分页排序
+            models.Index(fields=['producer', 'follow_time', 'id'], name='followproducer_page_idx'),
+        ]
 
 
 """
@@ -326,8 +427,10 @@ class SongAndCommunity(models.Model):
     cid                 - 社群主键
     cname               - 社群名称
     profile_picture_url - 社群封面图片地址
+    profile_picture_thumb_url - 社群封面缩略图地址，上传后由后台生成
     music_type          - 社群的音乐主题
     introduction        - 社群简介
+    member_count        - 关注社群的人数，关注时在同一事务中增加
 """
 
 
@@ -335,9 +438,12 @@ class Community(models.Model):
     cid = models.UUIDField(primary_key=True, default=uuid.uuid4)
     cname = models.CharField(max_length=45)
     profile_picture_url = models.URLField(null=True)
+    profile_picture_thumb_url = models.URLField(null=True)
     music_type = models.CharField(max_length=60)
     introduction = models.CharField(max_length=200)
 
+    member_count = models.IntegerField(default=0)
+
     create_time = models.DateTimeField(auto_now_add=True)
     update_time = models.DateTimeField(auto_now=True)
 
@@ -362,6 +468,10 @@ class UserFollowCommunity(models.Model):
 
     class Meta:
         unique_together = [['ordinaryUser', 'community'], ]
+        indexes = [
+            # 用户关注的社群列表按关注时间分页
+            models.Index(fields=['ordinaryUser', 'follow_time', 'id'], name='followcommunity_user_page_idx'),
+        ]
 
 
 """
@@ -391,6 +501,12 @@ class Blog(models.Model):
     create_time = models.DateTimeField(auto_now_add=True)
     update_time = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # 读扩散的社群按发帖时间分页
+            models.Index(fields=['community', 'create_time', 'bid'], name='blog_community_time_idx'),
+        ]
+
 
 """
     帖子评论
@@ -419,3 +535,275 @@ class BlogComment(models.Model):
     comment = models.CharField(max_length=400, default='')
     release_time = models.DateTimeField(auto_now=True)
 
+
+"""
+    表名：社群每日活跃统计表
+    描述：每个社群每天的发帖数、帖子评论数和新增关注人数
+    类型：统计
+    说明：发帖、评论、关注时在同一事务中用 F() 累加，多个请求同时更新时计数不会丢失；
+    热门社群排行读取最近几天的汇总，不扫描帖子、评论和关注表。天按 settings.TIME_ZONE 的日期划分
+    字段：
+    community_cid       - 社群id
+    day                 - 日期
+    post_count          - 发帖数
+    comment_count       - 帖子评论数
+    new_member_count    - 新增关注人数
+"""
+
+
+class CommunityActivityDaily(models.Model):
+    community = models.ForeignKey('Community', on_delete=models.CASCADE)
+    day = models.DateField()
+
+    post_count = models.IntegerField(default=0)
+    comment_count = models.IntegerField(default=0)
+    new_member_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [['community', 'day'], ]
+        indexes = [
+            # 按最近几天汇总所有社群
+            models.Index(fields=['day'], name='communityactivity_day_idx'),
+        ]
+
+
+"""
+    表名：社群动态时间线表
+    描述：每个用户关注的社群中的帖子，按发帖时间排列，读取动态时不再合并所有关注的社群
+    类型：关系（冗余）
+    说明：关注人数少于 settings.FEED_FANOUT_MAX_MEMBERS 的社群发帖时写入每个关注者的时间线（写扩散）；
+    更大的社群不写入，读取时直接查询帖子表（读扩散）。每个用户的时间线由 trim_feeds 命令截断到
+    settings.FEED_TIMELINE_MAX 条
+    字段：
+    ordinary_user_uid   - 时间线所属的用户
+    blog_bid            - 帖子id
+    create_time         - 帖子的发帖时间，冗余用于排序
+"""
+
+
+class FeedItem(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    ordinaryUser = models.ForeignKey('OrdinaryUser', on_delete=models.CASCADE)
+    blog = models.ForeignKey('Blog', on_delete=models.CASCADE)
+    create_time = models.DateTimeField()
+
+    class Meta:
+        unique_together = [['ordinaryUser', 'blog'], ]
+        indexes = [
+            # 时间线的分页排序
+            models.Index(fields=['ordinaryUser', 'create_time', 'blog'], name='feeditem_timeline_idx'),
+        ]
+
+
+"""
+    表名：歌曲评论点赞表 / 帖子点赞表 / 帖子评论点赞表
+    描述：用户对评论、帖子的点赞记录，每个用户对同一目标只能点赞一次
+    类型：关系
+    说明：点赞记录是点赞数的准确来源。被点赞表中的 likes 由 utils.likes 在进程内合并增量后定期累加，
+    不在点赞请求中更新，热门评论的点赞不会集中在同一行的行锁上；进程被强制结束时丢失的增量在停止所有服务进程后由 reconcile_counters --include-likes 修复
+    字段：
+    ordinary_user_uid   - 点赞的用户
+    song_comment_scid / blog_bid / blog_comment_bcid - 被点赞的评论或帖子
+    like_time           - 点赞时间
+"""
+
+
+class SongCommentLike(models.Model):
+    ordinaryUser = models.ForeignKey('OrdinaryUser', on_delete=models.CASCADE)
+    songComment = models.ForeignKey('SongComment', on_delete=models.CASCADE)
+    like_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [['songComment', 'ordinaryUser'], ]
+
+
+class BlogLike(models.Model):
+    ordinaryUser = models.ForeignKey('OrdinaryUser', on_delete=models.CASCADE)
+    blog = models.ForeignKey('Blog', on_delete=models.CASCADE)
+    like_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [['blog', 'ordinaryUser'], ]
+
+
+class BlogCommentLike(models.Model):
+    ordinaryUser = models.ForeignKey('OrdinaryUser', on_delete=models.CASCADE)
+    blogComment = models.ForeignKey('BlogComment', on_delete=models.CASCADE)
+    like_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [['blogComment', 'ordinaryUser'], ]
+
+
+
+"""
+    表名：歌曲搜索文档表
+    描述：歌曲搜索使用的冗余文档，合并了歌曲名、专辑名和创作者名
+    类型：实体（冗余）
+    说明：由 utils.songSearch 在歌曲、专辑、创作者信息修改时增量维护，
+    MySQL 中在三个文本字段上建有 ngram 分词的全文索引
+    字段：
+    song_sid            - 歌曲id
+    sname               - 歌曲名称
+    aname               - 专辑名称
+    producer_name       - 创作者名称
+    update_time         - 文档最后更新时间，进程内索引据此增量同步
+"""
+
+
+class SongSearchDocument(models.Model):
+    song = models.OneToOneField('Song', on_delete=models.CASCADE, primary_key=True)
+
+    sname = models.CharField(max_length=45, default='')
+    aname = models.CharField(max_length=45, default='')
+    producer_name = models.CharField(max_length=45, default='')
+
+    update_time = models.DateTimeField(auto_now=True, db_index=True)
+
+
+"""
+    表名：上传任务表
+    描述：记录异步上传到对象存储的文件
+    类型：实体
+    说明：上传接口把文件暂存到本地后立即返回任务id，由 utils.uploadPipeline 的后台线程上传，
+    上传成功后把文件地址写回 target 对应的行
+    字段：
+    jid                 - 任务id
+    ordinary_user_uid   - 发起上传的用户，查询任务状态时校验
+    target              - 上传结果写回的位置，如 song_audio、album_cover，见 utils.uploadPipeline.UPLOAD_TARGETS
+    target_id           - 写回的行的主键
+    oss_key             - 对象存储中的路径
+    staged_path         - 本地暂存文件的路径，上传成功后删除；客户端直传时为空
+    status              - 任务状态，c=接收分片中(chunks)、d=等待客户端直传(direct)、p=等待(pending)、u=上传中(uploading)、s=成功(success)、f=失败(failed)
+    bytes_total         - 文件大小
+    chunk_size          - 浏览器分片上传时每个分片的大小，普通上传为0
+    bytes_uploaded      - 已上传的字节数
+    attempts            - 已尝试的次数
+    url                 - 上传成功后的文件地址
+    error               - 最后一次失败的原因
+
+    create_time         - 任务创建时间
+    update_time         - 任务状态最后修改时间
+"""
+
+
+class UploadJob(models.Model):
+    jid = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    ordinaryUser = models.ForeignKey('OrdinaryUser', on_delete=models.SET_NULL, null=True)
+
+    target = models.CharField(max_length=30)
+    target_id = models.CharField(max_length=36)
+
+    oss_key = models.CharField(max_length=200)
+    staged_path = models.CharField(max_length=500, default='')
+
+    status = models.CharField(max_length=1, default='p')
+    bytes_total = models.BigIntegerField(default=0)
+    bytes_uploaded = models.BigIntegerField(default=0)
+    chunk_size = models.IntegerField(default=0)
+    attempts = models.IntegerField(default=0)
+
+    url = models.URLField(null=True)
+    error = models.CharField(max_length=200, null=True)
+
+    create_time = models.DateTimeField(auto_now_add=True)
+    update_time = models.DateTimeField(auto_now=True)
+
+
+"""
+    表名：收听事件表
+    描述：记录用户播放、跳过、听完歌曲的事件
+    类型：流水
+    说明：事件先缓存在进程内，由 utils.listeningEvents 按批 bulk_create 写入，同时累加到小时、天汇总表；
+    排行、推荐等统计读取汇总表，不扫描本表
+    字段：
+    id                  - 主键
+    song_sid            - 歌曲id
+    ordinary_user_uid   - 收听的用户
+    event_type          - 事件类型，p=开始播放(play)、s=跳过(skip)、c=听完(complete)
+    position_ms         - 事件发生时的播放进度，单位毫秒
+    event_time          - 服务端收到事件的时间
+"""
+
+
+class ListeningEvent(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    song = models.ForeignKey('Song', on_delete=models.CASCADE)
+    ordinaryUser = models.ForeignKey('OrdinaryUser', on_delete=models.SET_NULL, null=True)
+
+    event_type = models.CharField(max_length=1)
+    position_ms = models.IntegerField(null=True)
+    event_time = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # 按时间重新汇总某首歌曲的事件
+            models.Index(fields=['song', 'event_time'], name='listeningevent_song_time_idx'),
+        ]
+
+
+"""
+    表名：歌曲小时收听统计表 / 歌曲每日收听统计表
+    描述：按小时、按天汇总的每首歌曲的收听次数
+    类型：统计
+    说明：收听事件写入时按批增量累加，不重新扫描事件表；天按 settings.TIME_ZONE 的日期划分
+    字段：
+    song_sid        - 歌曲id
+    hour / day      - 统计的小时（整点）/ 日期
+    play_count      - 开始播放次数
+    skip_count      - 跳过次数
+    complete_count  - 听完次数
+"""
+
+
+class SongPlayHourly(models.Model):
+    song = models.ForeignKey('Song', on_delete=models.CASCADE)
+    hour = models.DateTimeField()
+
+    play_count = models.IntegerField(default=0)
+    skip_count = models.IntegerField(default=0)
+    complete_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [['song', 'hour'], ]
+
+
+class SongPlayDaily(models.Model):
+    song = models.ForeignKey('Song', on_delete=models.CASCADE)
+    day = models.DateField()
+
+    play_count = models.IntegerField(default=0)
+    skip_count = models.IntegerField(default=0)
+    complete_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [['song', 'day'], ]
+
+
+"""
+    表名：排行榜得分表
+    描述：每个实体每天在排行榜上的得分
+    类型：统计
+    说明：收听、收藏、评论、关注发生时由 utils.charts 按权重增量累加，日榜、周榜为窗口内各天得分之和；
+    源数据被删除（如取消关注）时不扣分，由 recompute_charts 命令按源表重新计算窗口内的得分来纠正
+    字段：
+    chart       - 排行榜类型，song / producer / community
+    entity_id   - 歌曲、创作者或社群的id
+    day         - 日期，按 settings.TIME_ZONE 划分
+    score       - 当天的得分
+"""
+
+
+class ChartScore(models.Model):
+    chart = models.CharField(max_length=10)
+    entity_id = models.UUIDField()
+    day = models.DateField()
+
+    score = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [['chart', 'entity_id', 'day'], ]
+        indexes = [
+            # 缓存失效时按窗口取得分最高的实体
+            models.Index(fields=['chart', 'day', 'score'], name='chartscore_chart_day_idx'),
+        ]
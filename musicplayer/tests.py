@@ -1,3 +1,1716 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import math
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import uuid
+import wave
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import FileResponse
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from backend.mysqlpool.pool import ConnectionPool, PoolTimeout
+from utils.oss2Utils import OSS2Utils, ReloadableCredentialsProvider
+from musicplayer import models
+from utils.modelOperation import generateJwtToken
+from utils.result import Result
+from utils import (
+    audioMetadata, audioStream, audioTranscode, batchOperation, imagePipeline, listeningEvents, modelOperation,
+    pagination, songListOrder, songSearch, uploadPipeline,
+)
+
 
 # Create your tests here.
+
+def makeWav(seconds=1, frame_rate=8000) -> bytes:
+    """
+    :return: 半幅 440Hz 正弦波的单声道 16 位 wav
+    """
+    wav_buffer = io.BytesIO()
+
+    with wave.open(wav_buffer, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(frame_rate)
+        wav_file.writeframes(b''.join(
+            struct.pack('<h', round(16384 * math.sin(2 * math.pi * 440 * i / frame_rate)))
+            for i in range(seconds * frame_rate)
+        ))
+
+    return wav_buffer.getvalue()
+
+
+@override_settings(JWT_USER_CACHE_ENABLED=False)
+class EndpointQueryCountTest(TestCase):
+    """
+    接口查询次数测试：每个接口的查询次数有固定上限，不随返回的行数增长，
+    出现 N+1 查询时测试失败
+    """
+
+    ROW_COUNT = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producer = models.Producer.objects.create(ptype='singer')
+        cls.user = models.OrdinaryUser.objects.create(
+            username='producer', password='password1', email='producer@example.com', producer=cls.producer,
+        )
+        cls.encode_jwt = generateJwtToken(cls.user)
+
+        cls.album = models.Album.objects.create(producer=cls.producer, aname='album')
+        cls.song = models.Song.objects.create(producer=cls.producer, album=cls.album, sname='song')
+
+        for i in range(cls.ROW_COUNT):
+            fan = models.OrdinaryUser.objects.create(
+                username='fan{}'.format(i), password='password1', email='fan{}@example.com'.format(i),
+            )
+            models.UserFollowProducer.objects.create(producer=cls.producer, ordinaryUser=fan)
+            models.SongComment.objects.create(song=cls.song, ordinaryUser=fan, comment='comment{}'.format(i))
+
+            # 其他创作者发起的联合投稿
+            other_producer = models.Producer.objects.create()
+            models.OrdinaryUser.objects.create(
+                username='other{}'.format(i), password='password1', email='other{}@example.com'.format(i),
+                producer=other_producer,
+            )
+            other_song = models.Song.objects.create(producer=other_producer, album=cls.album, sname='s{}'.format(i))
+            models.SongAndProducer.objects.create(producer=cls.producer, song=other_song, status='p')
+
+        cls.songlist = models.SongList.objects.create(ordinaryUser=cls.user, title='songlist')
+        for other_song in models.Song.objects.exclude(sid=cls.song.sid):
+            models.SongAndSongList.objects.create(songList=cls.songlist, song=other_song)
+
+        for i in range(cls.ROW_COUNT):
+            community = models.Community.objects.create(cname='c{}'.format(i), music_type='rock', introduction='')
+            models.UserFollowCommunity.objects.create(ordinaryUser=cls.user, community=community)
+
+    def setUp(self):
+        # 接口的查询次数按未命中缓存计算
+        caches['entity'].clear()
+
+    def assertMaxQueries(self, max_queries, url, params, row_count=None, list_key='list'):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+
+        result = response.json()
+        self.assertEqual(result['code'], 200, result)
+
+        if row_count is not None:
+            self.assertEqual(len(result['obj'][list_key]), row_count)
+
+        self.assertLessEqual(
+            len(context), max_queries,
+            '{} issued {} queries:\n{}'.format(
+                url, len(context), '\n'.join(query['sql'] for query in context.captured_queries)
+            ),
+        )
+
+    def test_query_song_by_id(self):
+        # 歌曲信息一条查询，转码规格一条查询
+        self.assertMaxQueries(2, '/api/querySongById/', {'song_sid': self.song.sid})
+
+    def test_query_song_comment(self):
+        self.assertMaxQueries(2, '/api/querySongComment/', {'song_sid': self.song.sid}, self.ROW_COUNT)
+
+    def test_query_top_song_comment(self):
+        self.assertMaxQueries(
+            2, '/api/querySongComment/', {'song_sid': self.song.sid, 'order': 'likes'}, self.ROW_COUNT,
+        )
+
+    def test_query_fans_of_producer(self):
+        self.assertMaxQueries(2, '/api/queryFansOfProducer/', {'encode_jwt': self.encode_jwt}, self.ROW_COUNT)
+
+    def test_query_song_collaboration(self):
+        self.assertMaxQueries(2, '/api/querySongCollaboration/', {'encode_jwt': self.encode_jwt}, self.ROW_COUNT)
+
+    def test_get_user_all_community(self):
+        self.assertMaxQueries(
+            2, '/api/getUserAllCommunity/', {'encode_jwt': self.encode_jwt}, self.ROW_COUNT, list_key='all_community',
+        )
+
+    def test_query_song_list(self):
+        self.assertMaxQueries(
+            2, '/api/querySongList/', {'songlist_slid': self.songlist.slid}, self.ROW_COUNT, list_key='song_list',
+        )
+
+
+@override_settings(JWT_USER_CACHE_ENABLED=False)
+class EntityCacheTest(TestCase):
+    """
+    实体缓存测试：重复读取命中缓存不再查询数据库，写接口修改后读到新数据
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producer = models.Producer.objects.create(ptype='singer')
+        cls.user = models.OrdinaryUser.objects.create(
+            username='producer', password='password1', email='producer@example.com', producer=cls.producer,
+        )
+        cls.encode_jwt = generateJwtToken(cls.user)
+
+        cls.album = models.Album.objects.create(producer=cls.producer, aname='album')
+        cls.song = models.Song.objects.create(producer=cls.producer, album=cls.album, sname='song')
+
+        cls.songlist = models.SongList.objects.create(ordinaryUser=cls.user, title='songlist')
+
+    def setUp(self):
+        caches['entity'].clear()
+
+    def querySong(self):
+        return self.client.get('/api/querySongById/', {'song_sid': self.song.sid}).json()['obj']
+
+    def test_song_cache_hit(self):
+        self.querySong()
+
+        with CaptureQueriesContext(connection) as context:
+            self.querySong()
+
+        self.assertEqual(len(context), 0)
+
+    def test_modify_song_invalidates(self):
+        self.assertEqual(self.querySong()['sname'], 'song')
+
+        self.client.post('/api/modifySong/', {'encode_jwt': self.encode_jwt, 'song_id': self.song.sid, 'song_name': 'new'})
+
+        self.assertEqual(self.querySong()['sname'], 'new')
+
+    def test_edit_user_info_invalidates_songs(self):
+        self.assertEqual(self.querySong()['producer']['name'], 'producer')
+
+        self.client.post('/api/editUserInfo/', {'encode_jwt': self.encode_jwt, 'username': 'renamed'})
+
+        self.assertEqual(self.querySong()['producer']['name'], 'renamed')
+
+    def test_add_song_invalidates_song_list(self):
+        params = {'songlist_slid': self.songlist.slid}
+        self.assertEqual(len(self.client.get('/api/querySongList/', params).json()['obj']['song_list']), 0)
+
+        self.client.post('/api/addSongToSongList/', {
+            'encode_jwt': self.encode_jwt, 'songlist_slid': self.songlist.slid, 'song_sid': self.song.sid,
+        })
+
+        self.assertEqual(len(self.client.get('/api/querySongList/', params).json()['obj']['song_list']), 1)
+
+
+@override_settings(JWT_USER_CACHE_ENABLED=False)
+class JwtAuthTest(TestCase):
+    """
+    jwt 鉴权测试：令牌可以放在 Authorization 请求头、POST 表单或 GET 参数中，
+    缺少、过期、被吊销的令牌返回固定的错误码和信息
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producer = models.Producer.objects.create(ptype='singer')
+        cls.producer_user = models.OrdinaryUser.objects.create(
+            username='producer', password='password1', email='producer@example.com', producer=cls.producer,
+        )
+        cls.user = models.OrdinaryUser.objects.create(
+            username='fan', password='password1', email='fan@example.com',
+        )
+        cls.encode_jwt = generateJwtToken(cls.user)
+
+    def setUp(self):
+        caches['entity'].clear()
+
+    def queryUser(self, params=None, **headers):
+        return self.client.get('/api/queryUser/', params or {}, headers=headers).json()
+
+    def assertFailure(self, result, code, message):
+        self.assertEqual((result['code'], result['message']), (code, message))
+
+    def test_token_sources(self):
+        self.assertEqual(self.queryUser({'encode_jwt': self.encode_jwt})['obj']['username'], 'fan')
+        self.assertEqual(
+            self.queryUser(authorization='Bearer {}'.format(self.encode_jwt))['obj']['username'], 'fan',
+        )
+        # 请求头优先于参数
+        self.assertEqual(
+            self.queryUser({'encode_jwt': 'garbage'}, authorization='Bearer {}'.format(self.encode_jwt))['code'], 200,
+        )
+
+    def test_post_reads_form_not_query_string(self):
+        result = self.client.post('/api/editUserInfo/', {'encode_jwt': self.encode_jwt, 'region': 'a'}).json()
+        self.assertEqual(result['code'], 200)
+
+        result = self.client.post(
+            '/api/editUserInfo/?encode_jwt={}'.format(self.encode_jwt), {'region': 'b'},
+        ).json()
+        self.assertFailure(result, Result.HTTP_STATUS_UNAUTHORIZED, 'no jwt token')
+
+        result = self.client.post(
+            '/api/editUserInfo/', {'region': 'c'}, headers={'authorization': 'Bearer {}'.format(self.encode_jwt)},
+        ).json()
+        self.assertEqual(result['code'], 200)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.region, 'c')
+
+    def test_invalid_tokens(self):
+        self.assertFailure(self.queryUser(), Result.HTTP_STATUS_UNAUTHORIZED, 'no jwt token')
+        self.assertFailure(self.queryUser({'encode_jwt': ''}), Result.HTTP_STATUS_UNAUTHORIZED, 'no jwt token')
+        self.assertFailure(
+            self.queryUser({'encode_jwt': 'garbage'}), Result.HTTP_STATUS_NOT_ACCEPTABLE, 'invalid jwt token',
+        )
+        self.assertFailure(
+            self.queryUser({'encode_jwt': generateJwtToken(self.user, hours=-1)}),
+            Result.HTTP_STATUS_NOT_ACCEPTABLE, 'invalid jwt token',
+        )
+
+    def test_revoked_token(self):
+        models.OrdinaryUser.objects.filter(uid=self.user.uid).update(token_version=1)
+
+        for cache_enabled in (False, True):
+            with self.settings(JWT_USER_CACHE_ENABLED=cache_enabled):
+                self.assertFailure(
+                    self.queryUser({'encode_jwt': self.encode_jwt}), Result.HTTP_STATUS_NOT_ACCEPTABLE,
+                    'invalid jwt token',
+                )
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.queryUser({'encode_jwt': generateJwtToken(self.user)})['code'], 200)
+
+    def test_producer_required(self):
+        self.assertFailure(
+            self.client.get('/api/queryFansOfProducer/', {'encode_jwt': self.encode_jwt}).json(),
+            Result.HTTP_STATUS_UNAUTHORIZED, 'producer authority required',
+        )
+        self.assertFailure(
+            self.client.get('/api/queryFansOfProducer/').json(), Result.HTTP_STATUS_UNAUTHORIZED, 'no jwt token',
+        )
+
+        producer_jwt = generateJwtToken(self.producer_user)
+        result = self.client.get(
+            '/api/queryFansOfProducer/', headers={'authorization': 'Bearer {}'.format(producer_jwt)},
+        ).json()
+        self.assertEqual(result['code'], 200, result)
+
+
+class JwtUserCacheTest(TestCase):
+    """
+    鉴权用户缓存测试：其他进程修改密码后旧令牌立即失效，缓存中的旧副本不会覆盖数据库中较新的字段
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = models.OrdinaryUser.objects.create(
+            username='fan', password='password1', email='fan@example.com',
+        )
+        cls.encode_jwt = generateJwtToken(cls.user)
+
+    def setUp(self):
+        caches['entity'].clear()
+        modelOperation._getJwtUserCache().clear()
+
+    def editUserInfo(self, **params):
+        return self.client.post('/api/editUserInfo/', dict(params, encode_jwt=self.encode_jwt)).json()
+
+    def changeInOtherProcess(self, **fields):
+        # 其他 worker 进程修改用户后只能更换共享缓存中的代数，本进程缓存中的副本仍是旧的
+        models.OrdinaryUser.objects.filter(uid=self.user.uid).update(**fields)
+        caches['entity'].set(
+            modelOperation._userGenerationKey(self.user.uid), 1, version=settings.ENTITY_CACHE_VERSION,
+        )
+
+    def test_revoked_token_rejected(self):
+        self.assertEqual(self.editUserInfo(region='a')['code'], 200)
+
+        self.changeInOtherProcess(password='password2', token_version=1)
+
+        self.assertEqual(self.editUserInfo(region='b')['code'], Result.HTTP_STATUS_NOT_ACCEPTABLE)
+
+    def test_edit_keeps_other_fields(self):
+        self.assertEqual(self.editUserInfo(region='a')['code'], 200)
+
+        self.user.refresh_from_db()
+        update_time = self.user.update_time
+
+        # 不更换代数，模拟副本在本进程缓存中尚未过期
+        models.OrdinaryUser.objects.filter(uid=self.user.uid).update(profile_picture_url='https://example.com/a.png')
+
+        self.assertEqual(self.editUserInfo(region='b')['code'], 200)
+
+        self.user.refresh_from_db()
+        self.assertEqual(
+            (self.user.region, self.user.profile_picture_url, self.user.token_version),
+            ('b', 'https://example.com/a.png', 0),
+        )
+        self.assertGreater(self.user.update_time, update_time)
+
+    def test_apply_producer_twice(self):
+        self.assertEqual(self.editUserInfo(region='a')['code'], 200)
+
+        producer = models.Producer.objects.create(ptype='singer')
+        models.OrdinaryUser.objects.filter(uid=self.user.uid).update(producer=producer)
+
+        result = self.client.post('/api/applyProducer/', {'encode_jwt': self.encode_jwt, 'ptype': 'singer'}).json()
+
+        self.assertEqual(result['code'], Result.HTTP_STATUS_CONFLICT)
+        self.assertEqual(models.Producer.objects.count(), 1)
+
+
+@override_settings(JWT_USER_CACHE_ENABLED=False)
+class KeysetPaginationTest(TestCase):
+    """
+    键集分页测试：逐页遍历不重复、不遗漏，排序键相同时由最后一个唯一字段决定顺序，
+    非法游标返回 400，limit 不超过 MAX_PAGE_LIMIT
+    """
+
+    FAN_COUNT = pagination.MAX_PAGE_LIMIT + 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producer = models.Producer.objects.create(ptype='singer')
+        cls.user = models.OrdinaryUser.objects.create(
+            username='producer', password='password1', email='producer@example.com', producer=cls.producer,
+        )
+        cls.encode_jwt = generateJwtToken(cls.user)
+
+        fans = models.OrdinaryUser.objects.bulk_create([
+            models.OrdinaryUser(username='fan{}'.format(i), password='password1', email='fan{}@example.com'.format(i))
+            for i in range(cls.FAN_COUNT)
+        ])
+        models.UserFollowProducer.objects.bulk_create([
+            models.UserFollowProducer(producer=cls.producer, ordinaryUser=fan) for fan in fans
+        ])
+
+        # 每 3 个粉丝的关注时间相同，翻页时需要靠 id 区分
+        base_time = timezone.now().replace(microsecond=0)
+        follow_id_list = models.UserFollowProducer.objects.filter(
+            producer=cls.producer,
+        ).order_by('id').values_list('id', flat=True)
+        for index, follow_id in enumerate(follow_id_list):
+            models.UserFollowProducer.objects.filter(id=follow_id).update(
+                follow_time=base_time - timedelta(minutes=index // 3),
+            )
+
+        cls.expected_uids = [str(uid) for uid in models.UserFollowProducer.objects.filter(
+            producer=cls.producer,
+        ).order_by('-follow_time', '-id').values_list('ordinaryUser_id', flat=True)]
+
+    def queryFans(self, **params):
+        return self.client.get('/api/queryFansOfProducer/', {'encode_jwt': self.encode_jwt, **params}).json()
+
+    def test_walk_pages(self):
+        uids = []
+        cursor = None
+        pages = 0
+
+        while True:
+            params = {'limit': 4}
+            if cursor:
+                params['cursor'] = cursor
+
+            result = self.queryFans(**params)
+            self.assertEqual(result['code'], 200, result)
+            uids.extend(fan['user']['uid'] for fan in result['obj']['list'])
+            pages += 1
+
+            cursor = result['obj']['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(pages, math.ceil(self.FAN_COUNT / 4))
+        self.assertEqual(len(set(uids)), self.FAN_COUNT)
+        self.assertEqual(uids, self.expected_uids)
+
+    def test_ties_broken_by_id(self):
+        # 第一页在关注时间相同的一组中间截断，下一页从同一组剩下的记录继续
+        first_page = self.queryFans(limit=2)['obj']
+        second_page = self.queryFans(limit=2, cursor=first_page['next_cursor'])['obj']
+
+        self.assertEqual(
+            [fan['user']['uid'] for fan in first_page['list'] + second_page['list']], self.expected_uids[:4],
+        )
+        self.assertEqual(first_page['list'][1]['follow_time'], second_page['list'][0]['follow_time'])
+
+    def test_invalid_cursor(self):
+        follow = models.UserFollowProducer.objects.filter(producer=self.producer).first()
+
+        for cursor in (
+                'not base64 !',
+                pagination.encodeCursor({'follow_time': 1}),
+                pagination.encodeCursor([follow.follow_time]),
+                pagination.encodeCursor([follow.follow_time, follow.id, 1]),
+                pagination.encodeCursor(['not a time', follow.id]),
+        ):
+            result = self.queryFans(cursor=cursor)
+            self.assertEqual((result['code'], result['message']), (Result.HTTP_STATUS_BAD_REQUEST, 'invalid cursor'))
+
+    def test_limit_clamped(self):
+        result = self.queryFans(limit=pagination.MAX_PAGE_LIMIT * 10)['obj']
+        self.assertEqual(len(result['list']), pagination.MAX_PAGE_LIMIT)
+        self.assertIsNotNone(result['next_cursor'])
+
+        self.assertEqual(len(self.queryFans(limit=0)['obj']['list']), 1)
+        self.assertEqual(len(self.queryFans(limit='abc')['obj']['list']), pagination.DEFAULT_PAGE_LIMIT)
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """
+    连接池测试：连接被复用，超过回收时间或健康检查失败的连接被关闭
+    """
+
+    class Connection(object):
+        def __init__(self):
+            self.closed = False
+
+        def close(self):
+            self.closed = True
+
+    def test_reuse(self):
+        pool = ConnectionPool(size=2)
+
+        for _ in range(5):
+            pool.checkin(pool.checkout(self.Connection))
+
+        stats = pool.stats()
+        self.assertEqual(stats['checkouts'], 5)
+        self.assertEqual(stats['opened'], 1)
+        self.assertEqual(stats['idle'], 1)
+
+    def test_recycle_and_ping(self):
+        pool = ConnectionPool(size=1, recycle=0)
+        pooled = pool.checkout(self.Connection)
+        pool.checkin(pooled)
+        self.assertTrue(pooled.connection.closed)
+
+        def ping(connection):
+            raise OSError('server has gone away')
+
+        pool = ConnectionPool(size=1, ping_interval=-1, ping=ping)
+        pool.checkin(pool.checkout(self.Connection))
+        pool.checkin(pool.checkout(self.Connection))
+        self.assertEqual(pool.stats()['ping_failures'], 1)
+        self.assertEqual(pool.stats()['opened'], 2)
+
+    def test_wait_timeout(self):
+        pool = ConnectionPool(size=1, timeout=0.01)
+        pool.checkout(self.Connection)
+
+        with self.assertRaises(PoolTimeout):
+            pool.checkout(self.Connection)
+
+        self.assertEqual(pool.stats()['wait_timeouts'], 1)
+        self.assertEqual(pool.stats()['in_use'], 1)
+
+
+class UploadPipelineTest(TestCase):
+    """
+    上传流水线测试：使用本地存储替身同步执行，上传完成后地址写回目标行，任务状态可查询
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producer = models.Producer.objects.create(ptype='singer')
+        cls.user = models.OrdinaryUser.objects.create(
+            username='producer', password='password1', email='producer@example.com', producer=cls.producer,
+        )
+        cls.encode_jwt = generateJwtToken(cls.user)
+
+        cls.album = models.Album.objects.create(producer=cls.producer, aname='album')
+        cls.song = models.Song.objects.create(producer=cls.producer, album=cls.album, sname='song')
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+
+        self.staging_dir = os.path.join(temp_dir.name, 'staging')
+
+        settings_override = override_settings(
+            UPLOAD_STORAGE_BACKEND='local',
+            UPLOAD_WORKERS=0,
+            UPLOAD_STAGING_DIR=self.staging_dir,
+            UPLOAD_LOCAL_ROOT=os.path.join(temp_dir.name, 'media'),
+            UPLOAD_LOCAL_URL='http://testserver/media/',
+            CHUNKED_UPLOAD_CHUNK_SIZE=400,
+            TRANSCODE_WORKERS=0,
+            JWT_USER_CACHE_ENABLED=False,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, url, file_field, filename, content=b'0' * 1000, **params):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, dict(
+                params,
+                encode_jwt=self.encode_jwt,
+                **{file_field: SimpleUploadedFile(filename, content)}
+            ))
+
+        result = response.json()
+        self.assertEqual(result['code'], 200, result)
+        return result['obj']['upload_job_id']
+
+    def test_upload_song_audio(self):
+        upload_job_id = self.upload('/api/uploadSongAudio/', 'audio_file', 'song.mp3', song_id=self.song.sid)
+
+        job_info = self.client.get('/api/queryUploadJob/', {
+            'encode_jwt': self.encode_jwt, 'upload_job_id': upload_job_id,
+        }).json()['obj']
+
+        self.assertEqual(job_info['status'], 's')
+        self.assertEqual(job_info['progress'], 1)
+
+        self.song.refresh_from_db()
+        self.assertEqual(self.song.audio_url, job_info['url'])
+        # 上传成功后删除暂存文件
+        self.assertEqual(os.listdir(self.staging_dir), [])
+
+    @unittest.skipUnless(shutil.which(settings.FFMPEG_BINARY), 'ffmpeg is not installed')
+    def test_upload_song_audio_renditions(self):
+        self.upload('/api/uploadSongAudio/', 'audio_file', 'song.wav', content=makeWav(), song_id=self.song.sid)
+
+        rendition_dict = {
+            rendition.quality: rendition for rendition in models.SongRendition.objects.filter(song=self.song)
+        }
+        self.assertEqual(set(rendition_dict), set(audioTranscode.AUDIO_RENDITIONS) | {audioTranscode.HLS_RENDITION})
+        self.assertTrue(rendition_dict[audioTranscode.HLS_RENDITION].url.endswith('_hls/index.m3u8'))
+
+        for rendition in rendition_dict.values():
+            self.assertTrue(os.path.exists(os.path.join(
+                settings.UPLOAD_LOCAL_ROOT, *rendition.url[len(settings.UPLOAD_LOCAL_URL):].split('/')
+            )))
+
+        self.assertEqual(os.listdir(self.staging_dir), [])
+
+    def test_upload_song_audio_metadata(self):
+        self.upload('/api/uploadSongAudio/', 'audio_file', 'song.wav', content=makeWav(), song_id=self.song.sid)
+
+        song_info = self.client.get('/api/querySongById/', {'song_sid': self.song.sid}).json()['obj']
+
+        self.assertEqual(song_info['duration_ms'], 1000)
+        self.assertEqual(song_info['sample_rate'], 8000)
+        self.assertEqual(song_info['bitrate'], 128)
+        # 半幅正弦波的 RMS 约为 -9 dBFS
+        self.assertAlmostEqual(song_info['loudness_db'], -9.03, places=1)
+
+        waveform_peaks = base64.b64decode(song_info['waveform_peaks'])
+        self.assertEqual(len(waveform_peaks), audioMetadata.WAVEFORM_PEAK_COUNT)
+        self.assertTrue(all(120 <= peak <= 128 for peak in waveform_peaks))
+
+    def test_upload_song_lyrics(self):
+        self.upload('/api/uplondSongLyrics/', 'lyrics_file', 'song.lrc', song_id=self.song.sid)
+
+        self.song.refresh_from_db()
+        self.assertTrue(self.song.lyrics_url.endswith('.lrc'))
+
+    def test_upload_album_cover_variants(self):
+        image_buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), 'red').save(image_buffer, 'PNG')
+
+        self.upload(
+            '/api/uploadAlbumCover/', 'album_cover', 'cover.png', content=image_buffer.getvalue(),
+            album_id=self.album.aid,
+        )
+
+        self.album.refresh_from_db()
+        self.assertTrue(self.album.cover_thumb_url.endswith('_thumb.webp'))
+
+        # 各规格、各格式的缩略图存放在由原图路径推出的位置
+        cover_key = self.album.cover_url[len('http://testserver/media/'):]
+        for variant, max_edge in imagePipeline.IMAGE_VARIANTS.items():
+            for extension in imagePipeline.IMAGE_VARIANT_FORMATS:
+                variant_path = os.path.join(
+                    settings.UPLOAD_LOCAL_ROOT, imagePipeline.imageVariantKey(cover_key, variant, extension),
+                )
+                with Image.open(variant_path) as variant_image:
+                    self.assertEqual(variant_image.size[0], min(max_edge, 800))
+
+        self.assertEqual(os.listdir(self.staging_dir), [])
+
+        # 列表接口返回缩略图
+        songlist = models.SongList.objects.create(ordinaryUser=self.user, title='songlist')
+        models.SongAndSongList.objects.create(songList=songlist, song=self.song)
+
+        songlist_info = self.client.get('/api/querySongList/', {'songlist_slid': songlist.slid}).json()['obj']
+        self.assertEqual(songlist_info['song_list'][0]['album_cover_thumb_url'], self.album.cover_thumb_url)
+
+    def test_upload_rejects_fake_image(self):
+        response = self.client.post('/api/uploadAlbumCover/', {
+            'encode_jwt': self.encode_jwt,
+            'album_id': self.album.aid,
+            'album_cover': SimpleUploadedFile('cover.png', b'<?php echo 1; ?>' * 10),
+        }).json()
+
+        self.assertEqual(response['code'], Result.HTTP_STATUS_NOT_ACCEPTABLE)
+        self.assertFalse(models.UploadJob.objects.exists())
+
+    def test_create_community_picture(self):
+        image_buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), 'green').save(image_buffer, 'PNG')
+        params = {'community_name': 'community', 'music_type': 'rock', 'introduction': ''}
+
+        # 未登录时上传任务没有归属，无法查询状态
+        anonymous_result = self.client.post('/api/createCommunity/', dict(
+            params, profile_picture=SimpleUploadedFile('picture.png', image_buffer.getvalue()),
+        )).json()
+        self.assertEqual(anonymous_result['code'], Result.HTTP_STATUS_UNAUTHORIZED)
+        self.assertFalse(models.Community.objects.exists())
+
+        upload_job_id = self.upload(
+            '/api/createCommunity/', 'profile_picture', 'picture.png', content=image_buffer.getvalue(), **params,
+        )
+
+        job_info = self.client.get('/api/queryUploadJob/', {
+            'encode_jwt': self.encode_jwt, 'upload_job_id': upload_job_id,
+        }).json()['obj']
+        self.assertEqual(job_info['status'], 's')
+
+    def test_upload_corrupt_image(self):
+        image_buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), 'red').save(image_buffer, 'PNG')
+
+        # 文件头合法，内容被截断
+        upload_job_id = self.upload(
+            '/api/uploadAlbumCover/', 'album_cover', 'cover.png', content=image_buffer.getvalue()[:60],
+            album_id=self.album.aid,
+        )
+
+        job_info = self.client.get('/api/queryUploadJob/', {
+            'encode_jwt': self.encode_jwt, 'upload_job_id': upload_job_id,
+        }).json()['obj']
+        self.assertEqual(job_info['status'], 'f')
+
+        self.album.refresh_from_db()
+        self.assertIsNone(self.album.cover_thumb_url)
+        self.assertEqual(os.listdir(self.staging_dir), [])
+
+    def test_resume_only_stale_jobs(self):
+        live_job = models.UploadJob.objects.create(
+            target='album_cover', target_id=str(self.album.aid), oss_key='cover.png', status='u',
+        )
+        stale_job = models.UploadJob.objects.create(
+            target='album_cover', target_id=str(self.album.aid), oss_key='cover.png', status='u',
+        )
+        models.UploadJob.objects.filter(jid=stale_job.jid).update(
+            update_time=timezone.now() - timedelta(seconds=settings.UPLOAD_STALE_TIMEOUT + 1),
+        )
+
+        call_command('resume_upload_jobs', stdout=io.StringIO())
+
+        live_job.refresh_from_db()
+        stale_job.refresh_from_db()
+        # 其他进程正在处理的任务不受影响
+        self.assertEqual((live_job.status, stale_job.status), ('u', 'f'))
+
+    def test_chunked_upload(self):
+        content = bytes(range(256)) * 4
+
+        init_result = self.client.post('/api/initChunkedUpload/', {
+            'encode_jwt': self.encode_jwt, 'target': 'song_audio', 'target_id': self.song.sid,
+            'filename': 'song.mp3', 'total_size': len(content),
+        }).json()['obj']
+        self.assertEqual(init_result['chunk_count'], 3)
+
+        upload_job_id = init_result['upload_job_id']
+
+        # 乱序上传，中途查询已收到的分片
+        for chunk_index in [2, 0]:
+            self.client.post('/api/uploadChunk/', {
+                'encode_jwt': self.encode_jwt, 'upload_job_id': upload_job_id, 'chunk_index': chunk_index,
+                'chunk': SimpleUploadedFile('chunk', content[chunk_index * 400:(chunk_index + 1) * 400]),
+            })
+
+        job_info = self.client.get('/api/queryUploadJob/', {
+            'encode_jwt': self.encode_jwt, 'upload_job_id': upload_job_id,
+        }).json()['obj']
+        self.assertEqual(job_info['received_chunks'], [0, 2])
+
+        params = {'encode_jwt': self.encode_jwt, 'upload_job_id': upload_job_id}
+        self.assertNotEqual(self.client.post('/api/completeChunkedUpload/', params).json()['code'], 200)
+
+        self.client.post('/api/uploadChunk/', dict(
+            params, chunk_index=1, chunk=SimpleUploadedFile('chunk', content[400:800]),
+        ))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/completeChunkedUpload/', params).json()['code'], 200)
+
+        self.song.refresh_from_db()
+        local_path = os.path.join(
+            settings.UPLOAD_LOCAL_ROOT, *self.song.audio_url[len(settings.UPLOAD_LOCAL_URL):].split('/')
+        )
+        with open(local_path, 'rb') as uploaded_file:
+            self.assertEqual(uploaded_file.read(), content)
+
+    def test_direct_upload(self):
+        result = self.client.post('/api/requestDirectUpload/', {
+            'encode_jwt': self.encode_jwt, 'target': 'album_cover', 'target_id': self.album.aid,
+            'filename': 'cover.png',
+        }).json()['obj']
+
+        params = {'encode_jwt': self.encode_jwt, 'upload_job_id': result['upload_job_id']}
+
+        # 文件还没有上传时回调失败
+        self.assertEqual(self.client.post('/api/completeDirectUpload/', params).json()['code'], 406)
+
+        image_buffer = io.BytesIO()
+        Image.new('RGB', (64, 64), 'blue').save(image_buffer, 'PNG')
+
+        upload_url = urlsplit(result['upload_url'])
+        put_result = self.client.put(
+            '{}?{}'.format(upload_url.path, upload_url.query), image_buffer.getvalue(),
+            content_type='application/octet-stream',
+        ).json()
+        self.assertEqual(put_result['code'], 200, put_result)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            complete_result = self.client.post('/api/completeDirectUpload/', params).json()
+        self.assertEqual(complete_result['code'], 200, complete_result)
+
+        # 直传的图片由缩略图任务从存储下载后生成缩略图
+        self.album.refresh_from_db()
+        self.assertEqual(self.album.cover_url, complete_result['obj']['url'])
+        self.assertTrue(self.album.cover_thumb_url.endswith('_thumb.webp'))
+
+    def test_chunked_upload_requires_owner(self):
+        other_user = models.OrdinaryUser.objects.create(
+            username='other', password='password1', email='other@example.com',
+        )
+
+        result = self.client.post('/api/initChunkedUpload/', {
+            'encode_jwt': generateJwtToken(other_user), 'target': 'song_audio', 'target_id': self.song.sid,
+            'filename': 'song.mp3', 'total_size': 1000,
+        }).json()
+        self.assertEqual(result['code'], 406)
+
+
+class AudioMetadataTest(SimpleTestCase):
+    """
+    音频元数据测试：mp3 逐帧读取帧头计算时长和码率，无法识别的文件报错
+    """
+
+    def extract(self, content):
+        with tempfile.NamedTemporaryFile() as audio_file:
+            audio_file.write(content)
+            audio_file.flush()
+            return audioMetadata.extractAudioMetadata(audio_file.name)
+
+    def test_mp3_header(self):
+        # MPEG-1 Layer III，128kbps，44100Hz，每帧 1152 个采样
+        frame_header = bytes([0xFF, 0xFB, 0x90, 0x00])
+        frame = frame_header + b'\x00' * (144 * 128000 // 44100 - len(frame_header))
+        id3_tag = b'ID3\x03\x00\x00\x00\x00\x00\x0a' + b'\x00' * 10
+
+        metadata = self.extract(id3_tag + frame * 100)
+
+        self.assertEqual(metadata['duration_ms'], 100 * 1152 * 1000 // 44100)
+        self.assertEqual(metadata['sample_rate'], 44100)
+        self.assertAlmostEqual(metadata['bitrate'], 128, delta=1)
+        self.assertIsNone(metadata['waveform_peaks'])
+
+    def test_unknown_format(self):
+        with self.assertRaises(audioMetadata.AudioMetadataError):
+            self.extract(b'<html></html>' * 10)
+
+
+class SongRenditionTest(TestCase):
+    """
+    播放地址选择测试：按客户端要求的规格和省流量模式在转码结果中选择，没有转码结果时播放原始音频
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        producer = models.Producer.objects.create(ptype='singer')
+        album = models.Album.objects.create(producer=producer, aname='album')
+        cls.song = models.Song.objects.create(
+            producer=producer, album=album, sname='song', audio_url='http://testserver/media/song.wav',
+        )
+
+    def setUp(self):
+        caches['entity'].clear()
+
+    def querySong(self, **headers):
+        return self.client.get('/api/querySongById/', {'song_sid': self.song.sid}, headers=headers).json()['obj']
+
+    def test_stream_url(self):
+        self.assertEqual(self.querySong()['stream_url'], self.song.audio_url)
+
+        for quality, bitrate in list(audioTranscode.AUDIO_RENDITIONS.items()) + [(audioTranscode.HLS_RENDITION, 128)]:
+            models.SongRendition.objects.create(
+                song=self.song, quality=quality, codec='aac', bitrate=bitrate,
+                url='http://testserver/media/song_{}'.format(quality),
+            )
+        caches['entity'].clear()
+
+        self.assertEqual(self.querySong()['stream_url'], 'http://testserver/media/song_high')
+        self.assertEqual(self.querySong(save_data='on')['stream_url'], 'http://testserver/media/song_low')
+
+        song_info = self.client.get('/api/querySongById/', {'song_sid': self.song.sid, 'quality': 'hls'}).json()['obj']
+        self.assertEqual(song_info['stream_url'], 'http://testserver/media/song_hls')
+        self.assertEqual(len(song_info['renditions']), 4)
+
+
+@override_settings(UPLOAD_STORAGE_BACKEND='local', STREAM_CACHE_ADMIT_HITS=2, STREAM_CACHE_FILL_WORKERS=0)
+class StreamSongTest(TestCase):
+    """
+    音频流代理测试：Range / If-Range / If-None-Match 的处理，以及未命中两次后进入磁盘缓存
+    """
+
+    CONTENT = bytes(range(256)) * 40
+
+    @classmethod
+    def setUpTestData(cls):
+        producer = models.Producer.objects.create(ptype='singer')
+        album = models.Album.objects.create(producer=producer, aname='album')
+        cls.song = models.Song.objects.create(
+            producer=producer, album=album, sname='song', audio_url=settings.UPLOAD_LOCAL_URL + 'song/audio/song.mp3',
+        )
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+
+        settings_override = override_settings(
+            UPLOAD_LOCAL_ROOT=os.path.join(temp_dir.name, 'media'),
+            STREAM_CACHE_DIR=os.path.join(temp_dir.name, 'stream_cache'),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        audio_dir = os.path.join(settings.UPLOAD_LOCAL_ROOT, 'song', 'audio')
+        os.makedirs(audio_dir)
+        with open(os.path.join(audio_dir, 'song.mp3'), 'wb') as audio_file:
+            audio_file.write(self.CONTENT)
+
+        caches['entity'].clear()
+        audioStream.resetStreamCache()
+        self.addCleanup(audioStream.resetStreamCache)
+
+    def stream(self, **headers):
+        return self.client.get('/api/streamSong/', {'song_sid': self.song.sid}, headers=headers)
+
+    def test_full_and_range(self):
+        response = self.stream()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age', response['Cache-Control'])
+
+        etag = response['ETag']
+
+        response = self.stream(range='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/{}'.format(len(self.CONTENT)))
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT[100:200])
+
+        self.assertEqual(self.stream(if_none_match=etag).status_code, 304)
+        # 文件版本不符时忽略 Range
+        self.assertEqual(self.stream(range='bytes=0-9', if_range='"stale"').status_code, 200)
+        self.assertEqual(self.stream(range='bytes={}-'.format(len(self.CONTENT))).status_code, 416)
+
+    def test_head(self):
+        for _ in range(2):
+            response = self.client.head('/api/streamSong/', {'song_sid': self.song.sid}, headers={'range': 'bytes=0-9'})
+
+            self.assertEqual(response.status_code, 206)
+            self.assertFalse(response.streaming)
+            self.assertEqual(response['Content-Length'], '10')
+            self.assertEqual(response['Content-Range'], 'bytes 0-9/{}'.format(len(self.CONTENT)))
+
+        # HEAD 不读取音频，也不会让音频进入磁盘缓存
+        self.assertEqual(audioStream.getStreamCache().stats()['files'], 0)
+
+    def test_hot_track_served_from_disk_cache(self):
+        self.stream().close()
+        self.stream().close()
+        self.assertEqual(audioStream.getStreamCache().stats()['files'], 1)
+
+        response = self.stream(range='bytes=-50')
+        self.assertEqual(response.status_code, 206)
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT[-50:])
+        response.close()
+
+        self.assertEqual(audioStream.getStreamCache().stats()['hit'], 1)
+
+    def test_disk_cache_eviction(self):
+        stream_cache = audioStream.DiskLRUCache(
+            root=settings.STREAM_CACHE_DIR, max_bytes=250, admit_hits=1, fill_workers=0,
+        )
+
+        def filler(data):
+            def fill(local_path):
+                with open(local_path, 'wb') as local_file:
+                    local_file.write(data)
+            return fill
+
+        for key in ['a', 'b', 'c']:
+            stream_cache.recordMiss(key, filler(b'0' * 100))
+
+        # 最早放入的 a 被淘汰
+        self.assertIsNone(stream_cache.open('a'))
+        with stream_cache.open('c') as cached_file:
+            self.assertEqual(cached_file.read(), b'0' * 100)
+
+
+@override_settings(LISTENING_EVENT_FLUSH_INTERVAL=0, LISTENING_EVENT_BATCH_SIZE=2, JWT_USER_CACHE_ENABLED=False)
+class ListeningEventTest(TestCase):
+    """
+    收听事件测试：事件按批写入，小时、天汇总增量累加，已删除歌曲的事件被丢弃
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        producer = models.Producer.objects.create(ptype='singer')
+        album = models.Album.objects.create(producer=producer, aname='album')
+        cls.song = models.Song.objects.create(producer=producer, album=album, sname='song')
+
+        cls.user = models.OrdinaryUser.objects.create(
+            username='listener', password='password1', email='listener@example.com',
+        )
+        cls.encode_jwt = generateJwtToken(cls.user)
+
+    def record(self, events):
+        return self.client.post('/api/recordListeningEvents/', {
+            'encode_jwt': self.encode_jwt, 'events': json.dumps(events),
+        }).json()
+
+    def test_rollup(self):
+        result = self.record([
+            {'song_sid': str(self.song.sid), 'event': 'play', 'position_ms': 0},
+            {'song_sid': str(self.song.sid), 'event': 'skip', 'position_ms': 5000},
+            {'song_sid': str(self.song.sid), 'event': 'play'},
+            {'song_sid': str(self.song.sid), 'event': 'complete', 'position_ms': 180000},
+            # 不存在的歌曲
+            {'song_sid': str(uuid.uuid4()), 'event': 'play'},
+        ])
+        self.assertEqual(result['obj']['accepted'], 5)
+
+        self.assertEqual(models.ListeningEvent.objects.filter(ordinaryUser=self.user).count(), 4)
+
+        self.record([{'song_sid': str(self.song.sid), 'event': 'play'}])
+
+        hourly = models.SongPlayHourly.objects.get(song=self.song)
+        self.assertEqual((hourly.play_count, hourly.skip_count, hourly.complete_count), (3, 1, 1))
+        self.assertEqual(hourly.hour.minute, 0)
+
+        daily = models.SongPlayDaily.objects.get(song=self.song)
+        self.assertEqual((daily.play_count, daily.skip_count, daily.complete_count), (3, 1, 1))
+
+    def test_invalid_event(self):
+        result = self.record([{'song_sid': str(self.song.sid), 'event': 'pause'}])
+        self.assertEqual(result['code'], Result.HTTP_STATUS_BAD_REQUEST)
+
+        for position_ms in (1e30, -1, 2 ** 31, True, 1.5, '12000'):
+            result = self.record([{'song_sid': str(self.song.sid), 'event': 'play', 'position_ms': position_ms}])
+            self.assertEqual(result['code'], Result.HTTP_STATUS_BAD_REQUEST, position_ms)
+
+        self.assertFalse(models.ListeningEvent.objects.exists())
+
+    def test_bad_event_does_not_block_flush(self):
+        # 绕过接口的校验，放入一条数据库无法写入的事件
+        listeningEvents.recordEvents(self.user.uid, [
+            (self.song.sid, listeningEvents.EVENT_PLAY, 0),
+            (self.song.sid, listeningEvents.EVENT_PLAY, 2 ** 70),
+            (self.song.sid, listeningEvents.EVENT_SKIP, 1000),
+        ])
+
+        self.assertEqual(models.ListeningEvent.objects.filter(ordinaryUser=self.user).count(), 2)
+        self.assertEqual(listeningEvents.getListeningEventStats()['buffered'], 0)
+
+
+@override_settings(LISTENING_EVENT_FLUSH_INTERVAL=0, JWT_USER_CACHE_ENABLED=False)
+class ChartTest(TestCase):
+    """
+    排行榜测试：行为发生后缓存中的榜单增量更新，读取榜单不扫描得分表；重新计算按源表纠正偏差
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producer = models.Producer.objects.create(ptype='singer')
+        models.OrdinaryUser.objects.create(
+            username='singer', password='password1', email='singer@example.com', producer=cls.producer,
+        )
+        album = models.Album.objects.create(producer=cls.producer, aname='album')
+        cls.song_a = models.Song.objects.create(producer=cls.producer, album=album, sname='a')
+        cls.song_b = models.Song.objects.create(producer=cls.producer, album=album, sname='b')
+        cls.community = models.Community.objects.create(cname='community', music_type='rock', introduction='')
+
+        cls.user = models.OrdinaryUser.objects.create(
+            username='fan', password='password1', email='fan@example.com',
+        )
+        cls.encode_jwt = generateJwtToken(cls.user)
+        cls.songlist = models.SongList.objects.create(ordinaryUser=cls.user, title='songlist')
+
+    def setUp(self):
+        caches['entity'].clear()
+
+    def queryChart(self, chart, window='daily'):
+        result = self.client.get('/api/queryChart/', {'chart': chart, 'window': window}).json()
+        self.assertEqual(result['code'], 200, result)
+        return [(item['name'], item['score']) for item in result['obj']['list']]
+
+    def test_incremental_update(self):
+        self.assertEqual(self.queryChart('song'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/createSongComment/', {
+                'encode_jwt': self.encode_jwt, 'song_sid': self.song_b.sid, 'content': 'nice',
+            })
+            self.client.post('/api/addSongToSongList/', {
+                'encode_jwt': self.encode_jwt, 'songlist_slid': self.songlist.slid, 'song_sid': self.song_a.sid,
+            })
+            self.client.post('/api/recordListeningEvents/', {
+                'encode_jwt': self.encode_jwt,
+                'events': json.dumps([{'song_sid': str(self.song_b.sid), 'event': 'play'}] * 3),
+            })
+            self.client.post('/api/followProducer/', {
+                'encode_jwt': self.encode_jwt, 'producer_pid': self.producer.pid,
+            })
+
+        # 榜单从缓存中读取，只查询一次歌曲信息
+        with self.assertNumQueries(1):
+            self.assertEqual(self.queryChart('song'), [('b', 6), ('a', 5)])
+
+        self.assertEqual(self.queryChart('song', 'weekly'), [('b', 6), ('a', 5)])
+        self.assertEqual(self.queryChart('producer'), [('singer', 10)])
+
+    def test_recompute(self):
+        models.UserFollowCommunity.objects.create(ordinaryUser=self.user, community=self.community)
+        # 源数据已删除的得分
+        models.ChartScore.objects.create(
+            chart='song', entity_id=self.song_a.sid, day=timezone.localdate(), score=100,
+        )
+        self.assertEqual(self.queryChart('song'), [('a', 100)])
+
+        call_command('recompute_charts', stdout=io.StringIO())
+
+        self.assertEqual(self.queryChart('song'), [])
+        self.assertEqual(self.queryChart('community', 'weekly'), [('community', 10)])
+
+    def test_invalid_chart(self):
+        result = self.client.get('/api/queryChart/', {'chart': 'album'}).json()
+        self.assertEqual(result['code'], Result.HTTP_STATUS_BAD_REQUEST)
+
+
+@override_settings(JWT_USER_CACHE_ENABLED=False)
+class CounterTest(TestCase):
+    """
+    计数测试：关注、评论、收藏的增删在同一事务中维护计数，详情接口读到新的计数；修复命令按关系表纠正偏差
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producer = models.Producer.objects.create(ptype='singer')
+        album = models.Album.objects.create(producer=cls.producer, aname='album')
+        cls.song = models.Song.objects.create(producer=cls.producer, album=album, sname='song')
+        cls.community = models.Community.objects.create(cname='community', music_type='rock', introduction='')
+
+        cls.user = models.OrdinaryUser.objects.create(
+            username='fan', password='password1', email='fan@example.com',
+        )
+        cls.encode_jwt = generateJwtToken(cls.user)
+        cls.songlist = models.SongList.objects.create(ordinaryUser=cls.user, title='songlist')
+
+    def setUp(self):
+        caches['entity'].clear()
+
+    def post(self, url, **params):
+        result = self.client.post(url, dict(params, encode_jwt=self.encode_jwt)).json()
+        self.assertEqual(result['code'], 200, result)
+        return result
+
+    def querySong(self):
+        return self.client.get('/api/querySongById/', {'song_sid': self.song.sid}).json()['obj']
+
+    def test_song_counters(self):
+        self.assertEqual((self.querySong()['comment_count'], self.querySong()['songlist_count']), (0, 0))
+
+        scid = self.post('/api/createSongComment/', song_sid=self.song.sid, content='nice')['obj']
+        self.post('/api/createSongComment/', song_sid=self.song.sid, content='again')
+        self.post('/api/addSongToSongList/', songlist_slid=self.songlist.slid, song_sid=self.song.sid)
+
+        self.assertEqual((self.querySong()['comment_count'], self.querySong()['songlist_count']), (2, 1))
+
+        self.post('/api/dropSongComment/', song_comment_scid=scid)
+        self.post('/api/dropSongFromSongList/', songlist_slid=self.songlist.slid, song_sid=self.song.sid)
+
+        self.assertEqual((self.querySong()['comment_count'], self.querySong()['songlist_count']), (1, 0))
+
+    def test_follow_counters(self):
+        self.post('/api/followProducer/', producer_pid=self.producer.pid)
+        self.post('/api/UserFollowCommunity/', community_name='community')
+
+        self.producer.refresh_from_db()
+        self.community.refresh_from_db()
+        self.assertEqual((self.producer.follower_count, self.community.member_count), (1, 1))
+
+        self.post('/api/cancelFollowProducer/', producer_pid=self.producer.pid)
+
+        self.producer.refresh_from_db()
+        self.assertEqual(self.producer.follower_count, 0)
+
+    def test_reconcile(self):
+        models.SongComment.objects.create(song=self.song, ordinaryUser=self.user, comment='nice')
+        models.Song.objects.filter(sid=self.song.sid).update(songlist_count=5)
+        models.Community.objects.filter(cid=self.community.cid).update(member_count=-1)
+
+        output = io.StringIO()
+        call_command('reconcile_counters', stdout=output)
+
+        self.song.refresh_from_db()
+        self.community.refresh_from_db()
+        self.assertEqual((self.song.comment_count, self.song.songlist_count), (1, 0))
+        self.assertEqual(self.community.member_count, 0)
+        self.assertIn('song_comment: repaired 1 rows', output.getvalue())
+
+
+@override_settings(LIKE_FLUSH_INTERVAL=0, JWT_USER_CACHE_ENABLED=False)
+class LikeTest(TestCase):
+    """
+    点赞测试：同一用户重复点赞被拒绝，点赞数在事务提交后累加，热门评论按点赞数排列
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        producer = models.Producer.objects.create(ptype='singer')
+        album = models.Album.objects.create(producer=producer, aname='album')
+        cls.song = models.Song.objects.create(producer=producer, album=album, sname='song')
+
+        cls.users = [
+            models.OrdinaryUser.objects.create(
+                username='fan{}'.format(i), password='password1', email='fan{}@example.com'.format(i),
+            )
+            for i in range(2)
+        ]
+        cls.comments = [
+            models.SongComment.objects.create(song=cls.song, ordinaryUser=cls.users[0], comment=str(i))
+            for i in range(2)
+        ]
+
+    def like(self, user, comment, url='/api/like/'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, {
+                'encode_jwt': generateJwtToken(user), 'target': 'song_comment', 'target_id': comment.scid,
+            }).json()
+
+    def topComments(self):
+        result = self.client.get('/api/querySongComment/', {'song_sid': self.song.sid, 'order': 'likes'}).json()
+        return [(comment['comment'], comment['likes']) for comment in result['obj']['list']]
+
+    def test_like(self):
+        self.assertEqual(self.like(self.users[0], self.comments[1])['code'], 200)
+        self.assertEqual(self.like(self.users[0], self.comments[1])['code'], Result.HTTP_STATUS_CONFLICT)
+        self.like(self.users[1], self.comments[1])
+        self.like(self.users[1], self.comments[0])
+
+        self.assertEqual(self.topComments(), [('1', 2), ('0', 1)])
+
+        self.assertEqual(self.like(self.users[1], self.comments[1], '/api/cancelLike/')['code'], 200)
+        self.assertEqual(
+            self.like(self.users[1], self.comments[1], '/api/cancelLike/')['code'], Result.HTTP_STATUS_NOT_ACCEPTABLE,
+        )
+
+        self.comments[1].refresh_from_db()
+        self.assertEqual(self.comments[1].likes, 1)
+
+    def test_invalid_target(self):
+        result = self.client.post('/api/like/', {
+            'encode_jwt': generateJwtToken(self.users[0]), 'target': 'blog', 'target_id': self.comments[0].scid,
+        }).json()
+        self.assertEqual(result['code'], Result.HTTP_STATUS_NOT_ACCEPTABLE)
+
+    def test_reconcile_likes(self):
+        models.SongCommentLike.objects.create(songComment=self.comments[0], ordinaryUser=self.users[0])
+
+        # 服务运行时点赞的增量可能还在其他进程的缓冲中，默认不修复点赞数
+        call_command('reconcile_counters', stdout=io.StringIO())
+
+        self.comments[0].refresh_from_db()
+        self.assertEqual(self.comments[0].likes, 0)
+
+        call_command('reconcile_counters', '--include-likes', stdout=io.StringIO())
+
+        self.comments[0].refresh_from_db()
+        self.assertEqual(self.comments[0].likes, 1)
+
+
+@override_settings(FEED_FANOUT_MAX_MEMBERS=3, FEED_TIMELINE_MAX=2, JWT_USER_CACHE_ENABLED=False)
+class CommunityFeedTest(TestCase):
+    """
+    社群动态测试：小社群写扩散到关注者的时间线，大社群在读取时合并，按游标分页，时间线可截断
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.small = models.Community.objects.create(cname='small', music_type='rock', introduction='')
+        cls.large = models.Community.objects.create(cname='large', music_type='jazz', introduction='')
+
+        cls.users = [
+            models.OrdinaryUser.objects.create(
+                username='user{}'.format(i), password='password1', email='user{}@example.com'.format(i),
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+
+        settings_override = override_settings(
+            UPLOAD_STORAGE_BACKEND='local',
+            UPLOAD_WORKERS=0,
+            UPLOAD_STAGING_DIR=os.path.join(temp_dir.name, 'staging'),
+            UPLOAD_LOCAL_ROOT=os.path.join(temp_dir.name, 'media'),
+            UPLOAD_LOCAL_URL='http://testserver/media/',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # 两个社群都有 user0、user1 关注，大社群再加上 user2 达到读扩散的人数
+        for user in self.users[:2]:
+            self.post(user, '/api/UserFollowCommunity/', community_name='small')
+        for user in self.users:
+            self.post(user, '/api/UserFollowCommunity/', community_name='large')
+
+    def post(self, user, url, **params):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.client.post(url, dict(params, encode_jwt=generateJwtToken(user))).json()
+        self.assertEqual(result['code'], 200, result)
+        return result
+
+    def createBlog(self, community, content):
+        return self.post(self.users[1], '/api/createBlog/', community_cid=community.cid, content=content)['obj']['bid']
+
+    def queryFeed(self, **params):
+        result = self.client.get('/api/queryCommunityFeed/', dict(params, encode_jwt=generateJwtToken(self.users[0])))
+        return result.json()['obj']
+
+    def test_hybrid_feed(self):
+        small_bid = self.createBlog(self.small, 'small post')
+        large_bid = self.createBlog(self.large, 'large post')
+
+        # 只有小社群的帖子写入了时间线
+        self.assertEqual(
+            list(models.FeedItem.objects.filter(ordinaryUser=self.users[0]).values_list('blog_id', flat=True)),
+            [uuid.UUID(small_bid)],
+        )
+
+        feed = self.queryFeed()
+        self.assertEqual([blog['bid'] for blog in feed['list']], [large_bid, small_bid])
+        self.assertEqual(feed['list'][1]['community']['name'], 'small')
+
+        content_url = models.Blog.objects.get(bid=small_bid).content_url
+        self.assertEqual(feed['list'][1]['content_url'], content_url)
+
+        oss_key = uploadPipeline.getUploadStorage().objectKey(content_url)
+        content_path = os.path.join(settings.UPLOAD_LOCAL_ROOT, *oss_key.split('/'))
+        with open(content_path) as content_file:
+            self.assertEqual(content_file.read(), 'small post')
+
+    def test_fan_out_after_upload(self):
+        # 内容上传完成之前，帖子不出现在时间线和大社群的动态中
+        result = self.client.post('/api/createBlog/', {
+            'encode_jwt': generateJwtToken(self.users[1]), 'community_cid': self.small.cid, 'content': 'small post',
+        }).json()['obj']
+        self.createBlog(self.large, 'large post')
+        large_result = self.client.post('/api/createBlog/', {
+            'encode_jwt': generateJwtToken(self.users[1]), 'community_cid': self.large.cid, 'content': 'pending',
+        }).json()['obj']
+
+        self.assertFalse(models.FeedItem.objects.filter(blog_id=result['bid']).exists())
+        self.assertEqual(len(self.queryFeed()['list']), 1)
+
+        uploadPipeline.runUploadJob(result['upload_job_id'])
+        uploadPipeline.runUploadJob(large_result['upload_job_id'])
+
+        self.assertEqual(models.FeedItem.objects.filter(blog_id=result['bid']).count(), 2)
+        feed_bid_list = [blog['bid'] for blog in self.queryFeed()['list']]
+        self.assertEqual(len(feed_bid_list), 3)
+        self.assertTrue({large_result['bid'], result['bid']} <= set(feed_bid_list))
+
+    def test_user_all_community(self):
+        for i in range(3):
+            self.createBlog(self.small, str(i))
+
+        result = self.client.get('/api/getUserAllCommunity/', {
+            'encode_jwt': generateJwtToken(self.users[1]), 'limit': 1,
+        }).json()['obj']
+
+        # 后关注的大社群排在前面
+        self.assertEqual(result['all_community'][0]['community_name'], 'large')
+        self.assertEqual(result['all_community'][0]['community_recent_interaction_star_rating'], 0)
+
+        result = self.client.get('/api/getUserAllCommunity/', {
+            'encode_jwt': generateJwtToken(self.users[1]), 'cursor': result['next_cursor'],
+        }).json()['obj']
+
+        self.assertEqual(result['all_community'][0]['community_name'], 'small')
+        self.assertEqual(result['all_community'][0]['community_recent_interaction_count'], 3)
+        self.assertEqual(result['all_community'][0]['community_recent_interaction_star_rating'], 2)
+        self.assertIsNone(result['next_cursor'])
+
+    def test_top_communities(self):
+        caches['entity'].clear()
+
+        # 新增关注：小社群 2 人，大社群 3 人
+        bid = self.createBlog(self.large, 'post')
+        self.post(self.users[0], '/api/createBlogComment/', blog_bid=bid, content='nice')
+        for _ in range(3):
+            self.createBlog(self.small, 'post')
+
+        def topCommunities():
+            result = self.client.get('/api/showTop5Community/')
+            return [(community['name'], community['score']) for community in result.json()['obj']['list']]
+
+        self.assertEqual(topCommunities(), [('small', 13), ('large', 10)])
+
+        # 缓存期内不查询数据库
+        self.createBlog(self.large, 'post')
+        with self.assertNumQueries(0):
+            self.assertEqual(topCommunities(), [('small', 13), ('large', 10)])
+
+    def test_cursor_pagination(self):
+        bid_list = [self.createBlog(community, str(i)) for i, community in enumerate([self.small, self.large] * 2)]
+
+        seen, cursor = [], None
+        while True:
+            feed = self.queryFeed(limit=1, **({'cursor': cursor} if cursor else {}))
+            seen += [blog['bid'] for blog in feed['list']]
+            cursor = feed['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(sorted(seen), sorted(bid_list))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_follow_backfills_and_trim(self):
+        for i in range(3):
+            self.createBlog(self.small, str(i))
+
+        # 关注后小社群仍在写扩散的人数以内
+        with self.settings(FEED_FANOUT_MAX_MEMBERS=4):
+            self.post(self.users[2], '/api/UserFollowCommunity/', community_name='small')
+        self.assertEqual(models.FeedItem.objects.filter(ordinaryUser=self.users[2]).count(), 3)
+
+        call_command('trim_feeds', stdout=io.StringIO())
+        self.assertEqual(models.FeedItem.objects.filter(ordinaryUser=self.users[2]).count(), 2)
+
+
+@override_settings(JWT_USER_CACHE_ENABLED=False, BATCH_OPERATION_MAX_ITEMS=20)
+class BatchOperationTest(TestCase):
+    """
+    批量操作测试：逐项返回结果，计数准确，查询数与请求中的id数无关
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producers = [models.Producer.objects.create(ptype='singer') for _ in range(6)]
+        album = models.Album.objects.create(producer=cls.producers[0], aname='album')
+        cls.songs = [
+            models.Song.objects.create(producer=cls.producers[0], album=album, sname='song{}'.format(i))
+            for i in range(6)
+        ]
+        cls.communities = [
+            models.Community.objects.create(cname='community{}'.format(i), music_type='rock', introduction='')
+            for i in range(6)
+        ]
+
+        cls.user = models.OrdinaryUser.objects.create(
+            username='fan', password='password1', email='fan@example.com', producer=cls.producers[5],
+        )
+        cls.encode_jwt = generateJwtToken(cls.user)
+        cls.songlist = models.SongList.objects.create(ordinaryUser=cls.user, title='songlist')
+
+    def post(self, url, **params):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, dict(params, encode_jwt=self.encode_jwt)).json()
+
+    def test_batch_follow_producer(self):
+        models.UserFollowProducer.objects.create(ordinaryUser=self.user, producer=self.producers[0])
+        missing_pid = str(uuid.uuid4())
+
+        result = self.post('/api/batchFollowProducer/', producer_pids=json.dumps([
+            str(self.producers[0].pid), str(self.producers[1].pid), str(self.producers[1].pid),
+            str(self.producers[5].pid), missing_pid, 'not-a-uuid',
+        ]))
+
+        self.assertEqual(result['code'], 200, result)
+        self.assertEqual(result['obj']['results'], {
+            str(self.producers[0].pid): 'exists',
+            str(self.producers[1].pid): 'created',
+            str(self.producers[5].pid): 'self',
+            missing_pid: 'not_found',
+            'not-a-uuid': 'invalid',
+        })
+
+        follower_counts = dict(models.Producer.objects.values_list('pid', 'follower_count'))
+        self.assertEqual((follower_counts[self.producers[1].pid], follower_counts[self.producers[5].pid]), (1, 0))
+
+    def test_batch_follow_community(self):
+        result = self.post('/api/batchFollowCommunity/', community_cids=json.dumps([
+            str(community.cid) for community in self.communities[:3]
+        ]))
+
+        self.assertEqual(set(result['obj']['results'].values()), {'created'})
+        self.assertEqual(
+            models.Community.objects.filter(member_count=1).count(), 3,
+        )
+        self.assertEqual(models.CommunityActivityDaily.objects.filter(new_member_count=1).count(), 3)
+
+        result = self.post('/api/batchFollowCommunity/', community_cids=json.dumps([str(self.communities[0].cid)]))
+        self.assertEqual(result['obj']['results'], {str(self.communities[0].cid): 'exists'})
+
+    def test_batch_add_song(self):
+        song_sids = [str(song.sid) for song in self.songs]
+
+        result = self.post('/api/batchAddSongToSongList/', songlist_slid=self.songlist.slid,
+                           song_sids=json.dumps(song_sids[:4]))
+        self.assertEqual(set(result['obj']['results'].values()), {'created'})
+
+        result = self.post('/api/batchAddSongToSongList/', songlist_slid=self.songlist.slid,
+                           song_sids=json.dumps(song_sids[3:]))
+        self.assertEqual(result['obj']['results'], {
+            song_sids[3]: 'exists', song_sids[4]: 'created', song_sids[5]: 'created',
+        })
+        self.assertEqual(models.Song.objects.filter(songlist_count=1).count(), 6)
+
+    def test_concurrent_insert_not_reported(self):
+        def insertConcurrently(count):
+            # 去重查询之后、批量插入之前，另一个请求插入了同一条关系
+            models.UserFollowProducer.objects.create(ordinaryUser=self.user, producer=self.producers[2])
+            return [{}] * count
+
+        pid_list = [str(self.producers[2].pid), str(self.producers[3].pid)]
+        results, new_pid_list = batchOperation._batchRelate(
+            pid_list, models.Producer, models.UserFollowProducer,
+            relation_filter={'ordinaryUser': self.user},
+            relation_field='producer',
+            time_field='follow_time',
+            extraFields=insertConcurrently,
+        )
+
+        self.assertEqual(results, {pid_list[0]: 'exists', pid_list[1]: 'created'})
+        self.assertEqual(new_pid_list, [self.producers[3].pid])
+        self.assertEqual(models.UserFollowProducer.objects.filter(ordinaryUser=self.user).count(), 2)
+
+    def test_query_count_independent_of_items(self):
+        def countQueries(pid_list):
+            with CaptureQueriesContext(connection) as queries:
+                self.post('/api/batchFollowProducer/', producer_pids=json.dumps(pid_list))
+            return len(queries)
+
+        self.assertEqual(
+            countQueries([str(self.producers[0].pid)]),
+            countQueries([str(producer.pid) for producer in self.producers[1:5]]),
+        )
+
+    def test_invalid_request(self):
+        other_user = models.OrdinaryUser.objects.create(
+            username='other', password='password1', email='other@example.com',
+        )
+        other_songlist = models.SongList.objects.create(ordinaryUser=other_user, title='other')
+
+        result = self.post('/api/batchAddSongToSongList/', songlist_slid=other_songlist.slid,
+                           song_sids=json.dumps([str(self.songs[0].sid)]))
+        self.assertEqual(result['code'], Result.HTTP_STATUS_NOT_ACCEPTABLE)
+
+        result = self.post('/api/batchFollowProducer/', producer_pids='not json')
+        self.assertEqual(result['code'], Result.HTTP_STATUS_BAD_REQUEST)
+
+        result = self.post('/api/batchFollowCommunity/', community_cids=json.dumps([str(uuid.uuid4())] * 21))
+        self.assertEqual(result['code'], Result.HTTP_STATUS_BAD_REQUEST)
+
+
+@override_settings(JWT_USER_CACHE_ENABLED=False, BATCH_OPERATION_MAX_ITEMS=2)
+class SongListOrderTest(TestCase):
+    """
+    歌单顺序测试：歌曲按 position 排列，移动歌曲只修改被移动的行，间隔用尽时重新排列；JSON-lines 导出后可导入
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        producer = models.Producer.objects.create(ptype='singer')
+        album = models.Album.objects.create(producer=producer, aname='album')
+        cls.songs = [
+            models.Song.objects.create(producer=producer, album=album, sname='song{}'.format(i))
+            for i in range(5)
+        ]
+
+        cls.user = models.OrdinaryUser.objects.create(
+            username='fan', password='password1', email='fan@example.com',
+        )
+        cls.encode_jwt = generateJwtToken(cls.user)
+        cls.songlist = models.SongList.objects.create(ordinaryUser=cls.user, title='songlist')
+
+    def setUp(self):
+        caches['entity'].clear()
+
+        for song in self.songs:
+            self.post('/api/addSongToSongList/', songlist_slid=self.songlist.slid, song_sid=song.sid)
+
+    def post(self, url, **params):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, dict(params, encode_jwt=self.encode_jwt)).json()
+
+    def move(self, song_indexes, after_index=None):
+        return self.post(
+            '/api/reorderSongList/', songlist_slid=self.songlist.slid,
+            song_sids=json.dumps([str(self.songs[index].sid) for index in song_indexes]),
+            after_sid='' if after_index is None else self.songs[after_index].sid,
+        )
+
+    def songOrder(self, songlist=None):
+        result = self.client.get('/api/querySongList/', {'songlist_slid': (songlist or self.songlist).slid}).json()
+        return [int(song['sname'][len('song'):]) for song in result['obj']['song_list']]
+
+    def test_move(self):
+        self.assertEqual(self.songOrder(), [0, 1, 2, 3, 4])
+
+        result = self.move([4], after_index=0)
+        self.assertEqual(result['obj']['updated_count'], 1)
+        self.assertEqual(self.songOrder(), [0, 4, 1, 2, 3])
+
+        self.assertEqual(self.move([2, 3])['obj']['updated_count'], 2)
+        self.assertEqual(self.songOrder(), [2, 3, 0, 4, 1])
+
+        self.move([2], after_index=1)
+        self.assertEqual(self.songOrder(), [3, 0, 4, 1, 2])
+
+    def test_rebalance(self):
+        for position, song in enumerate(self.songs):
+            models.SongAndSongList.objects.filter(song=song).update(position=position)
+
+        self.move([4], after_index=0)
+        self.assertEqual(self.songOrder(), [0, 4, 1, 2, 3])
+        self.assertEqual(
+            list(models.SongAndSongList.objects.order_by('position').values_list('position', flat=True)),
+            [songListOrder.POSITION_GAP * (index + 1) for index in range(5)],
+        )
+
+    def test_invalid_move(self):
+        other_song = models.Song.objects.create(
+            producer=self.songs[0].producer, album=self.songs[0].album, sname='other',
+        )
+
+        for song_sids, after_sid in (
+                ([str(other_song.sid)], ''),
+                ([str(self.songs[0].sid)], self.songs[0].sid),
+                ([str(self.songs[0].sid)] * 2, ''),
+                (['not-a-uuid'], ''),
+        ):
+            result = self.post('/api/reorderSongList/', songlist_slid=self.songlist.slid,
+                               song_sids=json.dumps(song_sids), after_sid=after_sid)
+            self.assertEqual(result['code'], Result.HTTP_STATUS_NOT_ACCEPTABLE, song_sids)
+
+    def test_collect_time_kept(self):
+        record = models.SongAndSongList.objects.get(song=self.songs[0])
+        collect_time = record.collect_time
+
+        self.move([0], after_index=4)
+        record.position += 1
+        record.save()
+
+        record.refresh_from_db()
+        self.assertEqual(record.collect_time, collect_time)
+
+    def test_export_import(self):
+        self.move([4])
+
+        response = self.client.get('/api/exportSongList/', {'songlist_slid': self.songlist.slid})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['sname'] for line in lines], ['song4', 'song0', 'song1', 'song2', 'song3'])
+
+        dst_songlist = models.SongList.objects.create(ordinaryUser=self.user, title='imported')
+        models.SongAndSongList.objects.create(songList=dst_songlist, song=self.songs[1], position=1)
+        songlist_file = SimpleUploadedFile('songlist.jsonl', '\n'.join(lines + ['not json', '']).encode())
+
+        result = self.post('/api/importSongList/', songlist_slid=dst_songlist.slid, songlist_file=songlist_file)
+
+        self.assertEqual(result['obj'], {'created': 4, 'exists': 1, 'invalid': 1, 'truncated': False})
+        self.assertEqual(self.songOrder(dst_songlist), [1, 4, 0, 2, 3])
+
+        with self.settings(SONGLIST_IMPORT_MAX_ITEMS=2):
+            result = self.post('/api/importSongList/', songlist_slid=dst_songlist.slid,
+                               songlist_file=SimpleUploadedFile('songlist.jsonl', '\n'.join(lines).encode()))
+        self.assertEqual(result['obj'], {'exists': 2, 'truncated': True})
+
+
+class SongSearchTest(TestCase):
+    """
+    歌曲搜索测试：进程内索引能发现其他进程删除的歌曲；MySQL 后端中单字的词用 LIKE 过滤
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        producer = models.Producer.objects.create(ptype='singer')
+        album = models.Album.objects.create(producer=producer, aname='album')
+        cls.songs = [
+            models.Song.objects.create(producer=producer, album=album, sname=sname)
+            for sname in ('love a', 'love b', 'lovely day')
+        ]
+
+    def test_memory_backend_drops_removed_songs(self):
+        backend = songSearch.MemorySongSearchBackend(sync_interval=0)
+        # 模拟另一个进程维护文档表
+        other_backend = songSearch.MemorySongSearchBackend(sync_interval=0)
+
+        for song in self.songs:
+            other_backend.indexSong(song.sid)
+
+        ranked_song_ids = backend.search('love')
+        self.assertEqual(len(ranked_song_ids), 3)
+
+        other_backend.removeSong(ranked_song_ids[0])
+
+        self.assertEqual(backend.search('love', limit=1), ranked_song_ids[1:2])
+        self.assertEqual(backend.search('love', offset=1), ranked_song_ids[2:])
+
+    @unittest.skipUnless(connection.vendor == 'mysql', 'full-text search needs MySQL')
+    def test_mysql_backend_single_character_term(self):
+        backend = songSearch.MysqlSongSearchBackend()
+
+        for song in self.songs:
+            backend.indexSong(song.sid)
+
+        self.assertEqual(backend.search('love a'), [self.songs[0].sid])
+
+
+class OSS2UtilsTest(SimpleTestCase):
+    """
+    oss 客户端测试：Bucket 在进程内共用，密钥文件修改后重新加载
+    """
+
+    def test_shared_bucket(self):
+        OSS2Utils.reset()
+        self.addCleanup(OSS2Utils.reset)
+
+        self.assertIs(OSS2Utils.get_bucket(), OSS2Utils.get_bucket())
+
+    def test_reload_credentials_file(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        credentials_file = os.path.join(temp_dir.name, 'credentials.json')
+
+        def writeCredentials(access_key_id, mtime):
+            with open(credentials_file, 'w') as f:
+                json.dump({'access_key_id': access_key_id, 'access_key_secret': 'secret'}, f)
+            os.utime(credentials_file, (mtime, mtime))
+
+        provider = ReloadableCredentialsProvider()
+
+        with override_settings(ALIYUN_CREDENTIALS_FILE=credentials_file):
+            writeCredentials('old', 1000)
+            self.assertEqual(provider.get_credentials().access_key_id, 'old')
+
+            writeCredentials('new', 2000)
+            provider.reload()
+            self.assertEqual(provider.get_credentials().access_key_id, 'new')
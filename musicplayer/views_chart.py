@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.http import JsonResponse
+
+from utils.charts import CHART_COMMUNITY, CHART_PRODUCER, CHART_SONG, CHART_WINDOWS, getChart
+from utils.result import Result
+from utils import utils
+from musicplayer import models
+
+
+def _songItems(sid_list) -> dict:
+    return {
+        song_info['sid'].hex: {
+            'sid': song_info['sid'],
+            'name': song_info['sname'],
+            'producer_pid': song_info['producer_id'],
+            'album_cover_thumb_url': song_info['album__cover_thumb_url'] or song_info['album__cover_url'],
+        }
+        for song_info in models.Song.objects.filter(sid__in=sid_list).values(
+            'sid', 'sname', 'producer_id', 'album__cover_url', 'album__cover_thumb_url',
+        )
+    }
+
+
+def _producerItems(pid_list) -> dict:
+    return {
+        user_info['producer_id'].hex: {
+            'pid': user_info['producer_id'],
+            'name': user_info['username'],
+            'profile_picture_thumb_url': user_info['profile_picture_thumb_url'] or user_info['profile_picture_url'],
+        }
+        for user_info in models.OrdinaryUser.objects.filter(producer_id__in=pid_list).values(
+            'producer_id', 'username', 'profile_picture_url', 'profile_picture_thumb_url',
+        )
+    }
+
+
+def _communityItems(cid_list) -> dict:
+    return {
+        community_info['cid'].hex: {
+            'cid': community_info['cid'],
+            'name': community_info['cname'],
+            'music_type': community_info['music_type'],
+            'profile_picture_thumb_url': (
+                community_info['profile_picture_thumb_url'] or community_info['profile_picture_url']
+            ),
+        }
+        for community_info in models.Community.objects.filter(cid__in=cid_list).values(
+            'cid', 'cname', 'music_type', 'profile_picture_url', 'profile_picture_thumb_url',
+        )
+    }
+
+
+# 排行榜类型 -> 按id批量取出展示信息的函数
+_CHART_ITEM_LOADERS = {
+    CHART_SONG: _songItems,
+    CHART_PRODUCER: _producerItems,
+    CHART_COMMUNITY: _communityItems,
+}
+
+
+def queryChart(request):
+    """
+    歌曲、创作者、社群的日榜和周榜。参数 chart 为 song / producer / community，
+    window 为 daily / weekly，limit 为条数，最多 settings.CHART_TOP_K 条
+    """
+    if request.method != 'GET':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, GET only'.format(request.method)
+        ))
+
+    chart = request.GET.get('chart', CHART_SONG)
+    window = request.GET.get('window', 'daily')
+
+    if chart not in _CHART_ITEM_LOADERS or window not in CHART_WINDOWS:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid chart or window'
+        ))
+
+    limit = min(max(utils.strToInt(request.GET.get('limit'), 10), 1), settings.CHART_TOP_K)
+
+    entries = getChart(chart, window, limit)
+    # 一条查询取出榜上实体的展示信息，已删除的实体不出现在结果中
+    item_dict = _CHART_ITEM_LOADERS[chart]([entity_id for entity_id, _ in entries])
+
+    return JsonResponse(Result.success(
+        {
+            'chart': chart,
+            'window': window,
+            'list': [
+                dict(item_dict[entity_id], rank=rank, score=score)
+                for rank, (entity_id, score) in enumerate(entries, start=1)
+                if entity_id in item_dict
+            ],
+        }
+    ))
@@ -1,18 +1,32 @@
-import uuid
+from datetime import timedelta
 
-from django.db.models import Q
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.http import JsonResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 
-from utils.modelOperation import decodeJwtToken
-from utils.oss2Utils import OSS2Utils
+from utils.batchOperation import followCommunities
+from utils.charts import CHART_COMMUNITY, WEIGHT_FOLLOW, recordActivity
+from utils.communityActivity import (
+    ACTIVITY_COMMENT, ACTIVITY_NEW_MEMBER, ACTIVITY_POST, getTopCommunities, recordCommunityActivity,
+)
+from utils.communityFeed import backfillTimeline, queryFeedPage
+from utils.counters import adjustCounter
+from utils.jwtAuth import jwt_required
+from utils.pagination import paginateQueryset, parseLimit
 from utils.result import Result
-from utils import utils
-from musicplayer import models, models_sqlview
+from utils.uploadPipeline import submitUpload
+from utils import imagePipeline, utils
+from musicplayer import models
 
 
 # 创建社群
 @csrf_exempt
+@jwt_required
 def createCommunity(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -44,23 +58,13 @@ def createCommunity(request):
                 message='invalid file extension',
             ))
 
-        # 生成uuid
-        oss_filename = uuid.uuid4().hex + file_extension
-
-        # 调用云服务上传图片
-        upload_url = OSS2Utils.upload(
-            request_file=profile_picture,
-            oss_filename=oss_filename,
-            oss_folder=['community', 'profilePhoto']
-        )
-
-        if upload_url is None:
+        # 按文件头检验图片格式，扩展名可以伪造
+        if not imagePipeline.isImageFile(profile_picture):
             return JsonResponse(Result.failure(
-                code=Result.HTTP_STATUS_INTERNAL_SERVER_ERROR,
-                message='upload file failed',
+                code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+                message='invalid image file',
             ))
-    else:
-        upload_url = None
+
     record = models.Community.objects.filter(cname=cname).count()
     # print(record)
     if record:
@@ -71,16 +75,28 @@ def createCommunity(request):
 
     community = models.Community.objects.create(
         cname=cname,
-        profile_picture_url=upload_url,
         music_type=music_type,
         introduction=introduction
     )
 
-    return JsonResponse(Result.success())
+    if profile_picture is None:
+        return JsonResponse(Result.success({'upload_job_id': None}))
+
+    # 后台上传图片，完成后写回 profile_picture_url
+    upload_job = submitUpload(
+        request_file=profile_picture,
+        extension=file_extension,
+        target='community_profile_picture',
+        target_id=community.cid,
+        ordinary_user=request.user_ctx.ordinary_user,
+    )
+
+    return JsonResponse(Result.success({'upload_job_id': upload_job.jid}))
 
 
 # 用户关注社群
 @csrf_exempt
+@jwt_required
 def UserFollowCommunity(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -88,23 +104,8 @@ def UserFollowCommunity(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
     data = request.POST
-    encode_jwt = data.get('encode_jwt')
     name = data.get('community_name')
-
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
+    ordinary_user = request.user_ctx.ordinary_user
 
     community = models.Community.objects.get(cname=name)
     if community is None:
@@ -121,50 +122,85 @@ def UserFollowCommunity(request):
             message='already followed community',
         ))
 
-    models.UserFollowCommunity.objects.create(ordinaryUser=ordinary_user, community=community)
+    with transaction.atomic():
+        models.UserFollowCommunity.objects.create(ordinaryUser=ordinary_user, community=community)
+        adjustCounter('community_member', community.cid, 1)
+        recordCommunityActivity(community.cid, ACTIVITY_NEW_MEMBER)
+
+    backfillTimeline(ordinary_user, [community.cid])
+    recordActivity(CHART_COMMUNITY, {community.cid: WEIGHT_FOLLOW})
     return JsonResponse(Result.success())
 
 
-# 展示用户前5评论最多的社群
-def showTop5Community(request):
-    if request.method != 'GET':
+# 一次关注多个社群，参数 community_cids 为社群id的 JSON 数组，返回每个社群的结果
+@csrf_exempt
+@jwt_required
+def batchFollowCommunity(request):
+    if request.method != 'POST':
         return JsonResponse(Result.failure(
             code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
-            message='Method {} not allowed, GET only'.format(request.method)
+            message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.GET.get('encode_jwt')
-    if encode_jwt is None or encode_jwt == '':
+    community_cid_list = utils.jsonArrayToList(request.POST.get('community_cids') or '')
+
+    if community_cid_list is None or len(community_cid_list) > settings.BATCH_OPERATION_MAX_ITEMS:
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='community_cids should be a json array of at most {} ids'.format(
+                settings.BATCH_OPERATION_MAX_ITEMS,
+            )
         ))
 
-    ordinary_user = decodeJwtToken(encode_jwt)
+    return JsonResponse(Result.success({
+        'results': followCommunities(request.user_ctx.ordinary_user, community_cid_list),
+    }))
 
-    # jwt 令牌解析失败
-    if ordinary_user is None:
+
+# 展示最近活跃度最高的5个社群，不需要登录
+def showTop5Community(request):
+    if request.method != 'GET':
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, GET only'.format(request.method)
         ))
 
-    # 查看用户是否有创作者权限
-    uid = ordinary_user.uid
-
-    communities_ids = models.UserFollowCommunity.objects.filter(ordinaryUser=uid).values_list('community', flat=True)
-    ids = list(communities_ids)
-    communities = models.Community.objects.filter(id__in=ids).values_list('tube', type,
-                                                                          flat=True)  # 使用 values_list 获取社群的名称列表
-    print(communities)
     return JsonResponse(Result.success(
         {
-            'ids': list(communities_ids),
+            'list': getTopCommunities(5),
         }
     ))
 
 
+# 最近互动的统计天数，以及互动次数达到各个值时的星级（1~5 星）
+RECENT_INTERACTION_DAYS = 30
+_INTERACTION_STAR_THRESHOLDS = (1, 3, 10, 30, 100)
+
+
+def _recentInteractionCount(since):
+    # 用户自 since 起在社群中的发帖、帖子评论、帖子点赞数之和，作为相关子查询与关注记录在同一条查询中取出
+    interaction_querysets = [
+        models.Blog.objects.filter(
+            ordinaryUser=OuterRef('ordinaryUser'), community=OuterRef('community'), create_time__gte=since,
+        ),
+        models.BlogComment.objects.filter(
+            ordinaryUser=OuterRef('ordinaryUser'), blog__community=OuterRef('community'), release_time__gte=since,
+        ),
+        models.BlogLike.objects.filter(
+            ordinaryUser=OuterRef('ordinaryUser'), blog__community=OuterRef('community'), like_time__gte=since,
+        ),
+    ]
+
+    return sum(
+        Coalesce(Subquery(
+            interaction_queryset.order_by().values('ordinaryUser').annotate(count=Count('pk')).values('count')
+        ), 0)
+        for interaction_queryset in interaction_querysets
+    )
+
+
 # 获取用户关注所有社群,按时间排序
+@jwt_required
 def getUserAllCommunity(request):
     if request.method != 'GET':
         return JsonResponse(Result.failure(
@@ -172,42 +208,196 @@ def getUserAllCommunity(request):
             message='Method {} not allowed, GET only'.format(request.method)
         ))
 
-    encode_jwt = request.GET.get('encode_jwt')
-    # print(encode_jwt)
-    if encode_jwt is None or encode_jwt == '':
+    ordinary_user = request.user_ctx.ordinary_user
+
+    # 社群信息通过 select_related 一并取出，最近互动数在同一条查询中统计
+    follow_queryset = models.UserFollowCommunity.objects.filter(
+        ordinaryUser=ordinary_user,
+    ).select_related(
+        'community',
+    ).only(
+        'id', 'follow_time',
+        'community__cid', 'community__cname', 'community__music_type', 'community__profile_picture_url',
+        'community__introduction', 'community__member_count',
+    ).annotate(
+        recent_interaction_count=_recentInteractionCount(
+            timezone.now() - timedelta(days=RECENT_INTERACTION_DAYS),
+        ),
+    )
+
+    try:
+        follow_page, next_cursor = paginateQueryset(
+            queryset=follow_queryset,
+            ordering=['-follow_time', '-id'],
+            cursor=request.GET.get('cursor'),
+            limit=parseLimit(request.GET.get('limit')),
+        )
+    except ValueError:
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid cursor'
         ))
 
-    ordinary_user = decodeJwtToken(encode_jwt)
+    return JsonResponse(Result.success(
+        {
+            'all_community': [
+                {
+                    "community_cid": follow_iterator.community.cid,
+                    "community_name": follow_iterator.community.cname,
+                    "community_style": follow_iterator.community.music_type,
+                    "community_picture_url": follow_iterator.community.profile_picture_url,
+                    "community_description": follow_iterator.community.introduction,
+                    "community_member_count": follow_iterator.community.member_count,
+                    "community_follow_time": follow_iterator.follow_time,
+                    "community_recent_interaction_count": follow_iterator.recent_interaction_count,
+                    "community_recent_interaction_star_rating": sum(
+                        follow_iterator.recent_interaction_count >= threshold
+                        for threshold in _INTERACTION_STAR_THRESHOLDS
+                    ),
+                }
+                for follow_iterator in follow_page
+            ],
+            'next_cursor': next_cursor,
+        }
+    ))
+
 
-    # jwt 令牌解析失败
-    if ordinary_user is None:
+# 在关注的社群中发帖
+@csrf_exempt
+@jwt_required
+def createBlog(request):
+    if request.method != 'POST':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
+        ))
+
+    ordinary_user = request.user_ctx.ordinary_user
+
+    community_cid = request.POST.get('community_cid')
+    content = request.POST.get('content')
+
+    if not content:
         return JsonResponse(Result.failure(
             code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    followed_communities = models.UserFollowCommunity.objects.filter(
-        ordinaryUser=ordinary_user
-    ).values_list('community', 'follow_time')
-
-    community_ids = [info[0] for info in followed_communities]
-    followe_time = [info[1] for info in followed_communities]
-    # 使用获得的 IDs 从 Community 表中检索详绑信息
-    communities = models.Community.objects.filter(cid__in=community_ids)
-    # 准备返回的数据，例如：
-    communitys = [{
-        "community_name": community.cname,
-        "community_style": community.music_type,
-        "community_picture_url": community.profile_picture_url,
-        "community_description": community.introduction,
-        "community_follow_time": time,
-        "community_recent_interaction_star_rating": 4,
-    } for community,time in zip(communities,followe_time)]
+            message='empty content',
+        ))
+
+    if not models.UserFollowCommunity.objects.filter(ordinaryUser=ordinary_user, community_id=community_cid).exists():
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='community not followed',
+        ))
+
+    with transaction.atomic():
+        blog = models.Blog.objects.create(
+            ordinaryUser=ordinary_user,
+            community_id=community_cid,
+        )
+        recordCommunityActivity(community_cid, ACTIVITY_POST)
+
+        # 帖子内容以 Markdown 文件在后台上传，完成后写回 content_url 并写入关注者的时间线，大社群在读取时合并
+        upload_job = submitUpload(
+            request_file=ContentFile(content.encode('utf-8'), name='content.md'),
+            extension='.md',
+            target='blog_content',
+            target_id=blog.bid,
+            ordinary_user=ordinary_user,
+        )
+
+    return JsonResponse(Result.success({'bid': blog.bid, 'upload_job_id': upload_job.jid}))
+
+
+# 用户关注的社群的帖子动态，按发帖时间从新到旧
+@jwt_required
+def queryCommunityFeed(request):
+    if request.method != 'GET':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, GET only'.format(request.method)
+        ))
+
+    try:
+        blog_bid_list, next_cursor = queryFeedPage(
+            ordinary_user=request.user_ctx.ordinary_user,
+            cursor=request.GET.get('cursor'),
+            limit=parseLimit(request.GET.get('limit')),
+        )
+    except ValueError:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid cursor'
+        ))
+
+    # 一条查询取出本页帖子及其社群和发帖者
+    blog_dict = models.Blog.objects.select_related(
+        'community', 'ordinaryUser',
+    ).only(
+        'bid', 'content_url', 'likes', 'create_time',
+        'community__cid', 'community__cname',
+        'ordinaryUser__uid', 'ordinaryUser__username', 'ordinaryUser__profile_picture_url',
+    ).in_bulk(blog_bid_list)
+
     return JsonResponse(Result.success(
         {
-            'all_community': communitys
+            'list': [
+                {
+                    'bid': blog.bid,
+                    'community': {
+                        'cid': blog.community.cid,
+                        'name': blog.community.cname,
+                    },
+                    'user': {
+                        'uid': blog.ordinaryUser.uid,
+                        'username': blog.ordinaryUser.username,
+                        'profile_picture_url': blog.ordinaryUser.profile_picture_url,
+                    },
+                    'content_url': blog.content_url,
+                    'likes': blog.likes,
+                    'create_time': blog.create_time.strftime('%Y-%m-%d %H:%M:%S'),
+                }
+                for blog in (blog_dict[blog_bid] for blog_bid in blog_bid_list if blog_bid in blog_dict)
+            ],
+            'next_cursor': next_cursor,
         }
     ))
+
+
+# 评论帖子
+@csrf_exempt
+@jwt_required
+def createBlogComment(request):
+    if request.method != 'POST':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
+        ))
+
+    ordinary_user = request.user_ctx.ordinary_user
+
+    blog_bid = request.POST.get('blog_bid')
+    content = request.POST.get('content')
+
+    dst_blog = models.Blog.objects.filter(bid=blog_bid).only('bid', 'community_id').first()
+
+    if dst_blog is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='blog not found'
+        ))
+
+    if not content:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='empty content',
+        ))
+
+    with transaction.atomic():
+        new_blog_comment = models.BlogComment.objects.create(
+            blog=dst_blog,
+            ordinaryUser=ordinary_user,
+            comment=content,
+        )
+        recordCommunityActivity(dst_blog.community_id, ACTIVITY_COMMENT)
+
+    return JsonResponse(Result.success(new_blog_comment.bcid))
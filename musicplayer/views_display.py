@@ -1,16 +1,54 @@
-import uuid
-
-from django.db.models import Q
-from django.http import JsonResponse
+import base64
+import hashlib
+import mimetypes
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
 
-from utils.modelOperation import decodeJwtToken
-from utils.oss2Utils import OSS2Utils
+from utils.audioStream import RangeFile, RangeNotSatisfiable, getStreamCache, parseRange
+from utils.batchOperation import addSongsToSongList, followProducers, importSongsToSongList
+from utils.charts import CHART_PRODUCER, CHART_SONG, WEIGHT_COMMENT, WEIGHT_FOLLOW, WEIGHT_PLAYLIST_ADD, recordActivity
+from utils.counters import adjustCounter
+from utils.entityCache import ENTITY_PRODUCER, ENTITY_SONG, ENTITY_SONGLIST, getCachedPayload, invalidateEntity
+from utils.jwtAuth import jwt_required
+from utils.lruCache import TTLLRUCache
+from utils.modelOperation import producerInfoAnnotations
+from utils.pagination import paginateQueryset, parseLimit, encodeCursor, decodeOffsetCursor
 from utils.result import Result
-from utils import utils
+from utils.songListOrder import appendPositions, iterSongListLines, moveSongs
+from utils.songSearch import getSongSearchBackend
+from utils.uploadPipeline import getUploadStorage, submitUpload
+from utils import audioTranscode, imagePipeline, utils
 from musicplayer import models, models_sqlview
 
 
+def _loadProducerInfo(producer_pid):
+    producer_view = models_sqlview.ProducerView.objects.filter(pid=producer_pid).annotate(
+        follower_count=Subquery(models.Producer.objects.filter(pid=OuterRef('pid')).values('follower_count')),
+    ).first()
+
+    if producer_view is None:
+        return None
+
+    return {
+        'name': producer_view.username,
+        'profile_picture_url': producer_view.profile_picture_url,
+        'gender': producer_view.gender,
+        'introduction': producer_view.introduction,
+
+        'ptype': producer_view.ptype,
+        'title': producer_view.title,
+        'authentication': producer_view.authentication,
+
+        'follower_count': producer_view.follower_count,
+    }
+
+
 def queryProducerById(request):
     if request.method != 'GET':
         return JsonResponse(Result.failure(
@@ -20,23 +58,72 @@ def queryProducerById(request):
 
     producer_pid = request.GET.get('producer_pid')
 
-    producer_view = models_sqlview.ProducerView.objects.filter(pid=producer_pid).first()
+    return JsonResponse(Result.success(getCachedPayload(
+        entity=ENTITY_PRODUCER,
+        entity_id=producer_pid,
+        loader=lambda: _loadProducerInfo(producer_pid),
+        variant='public',
+    )))
 
-    if producer_view is None:
-        return JsonResponse(Result.success(None))
 
-    return JsonResponse(Result.success(
-        {
-            'name': producer_view.username,
-            'profile_picture_url': producer_view.profile_picture_url,
-            'gender': producer_view.gender,
-            'introduction': producer_view.introduction,
-
-            'ptype': producer_view.ptype,
-            'title': producer_view.title,
-            'authentication': producer_view.authentication
-        }
-    ))
+def _loadSongInfo(song_sid):
+    # 专辑和创作者信息在同一条查询中 JOIN 取出
+    song_info = models.Song.objects.filter(sid=song_sid).select_related(
+        'album',
+    ).annotate(
+        **producerInfoAnnotations(),
+    ).first()
+
+    if song_info is None:
+        return None
+
+    return {
+        'producer': {
+            'pid': song_info.producer_id,
+            'name': song_info.producer_name,
+            'profile_picture_url': song_info.producer_profile_picture_url,
+        },
+
+        'album': {
+            'aid': song_info.album.aid,
+            'cover_url': song_info.album.cover_url
+        },
+
+        'audio_url': song_info.audio_url,
+        'lyrics_url': song_info.lyrics_url,
+
+        'duration_ms': song_info.duration_ms,
+        'sample_rate': song_info.sample_rate,
+        'bitrate': song_info.bitrate,
+        'loudness_db': song_info.loudness_db,
+        # 每个字节一个峰值，base64 编码后返回
+        'waveform_peaks': (
+            base64.b64encode(song_info.waveform_peaks).decode() if song_info.waveform_peaks is not None else None
+        ),
+
+        # 按码率从低到高排列
+        'renditions': [
+            {
+                'quality': rendition.quality,
+                'codec': rendition.codec,
+                'bitrate': rendition.bitrate,
+                'url': rendition.url,
+            }
+            for rendition in models.SongRendition.objects.filter(song_id=song_info.sid).order_by('bitrate', 'quality')
+        ],
+
+        'sname': song_info.sname,
+        'stype': song_info.stype,
+        'sversion': song_info.sversion,
+
+        'language_type': song_info.language_type,
+        'music_style': song_info.music_style,
+        'metadata': song_info.metadata,
+        'introduction': song_info.introduction,
+
+        'comment_count': song_info.comment_count,
+        'songlist_count': song_info.songlist_count,
+    }
 
 
 def querySongById(request):
@@ -48,72 +135,185 @@ def querySongById(request):
 
     song_sid = request.GET.get('song_sid')
 
-    song_info = models.Song.objects.filter(sid=song_sid).extra(
-        select={
-            'producer_name': 'producer_view.username',
-            'producer_profile_picture_url': 'producer_view.profile_picture_url',
-        },
-        tables=['producer_view'],
-        where=['musicplayer_song.producer_id = producer_view.pid']
-    ).first()
+    song_info = getCachedPayload(
+        entity=ENTITY_SONG,
+        entity_id=song_sid,
+        loader=lambda: _loadSongInfo(song_sid),
+    )
 
-    if song_info is None:
-        return JsonResponse(Result.success(None))
+    if song_info is not None:
+        # 播放地址按请求选择，不进入缓存
+        song_info = dict(song_info, stream_url=_chooseStreamUrl(
+            song_info,
+            quality=request.GET.get('quality'),
+            save_data=request.headers.get('Save-Data') == 'on',
+        ))
 
-    return JsonResponse(Result.success(
-        {
-            'producer': {
-                'pid': song_info.producer_id,
-                'name': song_info.producer_name,
-                'profile_picture_url': song_info.producer_profile_picture_url,
-            },
+    return JsonResponse(Result.success(song_info))
 
-            'album': {
-                'aid': song_info.album.aid,
-                'cover_url': song_info.album.cover_url
-            },
 
-            'audio_url': song_info.audio_url,
-            'lyrics_url': song_info.lyrics_url,
+def _chooseStreamUrl(song_info, quality, save_data) -> str | None:
+    """
+    :param song_info: _loadSongInfo 的结果
+    :param quality: 客户端要求的规格，如 low、hls
+    :param save_data: 客户端开启了省流量模式（请求头 Save-Data: on）
+    :return: 客户端要求的规格；没有要求时省流量模式用最低码率，否则用最高码率的单文件；还没有转码结果时返回原始音频
+    """
+    rendition_url_dict = {rendition['quality']: rendition['url'] for rendition in song_info['renditions']}
 
-            'sname': song_info.sname,
-            'stype': song_info.stype,
-            'sversion': song_info.sversion,
+    if quality in rendition_url_dict:
+        return rendition_url_dict[quality]
 
-            'language_type': song_info.language_type,
-            'music_style': song_info.music_style,
-            'metadata': song_info.metadata,
-            'introduction': song_info.introduction,
-        }
-    ))
+    file_renditions = [
+        rendition for rendition in song_info['renditions'] if rendition['quality'] != audioTranscode.HLS_RENDITION
+    ]
 
+    if not file_renditions:
+        return song_info['audio_url']
 
-@csrf_exempt
-def createSongList(request):
-    if request.method != 'POST':
+    return file_renditions[0 if save_data else -1]['url']
+
+
+# oss 中的文件路径带有 uuid，上传后内容不变，文件大小可以长期缓存，未命中磁盘缓存时不必每次 HEAD
+_object_size_cache = TTLLRUCache(max_size=10000, ttl=3600)
+
+
+def _objectSize(storage, oss_key) -> int | None:
+    object_size = _object_size_cache.get(oss_key)
+
+    if object_size is None:
+        object_size = storage.objectSize(oss_key)
+
+        if object_size is not None:
+            _object_size_cache.set(oss_key, object_size)
+
+    return object_size
+
+
+def streamSong(request):
+    """
+    音频流代理：支持 Range / If-Range 断点续传和拖动进度条，带 ETag 和 Cache-Control，CDN 可以直接缓存。
+    热门音频从本地磁盘缓存发送，其余从 oss 分块转发；quality 参数同 querySongById，HLS 播放列表不经过代理
+    """
+    if request.method not in ('GET', 'HEAD'):
         return JsonResponse(Result.failure(
             code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
-            message='Method {} not allowed, POST only'.format(request.method)
+            message='Method {} not allowed, GET only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
+    song_sid = request.GET.get('song_sid')
+    quality = request.GET.get('quality')
 
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
+    if quality == audioTranscode.HLS_RENDITION:
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='hls playlist is not streamed through this api'
         ))
 
-    ordinary_user = decodeJwtToken(encode_jwt)
+    song_info = getCachedPayload(
+        entity=ENTITY_SONG,
+        entity_id=song_sid,
+        loader=lambda: _loadSongInfo(song_sid),
+    )
 
-    # jwt 令牌解析失败
-    if ordinary_user is None:
+    if song_info is None:
         return JsonResponse(Result.failure(
             code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
+            message='song not found'
+        ))
+
+    stream_url = _chooseStreamUrl(song_info, quality, save_data=request.headers.get('Save-Data') == 'on')
+
+    storage = getUploadStorage()
+    oss_key = storage.objectKey(stream_url)
+
+    if oss_key is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='song audio not found'
+        ))
+
+    stream_cache = getStreamCache()
+    cached_file = stream_cache.open(oss_key)
+
+    if cached_file is not None:
+        object_size = os.fstat(cached_file.fileno()).st_size
+    else:
+        object_size = _objectSize(storage, oss_key)
+
+        if object_size is None:
+            return JsonResponse(Result.failure(
+                code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+                message='song audio not found'
+            ))
+
+    etag = '"{}"'.format(hashlib.sha1('{}:{}'.format(oss_key, object_size).encode()).hexdigest())
+
+    cache_headers = {
+        'ETag': etag,
+        'Cache-Control': 'public, max-age={}'.format(settings.STREAM_MAX_AGE),
+        'Accept-Ranges': 'bytes',
+    }
+
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        if cached_file is not None:
+            cached_file.close()
+
+        return HttpResponseNotModified(headers=cache_headers)
+
+    # If-Range 与当前版本不符时（文件已更换），忽略 Range 返回整个文件
+    if_range = request.headers.get('If-Range')
+
+    try:
+        byte_range = parseRange(request.headers.get('Range'), object_size) if if_range in (None, etag) else None
+    except RangeNotSatisfiable:
+        if cached_file is not None:
+            cached_file.close()
+
+        return HttpResponse(status=416, headers=dict(cache_headers, **{
+            'Content-Range': 'bytes */{}'.format(object_size),
+        }))
+
+    start, end = byte_range or (0, object_size - 1)
+    content_type = mimetypes.guess_type(oss_key)[0] or 'application/octet-stream'
+
+    if request.method == 'HEAD':
+        # HEAD 只返回响应头，大小取自磁盘缓存或对象大小缓存，不打开 oss 对象，也不计入磁盘缓存的未命中
+        if cached_file is not None:
+            cached_file.close()
+
+        response = HttpResponse(content_type=content_type, headers=cache_headers)
+    elif cached_file is not None:
+        response = FileResponse(
+            RangeFile(cached_file, start, end - start + 1), content_type=content_type, headers=cache_headers,
+        )
+    else:
+        stream_cache.recordMiss(oss_key, lambda local_path: storage.download(oss_key, local_path))
+        response = StreamingHttpResponse(
+            storage.readRange(oss_key, start, end, settings.STREAM_CHUNK_SIZE),
+            content_type=content_type, headers=cache_headers,
+        )
+
+    response['Content-Length'] = end - start + 1
+
+    if byte_range is not None:
+        response.status_code = 206
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, object_size)
+
+    return response
+
+
+@csrf_exempt
+@jwt_required
+def createSongList(request):
+    if request.method != 'POST':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
         ))
 
+    ordinary_user = request.user_ctx.ordinary_user
+
     songlist_title = request.POST.get('songlist_title')
     cover_picture = request.FILES.get('cover_picture')
 
@@ -122,7 +322,7 @@ def createSongList(request):
             ordinaryUser=ordinary_user,
             title=songlist_title,
         )
-        return JsonResponse(Result.success(new_songlist.slid))
+        return JsonResponse(Result.success({'slid': new_songlist.slid, 'upload_job_id': None}))
 
     cover_picture_extension = utils.checkFileExtension(
         filename=cover_picture.name,
@@ -136,32 +336,32 @@ def createSongList(request):
             message='invalid file extension'
         ))
 
-    # 生成uuid
-    oss_filename = uuid.uuid4().hex + cover_picture_extension
-
-    # 调用云服务上传
-    upload_cover_url = OSS2Utils.upload(
-        request_file=cover_picture,
-        oss_filename=oss_filename,
-        oss_folder=['songlist', 'cover']
-    )
-
-    if upload_cover_url is None:
+    # 按文件头检验图片格式，扩展名可以伪造
+    if not imagePipeline.isImageFile(cover_picture):
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_INTERNAL_SERVER_ERROR,
-            message='upload file failed',
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='invalid image file',
         ))
 
     new_songlist = models.SongList.objects.create(
         ordinaryUser=ordinary_user,
         title=songlist_title,
-        cover_picture_url=upload_cover_url,
     )
 
-    return JsonResponse(Result.success(new_songlist.slid))
+    # 后台上传封面，完成后写回 cover_picture_url
+    upload_job = submitUpload(
+        request_file=cover_picture,
+        extension=cover_picture_extension,
+        target='songlist_cover',
+        target_id=new_songlist.slid,
+        ordinary_user=ordinary_user,
+    )
+
+    return JsonResponse(Result.success({'slid': new_songlist.slid, 'upload_job_id': upload_job.jid}))
 
 
 @csrf_exempt
+@jwt_required
 def modifySongList(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -169,23 +369,7 @@ def modifySongList(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
+    ordinary_user = request.user_ctx.ordinary_user
 
     songlist_slid = request.POST.get('songlist_slid')
     songlist_title = request.POST.get('songlist_title')
@@ -208,7 +392,8 @@ def modifySongList(request):
 
     if songlist_cover is None:
         dst_songlist.save()
-        return JsonResponse(Result.success())
+        invalidateEntity(ENTITY_SONGLIST, dst_songlist.slid)
+        return JsonResponse(Result.success({'upload_job_id': None}))
 
     songlist_cover_extension = utils.checkFileExtension(
         filename=songlist_cover.name,
@@ -222,89 +407,128 @@ def modifySongList(request):
             message='invalid file extension'
         ))
 
-    # 生成uuid
-    oss_filename = uuid.uuid4().hex + songlist_cover_extension
-
-    # 调用云服务上传
-    upload_cover_url = OSS2Utils.upload(
-        request_file=songlist_cover,
-        oss_filename=oss_filename,
-        oss_folder=['songlist', 'cover']
-    )
-
-    if upload_cover_url is None:
+    # 按文件头检验图片格式，扩展名可以伪造
+    if not imagePipeline.isImageFile(songlist_cover):
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_INTERNAL_SERVER_ERROR,
-            message='upload file failed',
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='invalid image file',
         ))
 
-    dst_songlist.cover_picture_url = upload_cover_url
-
     dst_songlist.save()
+    invalidateEntity(ENTITY_SONGLIST, dst_songlist.slid)
 
-    return JsonResponse(Result.success())
-
+    # 后台上传封面，完成后写回 cover_picture_url
+    upload_job = submitUpload(
+        request_file=songlist_cover,
+        extension=songlist_cover_extension,
+        target='songlist_cover',
+        target_id=dst_songlist.slid,
+        ordinary_user=ordinary_user,
+    )
 
-def querySongList(request):
-    if request.method != 'GET':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
-            message='Method {} not allowed, GET only'.format(request.method)
-        ))
+    return JsonResponse(Result.success({'upload_job_id': upload_job.jid}))
 
-    songlist_sid = request.GET.get('songlist_slid')
 
+def _loadSongListInfo(songlist_slid, cursor, limit):
+    """
+    :raise ValueError: 游标格式不合法
+    """
+    # 歌单创建者通过 select_related 一并取出
     dst_songlist = models.SongList.objects.filter(
-        slid=songlist_sid,
+        slid=songlist_slid,
+    ).select_related(
+        'ordinaryUser',
     ).first()
 
     if dst_songlist is None:
-        return JsonResponse(Result.success(None))
-
-    # 从关联表中查询所有的song
-
-    dst_song_queryset = models.SongAndSongList.objects.filter(
-        songList=dst_songlist
-    ).all()
+        return None
+
+    # 关联表、歌曲、专辑、创作者在一条查询中 JOIN，按用户排列的顺序分页
+    song_queryset = models.SongAndSongList.objects.filter(
+        songList_id=dst_songlist.slid,
+    ).select_related(
+        'song__album',
+    ).annotate(
+        **producerInfoAnnotations('song__producer'),
+    ).only(
+        'id', 'position',
+        'song__sid', 'song__sname', 'song__producer_id', 'song__duration_ms',
+        'song__album__aid', 'song__album__aname', 'song__album__cover_url', 'song__album__cover_thumb_url',
+    )
 
-    # 从歌曲简要信息列表中查询song
+    song_page, next_cursor = paginateQueryset(
+        queryset=song_queryset,
+        ordering=['position', 'id'],
+        cursor=cursor,
+        limit=limit,
+    )
 
-    song_info_list = models_sqlview.SongView.objects.filter(
-        sid__in=[songlist_iterator.song_id for songlist_iterator in dst_song_queryset]
-    ).all()
+    return {
+        'title': dst_songlist.title,
+        'cover_picture_url': dst_songlist.cover_picture_url,
+        # 缩略图尚未生成时返回原图
+        'cover_thumb_url': dst_songlist.cover_thumb_url or dst_songlist.cover_picture_url,
+        'create_time': dst_songlist.create_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'update_time': dst_songlist.update_time.strftime('%Y-%m-%d %H:%M:%S'),
+
+        'user': {
+            'uid': dst_songlist.ordinaryUser.uid,
+            'username': dst_songlist.ordinaryUser.username,
+            'profile_picture_url': dst_songlist.ordinaryUser.profile_picture_url,
+        },
 
-    return JsonResponse(Result.success(
-        {
-            'title': dst_songlist.title,
-            'cover_picture_url': dst_songlist.cover_picture_url,
-            'create_time': dst_songlist.create_time.strftime('%Y-%m-%d %H:%M:%S'),
-            'update_time': dst_songlist.update_time.strftime('%Y-%m-%d %H:%M:%S'),
+        'song_list': [
+            {
+                'sid': songlist_iterator.song.sid,
+                'sname': songlist_iterator.song.sname,
+                'duration_ms': songlist_iterator.song.duration_ms,
+
+                'album_aid': songlist_iterator.song.album.aid,
+                'album_aname': songlist_iterator.song.album.aname,
+                'album_cover_url': songlist_iterator.song.album.cover_url,
+                'album_cover_thumb_url': (
+                    songlist_iterator.song.album.cover_thumb_url or songlist_iterator.song.album.cover_url
+                ),
+
+                'producer_pid': songlist_iterator.song.producer_id,
+                'producer_username': songlist_iterator.producer_name,
+            }
+            for songlist_iterator in song_page
+        ],
+        'next_cursor': next_cursor,
+    }
 
-            'user': {
-                'uid': dst_songlist.ordinaryUser.uid,
-                'username': dst_songlist.ordinaryUser.username,
-                'profile_picture_url': dst_songlist.ordinaryUser.profile_picture_url,
-            },
 
-            'song_list': [
-                {
-                    'sid': song_iterator.sid,
-                    'sname': song_iterator.sname,
+def querySongList(request):
+    if request.method != 'GET':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, GET only'.format(request.method)
+        ))
 
-                    'album_aid': song_iterator.aid,
-                    'album_aname': song_iterator.aname,
-                    'album_cover_url': song_iterator.cover_url,
+    songlist_slid = request.GET.get('songlist_slid')
+    cursor = request.GET.get('cursor')
+    limit = parseLimit(request.GET.get('limit'))
+
+    # 每一页作为歌单的一个变体缓存，歌单修改后所有页一起失效
+    try:
+        songlist_info = getCachedPayload(
+            entity=ENTITY_SONGLIST,
+            entity_id=songlist_slid,
+            loader=lambda: _loadSongListInfo(songlist_slid, cursor, limit),
+            variant='{}:{}'.format(cursor or '', limit),
+        )
+    except ValueError:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid cursor'
+        ))
 
-                    'producer_pid': song_iterator.pid,
-                    'producer_username': song_iterator.username,
-                }
-                for song_iterator in song_info_list
-            ],
-        }
-    ))
+    return JsonResponse(Result.success(songlist_info))
 
 
 @csrf_exempt
+@jwt_required
 def addSongToSongList(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -312,23 +536,7 @@ def addSongToSongList(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
+    ordinary_user = request.user_ctx.ordinary_user
 
     songlist_slid = request.POST.get('songlist_slid')
     song_sid = request.POST.get('song_sid')
@@ -361,40 +569,179 @@ def addSongToSongList(request):
             message='record already exists'
         ))
 
-    models.SongAndSongList.objects.create(
-        songList=dst_songlist,
-        song=dst_song,
-    )
+    with transaction.atomic():
+        models.SongAndSongList.objects.create(
+            songList=dst_songlist,
+            song=dst_song,
+            position=appendPositions(dst_songlist, 1)[0],
+        )
+        adjustCounter('song_songlist', dst_song.sid, 1)
+
+    invalidateEntity(ENTITY_SONGLIST, dst_songlist.slid)
+    invalidateEntity(ENTITY_SONG, dst_song.sid)
+    recordActivity(CHART_SONG, {dst_song.sid: WEIGHT_PLAYLIST_ADD})
 
     return JsonResponse(Result.success())
 
 
 @csrf_exempt
-def dropSongToSongList(request):
+@jwt_required
+def batchAddSongToSongList(request):
+    """
+    一次把多首歌曲加入歌单，参数 song_sids 为歌曲id的 JSON 数组。
+    返回每首歌曲的结果：created 新加入、exists 已在歌单中、not_found 歌曲不存在、invalid id格式错误
+    """
+    if request.method != 'POST':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
+        ))
+
+    ordinary_user = request.user_ctx.ordinary_user
+
+    dst_songlist = models.SongList.objects.filter(
+        slid=request.POST.get('songlist_slid'),
+        ordinaryUser=ordinary_user,
+    ).first()
+
+    if dst_songlist is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='song list not found',
+        ))
+
+    song_sid_list = utils.jsonArrayToList(request.POST.get('song_sids') or '')
+
+    if song_sid_list is None or len(song_sid_list) > settings.BATCH_OPERATION_MAX_ITEMS:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='song_sids should be a json array of at most {} ids'.format(settings.BATCH_OPERATION_MAX_ITEMS)
+        ))
+
+    return JsonResponse(Result.success({'results': addSongsToSongList(dst_songlist, song_sid_list)}))
+
+
+@csrf_exempt
+@jwt_required
+def reorderSongList(request):
+    """
+    把 song_sids（歌曲id的 JSON 数组）按顺序连续地移动到 after_sid 之后，after_sid 为空时移动到歌单开头。
+    通常只修改被移动的歌曲
+    """
     if request.method != 'POST':
         return JsonResponse(Result.failure(
             code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
+    ordinary_user = request.user_ctx.ordinary_user
+
+    dst_songlist = models.SongList.objects.filter(
+        slid=request.POST.get('songlist_slid'),
+        ordinaryUser=ordinary_user,
+    ).first()
+
+    if dst_songlist is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='song list not found',
+        ))
+
+    song_sid_list = utils.jsonArrayToList(request.POST.get('song_sids') or '')
+
+    if song_sid_list is None or len(song_sid_list) > settings.BATCH_OPERATION_MAX_ITEMS:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='song_sids should be a json array of at most {} ids'.format(settings.BATCH_OPERATION_MAX_ITEMS)
+        ))
+
+    try:
+        with transaction.atomic():
+            updated_count = moveSongs(dst_songlist, song_sid_list, request.POST.get('after_sid'))
+    except ValueError as e:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message=str(e),
+        ))
+
+    invalidateEntity(ENTITY_SONGLIST, dst_songlist.slid)
+
+    return JsonResponse(Result.success({'updated_count': updated_count}))
+
+
+def exportSongList(request):
+    """
+    按歌单顺序以 JSON-lines 格式流式下载歌单中的歌曲，每行一首
+    """
+    if request.method != 'GET':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, GET only'.format(request.method)
+        ))
+
+    dst_songlist = models.SongList.objects.filter(slid=request.GET.get('songlist_slid')).first()
+
+    if dst_songlist is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='song list not found',
+        ))
+
+    return StreamingHttpResponse(
+        iterSongListLines(dst_songlist),
+        content_type='application/x-ndjson; charset=utf-8',
+        headers={'Content-Disposition': 'attachment; filename="{}.jsonl"'.format(dst_songlist.slid)},
+    )
+
 
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
+@csrf_exempt
+@jwt_required
+def importSongList(request):
+    """
+    把 exportSongList 导出的 JSON-lines 文件 songlist_file 中的歌曲按顺序追加到歌单末尾，
+    返回各结果的行数，如 {'created': 10, 'exists': 2, 'truncated': False}
+    """
+    if request.method != 'POST':
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    ordinary_user = decodeJwtToken(encode_jwt)
+    ordinary_user = request.user_ctx.ordinary_user
 
-    # jwt 令牌解析失败
-    if ordinary_user is None:
+    dst_songlist = models.SongList.objects.filter(
+        slid=request.POST.get('songlist_slid'),
+        ordinaryUser=ordinary_user,
+    ).first()
+
+    if dst_songlist is None:
         return JsonResponse(Result.failure(
             code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
+            message='song list not found',
         ))
 
+    songlist_file = request.FILES.get('songlist_file')
+
+    if songlist_file is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='songlist_file is required',
+        ))
+
+    return JsonResponse(Result.success(importSongsToSongList(dst_songlist, songlist_file)))
+
+
+@csrf_exempt
+@jwt_required
+def dropSongToSongList(request):
+    if request.method != 'POST':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
+        ))
+
+    ordinary_user = request.user_ctx.ordinary_user
+
     songlist_slid = request.POST.get('songlist_slid')
     song_sid = request.POST.get('song_sid')
 
@@ -426,15 +773,22 @@ def dropSongToSongList(request):
             message='no such record'
         ))
 
-    models.SongAndSongList.objects.filter(
-        songList=dst_songlist,
-        song=dst_song,
-    ).delete()
+    with transaction.atomic():
+        # 并发删除同一条记录时只有真正删除的请求减少计数
+        deleted_count, _ = models.SongAndSongList.objects.filter(
+            songList=dst_songlist,
+            song=dst_song,
+        ).delete()
+        adjustCounter('song_songlist', dst_song.sid, -deleted_count)
+
+    invalidateEntity(ENTITY_SONGLIST, dst_songlist.slid)
+    invalidateEntity(ENTITY_SONG, dst_song.sid)
 
     return JsonResponse(Result.success())
 
 
 @csrf_exempt
+@jwt_required
 def createSongComment(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -442,23 +796,7 @@ def createSongComment(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
+    ordinary_user = request.user_ctx.ordinary_user
 
     song_id = request.POST.get('song_sid')
 
@@ -472,16 +810,22 @@ def createSongComment(request):
 
     comment_content = request.POST.get('content')
 
-    new_song_comment = models.SongComment.objects.create(
-        song=dst_song,
-        ordinaryUser=ordinary_user,
-        comment=comment_content,
-    )
+    with transaction.atomic():
+        new_song_comment = models.SongComment.objects.create(
+            song=dst_song,
+            ordinaryUser=ordinary_user,
+            comment=comment_content,
+        )
+        adjustCounter('song_comment', dst_song.sid, 1)
+
+    invalidateEntity(ENTITY_SONG, dst_song.sid)
+    recordActivity(CHART_SONG, {dst_song.sid: WEIGHT_COMMENT})
 
     return JsonResponse(Result.success(new_song_comment.scid))
 
 
 @csrf_exempt
+@jwt_required
 def dropSongComment(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -489,30 +833,14 @@ def dropSongComment(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
+    ordinary_user = request.user_ctx.ordinary_user
 
     song_comment_scid = request.POST.get('song_comment_scid')
 
     dst_song_comment = models.SongComment.objects.filter(
         scid=song_comment_scid,
         ordinaryUser=ordinary_user,
-    )
+    ).first()
 
     if dst_song_comment is None:
         return JsonResponse(Result.failure(
@@ -520,11 +848,22 @@ def dropSongComment(request):
             message='song comment not found'
         ))
 
-    dst_song_comment.delete()
+    with transaction.atomic():
+        deleted_count, _ = models.SongComment.objects.filter(scid=dst_song_comment.scid).delete()
+        adjustCounter('song_comment', dst_song_comment.song_id, -deleted_count)
+
+    invalidateEntity(ENTITY_SONG, dst_song_comment.song_id)
 
     return JsonResponse(Result.success())
 
 
+# 评论列表的排序，各有对应的联合索引
+_SONG_COMMENT_ORDERINGS = {
+    'time': ['-release_time', '-scid'],
+    'likes': ['-likes', '-scid'],
+}
+
+
 def querySongComment(request):
     if request.method != 'GET':
         return JsonResponse(Result.failure(
@@ -533,16 +872,43 @@ def querySongComment(request):
         ))
 
     song_sid = request.GET.get('song_sid')
+    # time 按发布时间从新到旧，likes 为热门评论，按点赞数从高到低
+    order = request.GET.get('order', 'time')
 
-    dst_song = models.Song.objects.filter(sid=song_sid).first()
+    if order not in _SONG_COMMENT_ORDERINGS:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid order'
+        ))
 
-    if dst_song is None:
+    if not models.Song.objects.filter(sid=song_sid).exists():
         return JsonResponse(Result.failure(
             code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
             message='no such song'
         ))
 
-    song_comment_queryset = models.SongComment.objects.filter(song=dst_song).all()
+    # 评论者信息通过 select_related 一并取出，只读取需要的列
+    song_comment_queryset = models.SongComment.objects.filter(
+        song_id=song_sid,
+    ).select_related(
+        'ordinaryUser',
+    ).only(
+        'scid', 'comment', 'likes', 'release_time',
+        'ordinaryUser__uid', 'ordinaryUser__username', 'ordinaryUser__profile_picture_url',
+    )
+
+    try:
+        song_comment_page, next_cursor = paginateQueryset(
+            queryset=song_comment_queryset,
+            ordering=_SONG_COMMENT_ORDERINGS[order],
+            cursor=request.GET.get('cursor'),
+            limit=parseLimit(request.GET.get('limit')),
+        )
+    except ValueError:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid cursor'
+        ))
 
     return_data = [
         {
@@ -552,14 +918,19 @@ def querySongComment(request):
                 'profile_picture_url': song_comment_iterator.ordinaryUser.profile_picture_url,
             },
 
+            'scid': song_comment_iterator.scid,
             'comment': song_comment_iterator.comment,
+            'likes': song_comment_iterator.likes,
             'release_time': song_comment_iterator.release_time.strftime('%Y-%m-%d')
         }
-        for song_comment_iterator in song_comment_queryset
+        for song_comment_iterator in song_comment_page
     ]
 
     return JsonResponse(Result.success(
-        return_data
+        {
+            'list': return_data,
+            'next_cursor': next_cursor,
+        }
     ))
 
 
@@ -581,18 +952,45 @@ def queryProducerByCondition(request):
     if ptype:
         filter_conditions &= Q(ptype=ptype)
 
-    dst_producer = models_sqlview.ProducerView.objects.filter(filter_conditions).all()
+    try:
+        dst_producer_page, next_cursor = paginateQueryset(
+            queryset=models_sqlview.ProducerView.objects.filter(filter_conditions),
+            ordering=['pid'],
+            cursor=request.GET.get('cursor'),
+            limit=parseLimit(request.GET.get('limit')),
+        )
+    except ValueError:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid cursor'
+        ))
+
+    # 视图中没有缩略图和粉丝数字段，一条查询批量取出本页创作者的头像缩略图和粉丝数
+    producer_extra_dict = {
+        producer_pid: (profile_picture_thumb_url, follower_count)
+        for producer_pid, profile_picture_thumb_url, follower_count in models.OrdinaryUser.objects.filter(
+            producer_id__in=[dst_producer_iterator.pid for dst_producer_iterator in dst_producer_page],
+        ).values_list('producer_id', 'profile_picture_thumb_url', 'producer__follower_count')
+    }
 
     return JsonResponse(Result.success(
-        [
-            {
-                'pid': dst_producer_iterator.pid,
-                'name': dst_producer_iterator.username,
-                'profile_picture_url': dst_producer_iterator.profile_picture_url,
-                'ptype': dst_producer_iterator.ptype,
-            }
-            for dst_producer_iterator in dst_producer
-        ]
+        {
+            'list': [
+                {
+                    'pid': dst_producer_iterator.pid,
+                    'name': dst_producer_iterator.username,
+                    'profile_picture_url': dst_producer_iterator.profile_picture_url,
+                    'profile_picture_thumb_url': (
+                        producer_extra_dict.get(dst_producer_iterator.pid, (None, 0))[0]
+                        or dst_producer_iterator.profile_picture_url
+                    ),
+                    'ptype': dst_producer_iterator.ptype,
+                    'follower_count': producer_extra_dict.get(dst_producer_iterator.pid, (None, 0))[1],
+                }
+                for dst_producer_iterator in dst_producer_page
+            ],
+            'next_cursor': next_cursor,
+        }
     ))
 
 
@@ -605,32 +1003,73 @@ def querySongByCondition(request):
 
     query_condition = request.GET.get('condition')
 
-    filter_conditions = Q()
-    filter_conditions |= Q(sname__icontains=query_condition)
-    filter_conditions |= Q(aname__icontains=query_condition)
-    filter_conditions |= Q(username__icontains=query_condition)
+    # 按相关度排序的结果没有稳定的键，游标中保存偏移量
+    try:
+        offset = decodeOffsetCursor(request.GET.get('cursor'))
+    except ValueError:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid cursor'
+        ))
+
+    limit = parseLimit(request.GET.get('limit'))
+
+    # 搜索索引返回按相关度排列的歌曲id，多取一条用于判断是否还有下一页
+    song_sid_list = getSongSearchBackend().search(query_condition, offset=offset, limit=limit + 1)
+
+    next_cursor = None
+    if len(song_sid_list) > limit:
+        song_sid_list = song_sid_list[:limit]
+        next_cursor = encodeCursor([offset + limit])
+
+    # 再按主键取出歌曲的展示信息
+
+    # 视图中没有计数字段，按主键关联歌曲表，在同一条查询中取出
+    song_view_dict = {
+        song_view.sid: song_view
+        for song_view in models_sqlview.SongView.objects.filter(sid__in=song_sid_list).annotate(
+            comment_count=Subquery(models.Song.objects.filter(sid=OuterRef('sid')).values('comment_count')),
+            songlist_count=Subquery(models.Song.objects.filter(sid=OuterRef('sid')).values('songlist_count')),
+        )
+    }
+
+    song_queryset = [song_view_dict[sid] for sid in song_sid_list if sid in song_view_dict]
 
-    song_queryset = models_sqlview.SongView.objects.filter(filter_conditions).distinct().all()
+    # 视图中没有缩略图字段，一条查询批量取出本页专辑的封面缩略图
+    cover_thumb_dict = dict(
+        models.Album.objects.filter(
+            aid__in={song_view.aid for song_view in song_queryset},
+            cover_thumb_url__isnull=False,
+        ).values_list('aid', 'cover_thumb_url')
+    )
 
     return JsonResponse(Result.success(
-        [
-            {
-                'sid': queryset_iterator.sid,
-                'sname': queryset_iterator.sname,
+        {
+            'list': [
+                {
+                    'sid': queryset_iterator.sid,
+                    'sname': queryset_iterator.sname,
 
-                'aid': queryset_iterator.aid,
-                'aname': queryset_iterator.aname,
-                'cover_url': queryset_iterator.cover_url,
+                    'aid': queryset_iterator.aid,
+                    'aname': queryset_iterator.aname,
+                    'cover_url': queryset_iterator.cover_url,
+                    'cover_thumb_url': cover_thumb_dict.get(queryset_iterator.aid, queryset_iterator.cover_url),
 
-                'pid': queryset_iterator.pid,
-                'producer_name': queryset_iterator.username,
-            }
-            for queryset_iterator in song_queryset
-        ]
+                    'pid': queryset_iterator.pid,
+                    'producer_name': queryset_iterator.username,
+
+                    'comment_count': queryset_iterator.comment_count,
+                    'songlist_count': queryset_iterator.songlist_count,
+                }
+                for queryset_iterator in song_queryset
+            ],
+            'next_cursor': next_cursor,
+        }
     ))
 
 
 @csrf_exempt
+@jwt_required
 def followProducer(request):
 
     if request.method != 'POST':
@@ -639,23 +1078,7 @@ def followProducer(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
+    ordinary_user = request.user_ctx.ordinary_user
 
     producer_pid = request.POST.get('producer_pid')
 
@@ -677,38 +1100,56 @@ def followProducer(request):
             message='user can not follow himself / herself'
         ))
 
-    models.UserFollowProducer.objects.create(producer=dst_producer, ordinaryUser=ordinary_user)
+    with transaction.atomic():
+        models.UserFollowProducer.objects.create(producer=dst_producer, ordinaryUser=ordinary_user)
+        adjustCounter('producer_follower', dst_producer.pid, 1)
+
+    invalidateEntity(ENTITY_PRODUCER, dst_producer.pid)
+    recordActivity(CHART_PRODUCER, {dst_producer.pid: WEIGHT_FOLLOW})
 
     return JsonResponse(Result.success())
 
 
 @csrf_exempt
-def cancelFollowProducer(request):
-
+@jwt_required
+def batchFollowProducer(request):
+    """
+    一次关注多个创作者，参数 producer_pids 为创作者id的 JSON 数组。
+    返回每个创作者的结果：created 新关注、exists 已关注、not_found 创作者不存在、invalid id格式错误、self 自己
+    """
     if request.method != 'POST':
         return JsonResponse(Result.failure(
             code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
+    producer_pid_list = utils.jsonArrayToList(request.POST.get('producer_pids') or '')
 
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
+    if producer_pid_list is None or len(producer_pid_list) > settings.BATCH_OPERATION_MAX_ITEMS:
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='producer_pids should be a json array of at most {} ids'.format(
+                settings.BATCH_OPERATION_MAX_ITEMS,
+            )
         ))
 
-    ordinary_user = decodeJwtToken(encode_jwt)
+    return JsonResponse(Result.success({
+        'results': followProducers(request.user_ctx.ordinary_user, producer_pid_list),
+    }))
 
-    # jwt 令牌解析失败
-    if ordinary_user is None:
+
+@csrf_exempt
+@jwt_required
+def cancelFollowProducer(request):
+
+    if request.method != 'POST':
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
         ))
 
+    ordinary_user = request.user_ctx.ordinary_user
+
     producer_pid = request.POST.get('producer_pid')
 
     dst_follow_record = models.UserFollowProducer.objects.filter(
@@ -722,7 +1163,11 @@ def cancelFollowProducer(request):
             message='user-producer follow record not found'
         ))
 
-    dst_follow_record.delete()
+    with transaction.atomic():
+        deleted_count, _ = models.UserFollowProducer.objects.filter(pk=dst_follow_record.pk).delete()
+        adjustCounter('producer_follower', dst_follow_record.producer_id, -deleted_count)
+
+    invalidateEntity(ENTITY_PRODUCER, dst_follow_record.producer_id)
 
     return JsonResponse(Result.success())
 
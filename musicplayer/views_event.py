@@ -0,0 +1,64 @@
+import json
+import uuid
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from utils.jwtAuth import jwt_required
+from utils.listeningEvents import EVENT_TYPES, POSITION_MS_MAX, recordEvents
+from utils.result import Result
+
+
+@csrf_exempt
+@jwt_required
+def recordListeningEvents(request):
+    """
+    客户端批量上报收听事件，参数 events 为 JSON 数组，
+    每项为 {"song_sid": "...", "event": "play" | "skip" | "complete", "position_ms": 12000}。
+    事件进入缓冲区后立即返回，由后台按批写入
+    """
+    if request.method != 'POST':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
+        ))
+
+    try:
+        event_list = json.loads(request.POST.get('events') or '[]')
+    except ValueError:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='events is not valid json'
+        ))
+
+    if not isinstance(event_list, list) or len(event_list) > settings.LISTENING_EVENT_MAX_PER_REQUEST:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='events should be a list of at most {} items'.format(settings.LISTENING_EVENT_MAX_PER_REQUEST)
+        ))
+
+    events = []
+
+    for event_info in event_list:
+        try:
+            song_sid = uuid.UUID(str(event_info['song_sid']))
+            event_type = EVENT_TYPES[event_info['event']]
+            position_ms = event_info.get('position_ms')
+
+            # 只接受范围内的 JSON 整数，bool 是 int 的子类，需要单独排除
+            if position_ms is not None and (
+                    type(position_ms) is not int or not 0 <= position_ms <= POSITION_MS_MAX
+            ):
+                raise ValueError('invalid position_ms')
+        except (TypeError, KeyError, ValueError):
+            return JsonResponse(Result.failure(
+                code=Result.HTTP_STATUS_BAD_REQUEST,
+                message='invalid event {}'.format(json.dumps(event_info)[:100])
+            ))
+
+        events.append((song_sid, event_type, position_ms))
+
+    recordEvents(request.user_ctx.ordinary_user.uid, events)
+
+    return JsonResponse(Result.success({'accepted': len(events)}))
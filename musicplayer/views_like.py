@@ -0,0 +1,89 @@
+import uuid
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from utils.jwtAuth import jwt_required
+from utils.likes import LIKE_TARGETS, addLike, removeLike, targetExists
+from utils.result import Result
+
+
+def _parseTarget(request):
+    """
+    :return: (点赞目标, 被点赞的id)，参数不合法时返回None
+    """
+    target = request.POST.get('target')
+
+    if target not in LIKE_TARGETS:
+        return None
+
+    try:
+        return target, uuid.UUID(str(request.POST.get('target_id')))
+    except ValueError:
+        return None
+
+
+@csrf_exempt
+@jwt_required
+def like(request):
+    """
+    点赞歌曲评论、帖子或帖子评论，参数 target 为 song_comment / blog / blog_comment，target_id 为其id。
+    点赞数在后台合并写入，返回后短时间内读到的点赞数可能还未包含本次点赞
+    """
+    if request.method != 'POST':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
+        ))
+
+    like_target = _parseTarget(request)
+
+    if like_target is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid target or target_id'
+        ))
+
+    target, target_id = like_target
+
+    if not targetExists(target, target_id):
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='{} not found'.format(target)
+        ))
+
+    if not addLike(target, target_id, request.user_ctx.ordinary_user):
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_CONFLICT,
+            message='already liked'
+        ))
+
+    return JsonResponse(Result.success())
+
+
+@csrf_exempt
+@jwt_required
+def cancelLike(request):
+    if request.method != 'POST':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
+        ))
+
+    like_target = _parseTarget(request)
+
+    if like_target is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid target or target_id'
+        ))
+
+    target, target_id = like_target
+
+    if not removeLike(target, target_id, request.user_ctx.ordinary_user):
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='like record not found'
+        ))
+
+    return JsonResponse(Result.success())
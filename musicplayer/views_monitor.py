@@ -0,0 +1,58 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+
+from backend.mysqlpool.pool import getPoolStats
+from utils.audioStream import getStreamCache
+from utils.entityCache import getEntityCacheStats
+from utils.listeningEvents import getListeningEventStats
+from utils.result import Result
+
+
+# 运维监控接口，需要以后台管理员身份登录 /admin/
+
+@staff_member_required
+def queryEntityCacheStats(request):
+    if request.method != 'GET':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, GET only'.format(request.method)
+        ))
+
+    # 统计只覆盖处理本请求的进程
+    return JsonResponse(Result.success(getEntityCacheStats()))
+
+
+@staff_member_required
+def queryDatabasePoolStats(request):
+    if request.method != 'GET':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, GET only'.format(request.method)
+        ))
+
+    # 借出、等待、新建和关闭连接的次数，未启用连接池时为空
+    return JsonResponse(Result.success(getPoolStats()))
+
+
+@staff_member_required
+def queryStreamCacheStats(request):
+    if request.method != 'GET':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, GET only'.format(request.method)
+        ))
+
+    # 音频流磁盘缓存的命中、未命中、下载、淘汰次数和当前占用
+    return JsonResponse(Result.success(getStreamCache().stats()))
+
+
+@staff_member_required
+def queryListeningEventStats(request):
+    if request.method != 'GET':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, GET only'.format(request.method)
+        ))
+
+    # 收听事件的缓冲、写入和丢弃数量
+    return JsonResponse(Result.success(getListeningEventStats()))
@@ -238,7 +238,10 @@ def userModifyPassword(request):
             message='No such user in database',
         ))
 
+    # 修改密码后令牌版本递增，之前签发的令牌全部失效
     ordinary_user.password = user_password_new
-    ordinary_user.save()
+    ordinary_user.token_version += 1
+    ordinary_user.save(update_fields=['password', 'token_version', 'update_time'])
+    modelOperation.invalidateJwtUserCache(ordinary_user.uid)
 
     return JsonResponse(Result.success())
@@ -1,19 +1,24 @@
-import uuid
-
+from django.db import transaction
 from django.db.models import Q
 from django.http import JsonResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 
-from utils.modelOperation import decodeJwtToken
+from utils.entityCache import ENTITY_SONG, invalidateEntity, invalidateSongs
+from utils.jwtAuth import jwt_required, producer_required
+from utils.modelOperation import invalidateJwtUserCache, producerInfoAnnotations
+from utils.pagination import paginateQueryset, parseLimit
 from utils.result import Result
-from utils import utils
+from utils.songSearch import getSongSearchBackend
+from utils.uploadPipeline import submitUpload
+from utils import imagePipeline, utils
 from musicplayer import models
-from utils.oss2Utils import OSS2Utils
 
 
 # Create your views here.
 
 @csrf_exempt
+@jwt_required
 def applyProducer(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -25,22 +30,7 @@ def applyProducer(request):
     produce_title = request.POST.get('title')
     produce_authentication = request.POST.get('authentication')
 
-    encode_jwt = request.POST.get('encode_jwt')
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
+    ordinary_user = request.user_ctx.ordinary_user
 
     if ordinary_user.producer is not None:
         return JsonResponse(Result.failure(
@@ -48,20 +38,35 @@ def applyProducer(request):
             message='producer has been register'
         ))
 
-    new_producer = models.Producer.objects.create(
-        ptype=produce_ptype,
-        title=produce_title,
-        authentication=produce_authentication,
-    )
+    with transaction.atomic():
+        new_producer = models.Producer.objects.create(
+            ptype=produce_ptype,
+            title=produce_title,
+            authentication=produce_authentication,
+        )
+
+        # 鉴权得到的用户可能是缓存中的旧副本，只写入 producer 字段，并在数据库中再检查一次是否已是创作者
+        updated_count = models.OrdinaryUser.objects.filter(
+            uid=ordinary_user.uid,
+            producer__isnull=True,
+        ).update(producer=new_producer, update_time=timezone.now())
+
+        if updated_count == 0:
+            transaction.set_rollback(True)
 
-    ordinary_user.producer = new_producer
+    invalidateJwtUserCache(ordinary_user.uid)
 
-    ordinary_user.save()
+    if updated_count == 0:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_CONFLICT,
+            message='producer has been register'
+        ))
 
     return JsonResponse(Result.success())
 
 
 @csrf_exempt
+@producer_required
 def createSong(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -69,32 +74,7 @@ def createSong(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    producer = ordinary_user.producer
-
-    if producer is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
-        ))
+    producer = request.user_ctx.producer
 
     album_id = request.POST.get('album_id')
 
@@ -129,10 +109,13 @@ def createSong(request):
         introduction=song_introduction,
     )
 
+    getSongSearchBackend().indexSong(new_song.sid)
+
     return JsonResponse(Result.success(new_song.sid))
 
 
 @csrf_exempt
+@producer_required
 def modifySong(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -140,32 +123,7 @@ def modifySong(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    producer = ordinary_user.producer
-
-    if producer is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
-        ))
+    producer = request.user_ctx.producer
 
     # 检查歌曲的作者是否为当前创作者
     song_id = request.POST.get('song_id')
@@ -213,11 +171,15 @@ def modifySong(request):
         song_to_modify.introduction = song_introduction
 
     song_to_modify.save()
+    invalidateEntity(ENTITY_SONG, song_to_modify.sid)
+
+    getSongSearchBackend().indexSong(song_to_modify.sid)
 
     return JsonResponse(Result.success())
 
 
 @csrf_exempt
+@producer_required
 def uploadSongAudio(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -225,32 +187,7 @@ def uploadSongAudio(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    producer = ordinary_user.producer
-
-    if producer is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
-        ))
+    producer = request.user_ctx.producer
 
     # 检查歌曲的作者是否为当前创作者
     song_id = request.POST.get('song_id')
@@ -287,29 +224,20 @@ def uploadSongAudio(request):
             message='invalid song file extension',
         ))
 
-    # 歌曲音頻文件的uuid
-    oss_song_filename = uuid.uuid4().hex + audio_file_extension
-
-    # 调用云服务上传音頻文件
-    upload_audio_url = OSS2Utils.upload(
+    # 后台上传音频文件，完成后写回 audio_url
+    upload_job = submitUpload(
         request_file=audio_file,
-        oss_filename=oss_song_filename,
-        oss_folder=['song', 'audio']
+        extension=audio_file_extension,
+        target='song_audio',
+        target_id=song_to_modify.sid,
+        ordinary_user=request.user_ctx.ordinary_user,
     )
 
-    if upload_audio_url is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_INTERNAL_SERVER_ERROR,
-            message='upload file failed'
-        ))
-
-    song_to_modify.audio_url = upload_audio_url
-    song_to_modify.save()
-
-    return JsonResponse(Result.success())
+    return JsonResponse(Result.success({'upload_job_id': upload_job.jid}))
 
 
 @csrf_exempt
+@producer_required
 def upLoadSongLyrics(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -317,32 +245,7 @@ def upLoadSongLyrics(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    producer = ordinary_user.producer
-
-    if producer is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
-        ))
+    producer = request.user_ctx.producer
 
     # 检查歌曲的作者是否为当前创作者
     song_id = request.POST.get('song_id')
@@ -359,8 +262,7 @@ def upLoadSongLyrics(request):
         ))
 
     # 获取歌词文件
-
-    lyrics_file = request.POST.get('lyrics_file')
+    lyrics_file = request.FILES.get('lyrics_file')
 
     if lyrics_file is None:
         return JsonResponse(Result.failure(
@@ -380,29 +282,20 @@ def upLoadSongLyrics(request):
             message='invalid lyrics file extension'
         ))
 
-    # 生成歌词文件的uuid
-    oss_lyrics_filename = uuid.uuid4().hex + lyrics_file_extension
-
-    # 调用云服务
-    upload_lyrics_url = OSS2Utils.upload(
+    # 后台上传歌词文件，完成后写回 lyrics_url
+    upload_job = submitUpload(
         request_file=lyrics_file,
-        oss_filename=oss_lyrics_filename,
-        oss_folder=['song', 'lyrics']
+        extension=lyrics_file_extension,
+        target='song_lyrics',
+        target_id=song_to_modify.sid,
+        ordinary_user=request.user_ctx.ordinary_user,
     )
 
-    if upload_lyrics_url is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_INTERNAL_SERVER_ERROR,
-            message='upload file failed',
-        ))
-
-    song_to_modify.lyrics_utl = upload_lyrics_url
-    song_to_modify.save()
-
-    return JsonResponse(Result.success())
+    return JsonResponse(Result.success({'upload_job_id': upload_job.jid}))
 
 
 @csrf_exempt
+@producer_required
 def createAlbum(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -410,32 +303,7 @@ def createAlbum(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    producer = ordinary_user.producer
-
-    if producer is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
-        ))
+    producer = request.user_ctx.producer
 
     album_name = request.POST.get('album_name')
     album_type = request.POST.get('album_type')
@@ -464,6 +332,7 @@ def createAlbum(request):
 
 
 @csrf_exempt
+@producer_required
 def modifyAlbum(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -471,32 +340,7 @@ def modifyAlbum(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    producer = ordinary_user.producer
-
-    if producer is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
-        ))
+    producer = request.user_ctx.producer
 
     # 检查歌曲的作者是否为当前创作者
     album_id = request.POST.get('album_id')
@@ -542,10 +386,15 @@ def modifyAlbum(request):
 
     album_to_modify.save()
 
+    # 专辑名变化时更新专辑下所有歌曲的搜索文档
+    invalidateSongs(album_id=album_to_modify.aid)
+    getSongSearchBackend().indexAlbum(album_to_modify.aid)
+
     return JsonResponse(Result.success())
 
 
 @csrf_exempt
+@producer_required
 def uploadAlbumCover(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -553,32 +402,7 @@ def uploadAlbumCover(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    producer = ordinary_user.producer
-
-    if producer is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
-        ))
+    producer = request.user_ctx.producer
 
     # 检查歌曲的作者是否为当前创作者
     album_id = request.POST.get('album_id')
@@ -615,29 +439,26 @@ def uploadAlbumCover(request):
             message='invalid file extension',
         ))
 
-    # 专辑封面文件的uuid
-    oss_filename = uuid.uuid4().hex + album_cover_extension
-
-    # 调用云服务上传封面文件
-    upload_cover_url = OSS2Utils.upload(
-        request_file=album_cover_file,
-        oss_filename=oss_filename,
-        oss_folder=['album', 'cover']
-    )
-
-    if upload_cover_url is None:
+    # 按文件头检验图片格式，扩展名可以伪造
+    if not imagePipeline.isImageFile(album_cover_file):
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_INTERNAL_SERVER_ERROR,
-            message='upload file failed'
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='invalid image file',
         ))
 
-    album_to_modify.cover_url = upload_cover_url
-
-    album_to_modify.save()
+    # 后台上传封面文件，完成后写回 cover_url
+    upload_job = submitUpload(
+        request_file=album_cover_file,
+        extension=album_cover_extension,
+        target='album_cover',
+        target_id=album_to_modify.aid,
+        ordinary_user=request.user_ctx.ordinary_user,
+    )
 
-    return JsonResponse(Result.success())
+    return JsonResponse(Result.success({'upload_job_id': upload_job.jid}))
 
 
+@producer_required
 def querySongOfProducer(request):
     if request.method != 'GET':
         return JsonResponse(Result.failure(
@@ -645,31 +466,19 @@ def querySongOfProducer(request):
             message='Method {} not allowed, GET only'.format(request.method)
         ))
 
-    encode_jwt = request.GET.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    producer = ordinary_user.producer
+    producer = request.user_ctx.producer
 
-    if producer is None:
+    try:
+        song_page, next_cursor = paginateQueryset(
+            queryset=models.Song.objects.filter(producer=producer),
+            ordering=['-create_time', '-sid'],
+            cursor=request.GET.get('cursor'),
+            limit=parseLimit(request.GET.get('limit')),
+        )
+    except ValueError:
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid cursor'
         ))
 
     song_queryset_list = [
@@ -693,12 +502,18 @@ def querySongOfProducer(request):
             'create_time': song_iterator.create_time.strftime('%Y-%m-%d %H:%M:%S'),
             'update_time': song_iterator.update_time.strftime('%Y-%m-%d %H:%M:%S'),
         }
-        for song_iterator in models.Song.objects.filter(producer=producer).all()
+        for song_iterator in song_page
     ]
 
-    return JsonResponse(Result.success(song_queryset_list))
+    return JsonResponse(Result.success(
+        {
+            'list': song_queryset_list,
+            'next_cursor': next_cursor,
+        }
+    ))
 
 
+@producer_required
 def queryAlbumOfProducer(request):
     if request.method != 'GET':
         return JsonResponse(Result.failure(
@@ -706,31 +521,19 @@ def queryAlbumOfProducer(request):
             message='Method {} not allowed, GET only'.format(request.method)
         ))
 
-    encode_jwt = request.GET.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    producer = ordinary_user.producer
+    producer = request.user_ctx.producer
 
-    if producer is None:
+    try:
+        album_page, next_cursor = paginateQueryset(
+            queryset=models.Album.objects.filter(producer=producer),
+            ordering=['-create_time', '-aid'],
+            cursor=request.GET.get('cursor'),
+            limit=parseLimit(request.GET.get('limit')),
+        )
+    except ValueError:
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid cursor'
         ))
 
     album_query_list = [
@@ -748,12 +551,18 @@ def queryAlbumOfProducer(request):
             'create_time': album_iterator.create_time.strftime('%Y-%m-%d %H:%M:%S'),
             'update_time': album_iterator.update_time.strftime('%Y-%m-%d %H:%M:%S'),
         }
-        for album_iterator in models.Album.objects.filter(producer=producer).all()
+        for album_iterator in album_page
     ]
 
-    return JsonResponse(Result.success(album_query_list))
+    return JsonResponse(Result.success(
+        {
+            'list': album_query_list,
+            'next_cursor': next_cursor,
+        }
+    ))
 
 
+@producer_required
 def queryProducer(request):
     if request.method != 'GET':
         return JsonResponse(Result.failure(
@@ -761,32 +570,9 @@ def queryProducer(request):
             message='Method {} not allowed, GET only'.format(request.method)
         ))
 
-    encode_jwt = request.GET.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    producer = ordinary_user.producer
+    ordinary_user = request.user_ctx.ordinary_user
 
-    if producer is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
-        ))
+    producer = request.user_ctx.producer
 
     producer_view = {
         'username': ordinary_user.username,
@@ -802,6 +588,7 @@ def queryProducer(request):
     return JsonResponse(Result.success(producer_view))
 
 
+@producer_required
 def queryFansOfProducer(request):
     if request.method != 'GET':
         return JsonResponse(Result.failure(
@@ -809,53 +596,51 @@ def queryFansOfProducer(request):
             message='Method {} not allowed, GET only'.format(request.method)
         ))
 
-    encode_jwt = request.GET.get('encode_jwt')
+    producer = request.user_ctx.producer
 
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    producer = ordinary_user.producer
+    # 粉丝信息通过 select_related 一并取出，只读取需要的列
+    follow_queryset = models.UserFollowProducer.objects.filter(
+        producer=producer,
+    ).select_related(
+        'ordinaryUser',
+    ).only(
+        'id', 'follow_time',
+        'ordinaryUser__uid', 'ordinaryUser__username', 'ordinaryUser__profile_picture_url',
+    )
 
-    if producer is None:
+    try:
+        follow_page, next_cursor = paginateQueryset(
+            queryset=follow_queryset,
+            ordering=['-follow_time', '-id'],
+            cursor=request.GET.get('cursor'),
+            limit=parseLimit(request.GET.get('limit')),
+        )
+    except ValueError:
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid cursor'
         ))
 
-    follow_querylist = models.UserFollowProducer.objects.filter(
-        producer=producer,
-    ).all()
-
     return JsonResponse(Result.success(
-        [
-            {
-                'user': {
-                    'uid': follow_iterator.ordinaryUser.uid,
-                    'username': follow_iterator.ordinaryUser.username,
-                    'profile_photo_url': follow_iterator.ordinaryUser.profile_picture_url,
-                },
-                'follow_time': follow_iterator.follow_time.strftime('%Y-%m-%d %H:%M:%S')
-            }
-            for follow_iterator in follow_querylist
-        ]
+        {
+            'list': [
+                {
+                    'user': {
+                        'uid': follow_iterator.ordinaryUser.uid,
+                        'username': follow_iterator.ordinaryUser.username,
+                        'profile_photo_url': follow_iterator.ordinaryUser.profile_picture_url,
+                    },
+                    'follow_time': follow_iterator.follow_time.strftime('%Y-%m-%d %H:%M:%S')
+                }
+                for follow_iterator in follow_page
+            ],
+            'next_cursor': next_cursor,
+        }
     ))
 
 
 @csrf_exempt
+@producer_required
 def createSongCollaboration(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -863,32 +648,7 @@ def createSongCollaboration(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    song_producer = ordinary_user.producer
-
-    if song_producer is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
-        ))
+    song_producer = request.user_ctx.producer
 
     song_sid = request.POST.get('song_sid')
 
@@ -941,6 +701,7 @@ def createSongCollaboration(request):
 
 
 @csrf_exempt
+@producer_required
 def handleSongCollaboration(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -948,32 +709,7 @@ def handleSongCollaboration(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    song_producer = ordinary_user.producer
-
-    if song_producer is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
-        ))
+    song_producer = request.user_ctx.producer
 
     song_sid = request.POST.get('song_sid')
 
@@ -1001,6 +737,7 @@ def handleSongCollaboration(request):
     return JsonResponse(Result.success())
 
 
+@producer_required
 def querySongCollaboration(request):
 
     if request.method != 'GET':
@@ -1009,32 +746,7 @@ def querySongCollaboration(request):
             message='Method {} not allowed, GET only'.format(request.method)
         ))
 
-    encode_jwt = request.GET.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
-
-    # 查看用户是否有创作者权限
-    producer = ordinary_user.producer
-
-    if producer is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='producer authority required'
-        ))
+    producer = request.user_ctx.producer
 
     collaboration_status = request.GET.get('collaboration_status')
 
@@ -1045,40 +757,53 @@ def querySongCollaboration(request):
 
     filter_condition &= Q(producer=producer)
 
+    # 歌曲和创作者信息在同一条查询中 JOIN 取出
     collaborations_queryset = models.SongAndProducer.objects.filter(
         filter_condition
-    ).extra(
-        select={
-            'producer_name': 'producer_view.username',
-            'producer_profile_picture_url': 'producer_view.profile_picture_url',
-        },
+    ).select_related(
+        'song',
+    ).annotate(
+        **producerInfoAnnotations(),
+    )
 
-        tables=['producer_view'],
-        where=['musicplayer_songandproducer.producer_id = producer_view.pid']
-    ).all()
+    try:
+        collaboration_page, next_cursor = paginateQueryset(
+            queryset=collaborations_queryset,
+            ordering=['-create_time', '-id'],
+            cursor=request.GET.get('cursor'),
+            limit=parseLimit(request.GET.get('limit')),
+        )
+    except ValueError:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='invalid cursor'
+        ))
 
     return JsonResponse(Result.success(
-        [
-            {
-                'song': {
-                    'sid': collaboration_iterator.song.sid,
-                    'sname': collaboration_iterator.song.sname,
-                    'sversion': collaboration_iterator.song.sversion,
-                },
-
-                'producer': {
-                    'pid': collaboration_iterator.producer.pid,
-                    'name': collaboration_iterator.producer_name,
-                    'profile_picture_url': collaboration_iterator.producer_profile_picture_url
-                },
-
-                'status': collaboration_iterator.status,
-                'role': collaboration_iterator.role,
-                'create_time': collaboration_iterator.create_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'update_time': collaboration_iterator.update_time.strftime('%Y-%m-%d %H:%M:%S'),
-            }
-            for collaboration_iterator in collaborations_queryset
-        ]
+        {
+            'list': [
+                {
+                    'song': {
+                        'sid': collaboration_iterator.song.sid,
+                        'sname': collaboration_iterator.song.sname,
+                        'sversion': collaboration_iterator.song.sversion,
+                    },
+
+                    'producer': {
+                        'pid': collaboration_iterator.producer_id,
+                        'name': collaboration_iterator.producer_name,
+                        'profile_picture_url': collaboration_iterator.producer_profile_picture_url
+                    },
+
+                    'status': collaboration_iterator.status,
+                    'role': collaboration_iterator.role,
+                    'create_time': collaboration_iterator.create_time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'update_time': collaboration_iterator.update_time.strftime('%Y-%m-%d %H:%M:%S'),
+                }
+                for collaboration_iterator in collaboration_page
+            ],
+            'next_cursor': next_cursor,
+        }
     ))
 
 
@@ -0,0 +1,248 @@
+from django.conf import settings
+from django.core import signing
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from utils.jwtAuth import jwt_required
+from utils.result import Result
+from utils import uploadPipeline, utils
+from musicplayer import models
+
+
+def _getUploadJob(request, job_id):
+    # 只能查看和操作自己发起的上传任务
+    return models.UploadJob.objects.filter(
+        jid=job_id,
+        ordinaryUser=request.user_ctx.ordinary_user,
+    ).first()
+
+
+@jwt_required
+def queryUploadJob(request):
+    if request.method != 'GET':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, GET only'.format(request.method)
+        ))
+
+    upload_job = _getUploadJob(request, request.GET.get('upload_job_id'))
+
+    if upload_job is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_FOUND,
+            message='upload job not found'
+        ))
+
+    job_info = {
+        # c=接收分片中、p=等待、u=上传中、s=成功、f=失败
+        'status': upload_job.status,
+        'bytes_total': upload_job.bytes_total,
+        'bytes_uploaded': upload_job.bytes_uploaded,
+        'progress': upload_job.bytes_uploaded / upload_job.bytes_total if upload_job.bytes_total else 0,
+        'attempts': upload_job.attempts,
+
+        'url': upload_job.url,
+        'error': upload_job.error,
+
+        'update_time': upload_job.update_time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+    # 浏览器分片上传断点续传时，据此跳过已经上传的分片
+    if upload_job.status == uploadPipeline.UPLOAD_STATUS_RECEIVING:
+        job_info['chunk_size'] = upload_job.chunk_size
+        job_info['chunk_count'] = uploadPipeline.chunkCount(upload_job)
+        job_info['received_chunks'] = uploadPipeline.receivedChunks(upload_job)
+
+    return JsonResponse(Result.success(job_info))
+
+
+@csrf_exempt
+@jwt_required
+def initChunkedUpload(request):
+    if request.method != 'POST':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
+        ))
+
+    # target 如 song_audio，target_id 为歌曲id
+    try:
+        upload_job = uploadPipeline.createChunkedUpload(
+            ordinary_user=request.user_ctx.ordinary_user,
+            target=request.POST.get('target'),
+            target_id=request.POST.get('target_id'),
+            filename=request.POST.get('filename'),
+            total_size=utils.strToInt(request.POST.get('total_size')),
+        )
+    except uploadPipeline.UploadRequestError as e:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message=str(e)
+        ))
+
+    return JsonResponse(Result.success(
+        {
+            'upload_job_id': upload_job.jid,
+            'chunk_size': upload_job.chunk_size,
+            'chunk_count': uploadPipeline.chunkCount(upload_job),
+        }
+    ))
+
+
+@csrf_exempt
+@jwt_required
+def uploadChunk(request):
+    if request.method != 'POST':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
+        ))
+
+    upload_job = _getUploadJob(request, request.POST.get('upload_job_id'))
+
+    if upload_job is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_FOUND,
+            message='upload job not found'
+        ))
+
+    chunk_file = request.FILES.get('chunk')
+
+    if chunk_file is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='no chunk founded'
+        ))
+
+    try:
+        uploadPipeline.saveChunk(
+            upload_job=upload_job,
+            chunk_index=utils.strToInt(request.POST.get('chunk_index')),
+            chunk_file=chunk_file,
+        )
+    except uploadPipeline.UploadRequestError as e:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message=str(e)
+        ))
+
+    return JsonResponse(Result.success())
+
+
+@csrf_exempt
+@jwt_required
+def completeChunkedUpload(request):
+    if request.method != 'POST':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
+        ))
+
+    upload_job = _getUploadJob(request, request.POST.get('upload_job_id'))
+
+    if upload_job is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_FOUND,
+            message='upload job not found'
+        ))
+
+    try:
+        uploadPipeline.completeChunkedUpload(upload_job)
+    except uploadPipeline.UploadRequestError as e:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message=str(e)
+        ))
+
+    # 此后通过 queryUploadJob 查询上传到 oss 的进度
+    return JsonResponse(Result.success({'upload_job_id': upload_job.jid}))
+
+
+@csrf_exempt
+@jwt_required
+def requestDirectUpload(request):
+    if request.method != 'POST':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
+        ))
+
+    # target 如 album_cover，target_id 为专辑id
+    try:
+        upload_job, upload_url = uploadPipeline.createDirectUpload(
+            ordinary_user=request.user_ctx.ordinary_user,
+            target=request.POST.get('target'),
+            target_id=request.POST.get('target_id'),
+            filename=request.POST.get('filename'),
+        )
+    except uploadPipeline.UploadRequestError as e:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message=str(e)
+        ))
+
+    # 客户端用 PUT 请求把文件内容上传到 upload_url，完成后调用 completeDirectUpload
+    return JsonResponse(Result.success(
+        {
+            'upload_job_id': upload_job.jid,
+            'upload_url': upload_url,
+            'method': 'PUT',
+            'expires_in': settings.DIRECT_UPLOAD_EXPIRES,
+        }
+    ))
+
+
+@csrf_exempt
+@jwt_required
+def completeDirectUpload(request):
+    if request.method != 'POST':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, POST only'.format(request.method)
+        ))
+
+    upload_job = _getUploadJob(request, request.POST.get('upload_job_id'))
+
+    if upload_job is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_FOUND,
+            message='upload job not found'
+        ))
+
+    try:
+        uploadPipeline.completeDirectUpload(upload_job)
+    except uploadPipeline.UploadRequestError as e:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message=str(e)
+        ))
+
+    upload_job.refresh_from_db()
+
+    return JsonResponse(Result.success({'url': upload_job.url}))
+
+
+@csrf_exempt
+def localDirectUpload(request):
+    # 本地存储时代替 oss 接收预签名地址上的直传，使用 oss 时不可用
+    if settings.UPLOAD_STORAGE_BACKEND != 'local':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_FOUND,
+            message='local storage disabled'
+        ))
+
+    if request.method != 'PUT':
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_METHOD_NOT_ALLOWED,
+            message='Method {} not allowed, PUT only'.format(request.method)
+        ))
+
+    try:
+        uploadPipeline.getUploadStorage().receiveSignedUpload(request.GET.get('token', ''), request)
+    except signing.BadSignature:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_FORBIDDEN,
+            message='invalid upload token'
+        ))
+
+    return JsonResponse(Result.success())
@@ -1,17 +1,19 @@
-import uuid
-
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 
-from utils import utils
-from utils.modelOperation import decodeJwtToken
+from utils import imagePipeline, utils
+from utils.entityCache import ENTITY_PRODUCER, invalidateEntity, invalidateSongs
+from utils.jwtAuth import jwt_required
+from utils.modelOperation import invalidateJwtUserCache
 from utils.result import Result
-from utils.oss2Utils import OSS2Utils
+from utils.songSearch import getSongSearchBackend
+from utils.uploadPipeline import submitUpload
 
 
 # Create your views here.
 
 @csrf_exempt
+@jwt_required
 def editUserInfo(request):
     # 更新除了头像以外的所有信息
     if request.method != 'POST':
@@ -20,23 +22,7 @@ def editUserInfo(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
+    ordinary_user = request.user_ctx.ordinary_user
 
     user_name = request.POST.get('username')
     user_gender = request.POST.get('gender')
@@ -44,27 +30,51 @@ def editUserInfo(request):
     user_region = request.POST.get('region')
     user_introduction = request.POST.get('introduction')
 
+    # 鉴权得到的用户可能是缓存中的旧副本，只写入本次修改的字段，
+    # 不会覆盖其他请求修改的密码、令牌版本和头像
+    update_fields = []
+
     if user_name is not None and user_name != '':
         ordinary_user.username = user_name
+        update_fields.append('username')
 
     if user_gender is not None:
         ordinary_user.gender = user_gender
+        update_fields.append('gender')
 
     if user_birthday is not None:
         ordinary_user.birthday = user_birthday
+        update_fields.append('birthday')
 
     if user_region is not None and user_region != '':
         ordinary_user.region = user_region
+        update_fields.append('region')
 
     if user_introduction is not None and user_introduction != '':
         ordinary_user.introduction = user_introduction
+        update_fields.append('introduction')
+
+    if not update_fields:
+        return JsonResponse(Result.success())
+
+    # 指定 update_fields 时 auto_now 字段不在其中就不会更新
+    ordinary_user.save(update_fields=update_fields + ['update_time'])
+    invalidateJwtUserCache(ordinary_user.uid)
 
-    ordinary_user.save()
+    # 创作者的主页和歌曲详情中带有用户名、头像
+    if ordinary_user.producer_id is not None:
+        invalidateEntity(ENTITY_PRODUCER, ordinary_user.producer_id)
+        invalidateSongs(producer_id=ordinary_user.producer_id)
+
+    # 创作者改名时更新其所有歌曲的搜索文档
+    if ordinary_user.producer_id is not None and user_name is not None and user_name != '':
+        getSongSearchBackend().indexProducer(ordinary_user.producer_id)
 
     return JsonResponse(Result.success())
 
 
 @csrf_exempt
+@jwt_required
 def editUserProfilePicture(request):
     if request.method != 'POST':
         return JsonResponse(Result.failure(
@@ -72,23 +82,13 @@ def editUserProfilePicture(request):
             message='Method {} not allowed, POST only'.format(request.method)
         ))
 
-    encode_jwt = request.POST.get('encode_jwt')
     user_profile_photo = request.FILES.get('profile_photo')
+    ordinary_user = request.user_ctx.ordinary_user
 
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
+    if user_profile_photo is None:
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
+            code=Result.HTTP_STATUS_BAD_REQUEST,
+            message='no profile photo founded'
         ))
 
     # 获取图片的扩展名
@@ -104,29 +104,26 @@ def editUserProfilePicture(request):
             message='invalid file extension',
         ))
 
-    # 生成uuid
-    oss_filename = uuid.uuid4().hex + file_extension
-
-    # 调用云服务上传图片
-    upload_url = OSS2Utils.upload(
-        request_file=user_profile_photo,
-        oss_filename=oss_filename,
-        oss_folder=['user', 'profilePhoto']
-    )
-
-    if upload_url is None:
+    # 按文件头检验图片格式，扩展名可以伪造
+    if not imagePipeline.isImageFile(user_profile_photo):
         return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_INTERNAL_SERVER_ERROR,
-            message='upload file failed',
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='invalid image file',
         ))
 
-    ordinary_user.profile_picture_url = upload_url
-
-    ordinary_user.save()
+    # 后台上传图片，完成后写回 profile_picture_url 并失效相关缓存
+    upload_job = submitUpload(
+        request_file=user_profile_photo,
+        extension=file_extension,
+        target='user_profile_picture',
+        target_id=ordinary_user.uid,
+        ordinary_user=ordinary_user,
+    )
 
-    return JsonResponse(Result.success())
+    return JsonResponse(Result.success({'upload_job_id': upload_job.jid}))
 
 
+@jwt_required
 def queryUser(request):
 
     if request.method != 'GET':
@@ -135,23 +132,7 @@ def queryUser(request):
             message='Method {} not allowed, GET only'.format(request.method)
         ))
 
-    encode_jwt = request.GET.get('encode_jwt')
-
-    # 没有 jwt 令牌字段
-    if encode_jwt is None or encode_jwt == '':
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_UNAUTHORIZED,
-            message='no jwt token',
-        ))
-
-    ordinary_user = decodeJwtToken(encode_jwt)
-
-    # jwt 令牌解析失败
-    if ordinary_user is None:
-        return JsonResponse(Result.failure(
-            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
-            message='invalid jwt token',
-        ))
+    ordinary_user = request.user_ctx.ordinary_user
 
     user_info = {
         'username': ordinary_user.username,
@@ -0,0 +1,371 @@
+import math
+import operator
+import os
+import struct
+import subprocess
+import sys
+import wave
+from array import array
+
+# numpy 为可选依赖，安装后按整块向量化计算，否则逐块用 array 计算
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# 波形峰值的个数，每个峰值一个字节（0~255，相对满幅），客户端按需再次降采样
+WAVEFORM_PEAK_COUNT = 200
+
+# 压缩格式没有可以直接读取的采样，用 ffmpeg 解码为该采样率的单声道后计算波形和响度
+ANALYSIS_SAMPLE_RATE = 8000
+
+# 响度的下限，单位 dBFS，静音按该值记录
+LOUDNESS_FLOOR = -96.0
+
+_FULL_SCALE = 32768
+
+# wav 按块读取的最大帧数，避免整个文件读入内存
+_WAV_READ_FRAMES = 1024 * 1024
+
+# mp3 第一帧之前允许的无关数据的最大字节数
+_MP3_SYNC_SEARCH_BYTES = 64 * 1024
+
+# MPEG 音频帧头中的码率(kbps)和采样率表，下标为帧头中的索引
+_MPEG_BITRATES = {
+    # (MPEG 版本, Layer)，MPEG-1
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    # MPEG-2 / 2.5
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+}
+_MPEG_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+
+class AudioMetadataError(Exception):
+    """
+    文件不是可以识别的音频
+    """
+    pass
+
+
+def detectAudioFormat(header: bytes) -> str | None:
+    """
+    :param header: 文件开头的至少 12 个字节
+    :return: 'wav'、'mp3'、'ogg'，不是可以识别的音频时返回None
+    """
+    if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+        return 'wav'
+
+    if header[:4] == b'OggS':
+        return 'ogg'
+
+    if header[:3] == b'ID3' or (len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return 'mp3'
+
+    return None
+
+
+def _toInt16(frames: bytes, sample_width: int) -> bytes:
+    """
+    把任意位深的小端 PCM 转换为 16 位，取每个采样的高两个字节
+    """
+    if sample_width == 2:
+        return frames
+
+    converted = bytearray(len(frames) // sample_width * 2)
+
+    if sample_width == 1:
+        # 8 位 wav 是无符号的，翻转最高位即为有符号数
+        converted[1::2] = frames.translate(bytes(x ^ 0x80 for x in range(256)))
+    else:
+        converted[0::2] = frames[sample_width - 2::sample_width]
+        converted[1::2] = frames[sample_width - 1::sample_width]
+
+    return bytes(converted)
+
+
+def _blockStats(samples: bytes) -> tuple[int, float, int]:
+    """
+    :param samples: 16 位小端 PCM，多声道交错排列
+    :return: (峰值, 平方和, 采样数)
+    """
+    if numpy is not None:
+        values = numpy.frombuffer(samples, dtype='<i2').astype(numpy.int64)
+
+        if values.size == 0:
+            return 0, 0.0, 0
+
+        return int(numpy.abs(values).max()), float(numpy.dot(values, values)), int(values.size)
+
+    values = array('h', samples)
+
+    if sys.byteorder == 'big':
+        values.byteswap()
+
+    if not values:
+        return 0, 0.0, 0
+
+    return max(max(values), -min(values)), float(sum(map(operator.mul, values, values))), len(values)
+
+
+def _analyzeBlocks(blocks) -> tuple[bytes, float]:
+    """
+    :param blocks: 生成器，每项为一个波形峰值对应的 16 位 PCM
+    :return: (波形峰值, 响度 dBFS)
+    """
+    peaks = bytearray()
+    total_squares = 0.0
+    total_samples = 0
+
+    for block in blocks:
+        peak, squares, sample_count = _blockStats(block)
+
+        if sample_count == 0:
+            continue
+
+        peaks.append(min(255, round(peak * 255 / _FULL_SCALE)))
+        total_squares += squares
+        total_samples += sample_count
+
+    if total_samples == 0 or total_squares == 0:
+        return bytes(peaks), LOUDNESS_FLOOR
+
+    rms = math.sqrt(total_squares / total_samples) / _FULL_SCALE
+
+    return bytes(peaks), max(LOUDNESS_FLOOR, round(20 * math.log10(rms), 2))
+
+
+def _wavBlocks(wav_file, frames_per_peak, sample_width):
+    frame_size = sample_width * wav_file.getnchannels()
+    remaining_frames = wav_file.getnframes()
+
+    while remaining_frames > 0:
+        block_frames = min(frames_per_peak, remaining_frames)
+        block = bytearray()
+
+        # 单个峰值的帧数很大时（长录音）分多次读取
+        while len(block) < block_frames * frame_size:
+            frames = wav_file.readframes(min(_WAV_READ_FRAMES, block_frames - len(block) // frame_size))
+            if not frames:
+                break
+            block += frames
+
+        if not block:
+            return
+
+        remaining_frames -= block_frames
+        yield _toInt16(bytes(block), sample_width)
+
+
+def _extractWav(local_path) -> dict:
+    try:
+        with wave.open(local_path, 'rb') as wav_file:
+            sample_rate = wav_file.getframerate()
+            channels = wav_file.getnchannels()
+            sample_width = wav_file.getsampwidth()
+            frame_count = wav_file.getnframes()
+
+            if sample_rate <= 0 or channels <= 0:
+                raise AudioMetadataError('invalid wav header')
+
+            waveform_peaks, loudness_db = _analyzeBlocks(_wavBlocks(
+                wav_file, max(1, math.ceil(frame_count / WAVEFORM_PEAK_COUNT)), sample_width,
+            ))
+    except (wave.Error, EOFError) as e:
+        raise AudioMetadataError('invalid wav file: {}'.format(e))
+
+    return {
+        'duration_ms': frame_count * 1000 // sample_rate,
+        'sample_rate': sample_rate,
+        'bitrate': sample_rate * channels * sample_width * 8 // 1000,
+        'loudness_db': loudness_db,
+        'waveform_peaks': waveform_peaks,
+    }
+
+
+def _skipId3(audio_file) -> int:
+    # ID3v2 标签的长度为 4 个 7 位字节
+    header = audio_file.read(10)
+
+    if header[:3] != b'ID3' or len(header) < 10:
+        return 0
+
+    tag_size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+    return 10 + tag_size + (10 if header[5] & 0x10 else 0)
+
+
+def _extractMp3Header(local_path) -> dict:
+    """
+    逐帧读取帧头累计时长，可变码率的文件同样准确，不需要解码
+    """
+    file_size = os.path.getsize(local_path)
+
+    frame_count = 0
+    sample_count = 0
+    audio_bytes = 0
+    sample_rate = None
+
+    with open(local_path, 'rb') as audio_file:
+        offset = _skipId3(audio_file)
+        sync_search_end = offset + _MP3_SYNC_SEARCH_BYTES
+
+        while offset + 4 <= file_size:
+            audio_file.seek(offset)
+            header = audio_file.read(4)
+
+            if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+                # 文件末尾的 ID3v1 标签或填充
+                if frame_count or offset >= sync_search_end:
+                    break
+                offset += 1
+                continue
+
+            version = {0: 2.5, 2: 2, 3: 1}.get((header[1] >> 3) & 0x03)
+            layer = {1: 3, 2: 2, 3: 1}.get((header[1] >> 1) & 0x03)
+            bitrate_index = header[2] >> 4
+            sample_rate_index = (header[2] >> 2) & 0x03
+
+            if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+                if frame_count or offset >= sync_search_end:
+                    break
+                offset += 1
+                continue
+
+            bitrate = _MPEG_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+            frame_sample_rate = _MPEG_SAMPLE_RATES[version][sample_rate_index]
+            padding = (header[2] >> 1) & 0x01
+
+            if layer == 1:
+                frame_samples = 384
+                frame_length = (12 * bitrate // frame_sample_rate + padding) * 4
+            else:
+                frame_samples = 1152 if layer == 2 or version == 1 else 576
+                frame_length = frame_samples // 8 * bitrate // frame_sample_rate + padding
+
+            sample_rate = sample_rate or frame_sample_rate
+            frame_count += 1
+            sample_count += frame_samples
+            audio_bytes += frame_length
+            offset += frame_length
+
+    if frame_count == 0:
+        raise AudioMetadataError('no mpeg audio frame found')
+
+    duration_ms = sample_count * 1000 // sample_rate
+
+    return {
+        'duration_ms': duration_ms,
+        'sample_rate': sample_rate,
+        'bitrate': audio_bytes * 8 // max(duration_ms, 1),
+    }
+
+
+def _extractOggHeader(local_path) -> dict:
+    """
+    采样率来自第一页的 Vorbis / Opus 标识头，时长来自最后一页的 granule position
+    """
+    with open(local_path, 'rb') as audio_file:
+        first_page = audio_file.read(512)
+
+        vorbis_index = first_page.find(b'\x01vorbis')
+        opus_index = first_page.find(b'OpusHead')
+
+        if vorbis_index >= 0:
+            sample_rate = struct.unpack_from('<I', first_page, vorbis_index + 12)[0]
+            granule_rate = sample_rate
+            pre_skip = 0
+        elif opus_index >= 0:
+            pre_skip, sample_rate = struct.unpack_from('<HI', first_page, opus_index + 10)
+            # Opus 的 granule position 固定按 48kHz 计
+            granule_rate = 48000
+        else:
+            raise AudioMetadataError('unsupported ogg codec')
+
+        file_size = os.path.getsize(local_path)
+        audio_file.seek(max(0, file_size - 65536))
+        tail = audio_file.read()
+
+    last_page_index = tail.rfind(b'OggS')
+
+    if granule_rate <= 0 or last_page_index < 0 or last_page_index + 14 > len(tail):
+        raise AudioMetadataError('invalid ogg file')
+
+    granule_position = struct.unpack_from('<q', tail, last_page_index + 6)[0]
+    duration_ms = max(0, granule_position - pre_skip) * 1000 // granule_rate
+
+    return {
+        'duration_ms': duration_ms,
+        'sample_rate': sample_rate,
+        'bitrate': file_size * 8 // max(duration_ms, 1),
+    }
+
+
+def _decodeBlocks(local_path, ffmpeg_binary, duration_ms, timeout):
+    """
+    用 ffmpeg 把压缩音频解码为单声道 16 位 PCM，按波形峰值切块
+    """
+    try:
+        completed = subprocess.run(
+            [
+                ffmpeg_binary, '-nostdin', '-v', 'error', '-i', local_path,
+                '-map', '0:a:0', '-ac', '1', '-ar', str(ANALYSIS_SAMPLE_RATE), '-f', 's16le', '-',
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            timeout=timeout,
+        )
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return None
+
+    if completed.returncode != 0:
+        return None
+
+    samples = completed.stdout
+    expected_samples = max(len(samples) // 2, duration_ms * ANALYSIS_SAMPLE_RATE // 1000)
+    block_size = max(1, math.ceil(expected_samples / WAVEFORM_PEAK_COUNT)) * 2
+
+    return (samples[offset:offset + block_size] for offset in range(0, len(samples), block_size))
+
+
+def extractAudioMetadata(local_path, ffmpeg_binary=None, timeout=None) -> dict:
+    """
+    读取音频的时长、采样率、码率，并计算响度和波形峰值。
+    wav 直接读取采样；mp3、ogg 从帧头和页头读取基本信息，波形和响度需要 ffmpeg 解码，
+    没有 ffmpeg 时这两项为None
+
+    :param local_path: 音频的本地路径
+    :param ffmpeg_binary: ffmpeg 可执行文件，为None时不解码
+    :param timeout: 解码超时，单位秒
+    :return: {'duration_ms', 'sample_rate', 'bitrate'(kbps), 'loudness_db'(dBFS RMS), 'waveform_peaks'(bytes)}
+    :raise AudioMetadataError: 文件不是可以识别的音频
+    """
+    with open(local_path, 'rb') as audio_file:
+        audio_format = detectAudioFormat(audio_file.read(12))
+
+    if audio_format == 'wav':
+        return _extractWav(local_path)
+
+    if audio_format == 'mp3':
+        metadata = _extractMp3Header(local_path)
+    elif audio_format == 'ogg':
+        metadata = _extractOggHeader(local_path)
+    else:
+        raise AudioMetadataError('unknown audio format')
+
+    metadata['loudness_db'] = None
+    metadata['waveform_peaks'] = None
+
+    if ffmpeg_binary is not None:
+        blocks = _decodeBlocks(local_path, ffmpeg_binary, metadata['duration_ms'], timeout)
+
+        if blocks is not None:
+            metadata['waveform_peaks'], metadata['loudness_db'] = _analyzeBlocks(blocks)
+
+    return metadata
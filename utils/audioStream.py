@@ -0,0 +1,284 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from utils.lruCache import TTLLRUCache
+
+logger = logging.getLogger(__name__)
+
+_RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    """
+    Range 请求头的范围超出文件大小
+    """
+    pass
+
+
+def parseRange(range_header, size) -> tuple[int, int] | None:
+    """
+    只支持单个范围，多个范围时按整个文件返回（RFC 9110 允许忽略 Range）
+
+    :param range_header: Range 请求头，如 bytes=0-1023、bytes=1024-、bytes=-500
+    :param size: 文件大小
+    :return: (起始字节, 结束字节)，均包含；没有 Range 或无法解析时返回None
+    :raise RangeNotSatisfiable: 起始字节不小于文件大小
+    """
+    if not range_header:
+        return None
+
+    match = _RANGE_PATTERN.match(range_header.strip())
+
+    if match is None:
+        return None
+
+    start, end = match.groups()
+
+    if not start and not end:
+        return None
+
+    if not start:
+        # 后缀范围：最后 n 个字节
+        suffix_length = int(end)
+
+        if suffix_length == 0:
+            raise RangeNotSatisfiable()
+
+        return max(0, size - suffix_length), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+
+    return start, end
+
+
+class RangeFile(object):
+    """
+    只读出文件中 [start, start + length) 的部分。
+    底层文件已定位到 start，WSGI 服务器（如 gunicorn）通过 fileno() 和 Content-Length 用 sendfile 零拷贝发送
+    """
+
+    def __init__(self, file, start, length):
+        self._file = file
+        self._file.seek(start)
+        self._remaining = length
+
+    def read(self, size=-1) -> bytes:
+        if self._remaining <= 0:
+            return b''
+
+        read_size = self._remaining if size is None or size < 0 else min(size, self._remaining)
+        data = self._file.read(read_size)
+        self._remaining -= len(data)
+
+        return data
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+
+class DiskLRUCache(object):
+    """
+    热门音频的本地磁盘缓存，总大小超过上限时删除最近最少使用的文件。
+    一个文件被请求 admit_hits 次未命中后才在后台下载进缓存，只听一次的歌曲不会挤掉热门歌曲
+    """
+
+    def __init__(self, root, max_bytes, admit_hits=2, fill_workers=2):
+        """
+        :param root: 缓存目录
+        :param max_bytes: 缓存文件的总大小上限
+        :param admit_hits: 未命中多少次后下载进缓存
+        :param fill_workers: 下载线程数，0 表示在请求线程中同步下载
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self.admit_hits = admit_hits
+        self.fill_workers = fill_workers
+
+        # 文件名 -> 文件大小，按最近使用的顺序排列
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._filling = set()
+        self._lock = threading.Lock()
+
+        self._miss_counts = TTLLRUCache(max_size=10000, ttl=3600)
+        self._executor = None
+
+        self._stats = {'hit': 0, 'miss': 0, 'fill': 0, 'fill_error': 0, 'evict': 0}
+
+        self._loadIndex()
+
+    def _loadIndex(self):
+        # 进程重启后沿用已有的缓存文件，按修改时间恢复使用顺序
+        os.makedirs(self.root, exist_ok=True)
+
+        entries = []
+
+        for filename in os.listdir(self.root):
+            if filename.endswith('.tmp'):
+                os.remove(os.path.join(self.root, filename))
+                continue
+
+            file_stat = os.stat(os.path.join(self.root, filename))
+            entries.append((file_stat.st_mtime, filename, file_stat.st_size))
+
+        for _, filename, file_size in sorted(entries):
+            self._index[filename] = file_size
+            self._total_bytes += file_size
+
+        self._evict()
+
+    @staticmethod
+    def _filename(key) -> str:
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def open(self, key):
+        """
+        :param key: 缓存键，一般是 oss 中的路径
+        :return: 命中时返回以二进制方式打开的文件，否则返回None
+        """
+        filename = self._filename(key)
+
+        with self._lock:
+            if filename not in self._index:
+                self._stats['miss'] += 1
+                return None
+
+            self._index.move_to_end(filename)
+            self._stats['hit'] += 1
+
+        try:
+            return open(os.path.join(self.root, filename), 'rb')
+        except FileNotFoundError:
+            # 文件在缓存外被删除
+            with self._lock:
+                self._total_bytes -= self._index.pop(filename, 0)
+            return None
+
+    def recordMiss(self, key, fill):
+        """
+        记录一次未命中，达到 admit_hits 次时调用 fill 下载进缓存
+
+        :param key: 缓存键
+        :param fill: 参数为本地路径，把文件下载到该路径
+        """
+        miss_count = (self._miss_counts.get(key) or 0) + 1
+        self._miss_counts.set(key, miss_count)
+
+        if miss_count < self.admit_hits:
+            return
+
+        filename = self._filename(key)
+
+        with self._lock:
+            if filename in self._index or filename in self._filling:
+                return
+            self._filling.add(filename)
+
+        if self.fill_workers == 0:
+            self._fill(key, filename, fill)
+            return
+
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.fill_workers, thread_name_prefix='stream-cache',
+                    )
+
+        self._executor.submit(self._fill, key, filename, fill)
+
+    def _fill(self, key, filename, fill):
+        tmp_path = os.path.join(self.root, '{}.{}.tmp'.format(filename, uuid.uuid4().hex))
+
+        try:
+            fill(tmp_path)
+            file_size = os.path.getsize(tmp_path)
+            # 下载完成后再改名，读者不会看到不完整的文件
+            os.replace(tmp_path, os.path.join(self.root, filename))
+        except Exception:
+            logger.exception('stream cache fill of %s failed', key)
+
+            with self._lock:
+                self._filling.discard(filename)
+                self._stats['fill_error'] += 1
+
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+
+            return
+
+        with self._lock:
+            self._filling.discard(filename)
+            self._index[filename] = file_size
+            self._total_bytes += file_size
+            self._stats['fill'] += 1
+
+        self._miss_counts.delete(key)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            while self._total_bytes > self.max_bytes and self._index:
+                filename, file_size = self._index.popitem(last=False)
+                self._total_bytes -= file_size
+                self._stats['evict'] += 1
+
+                # 正在读取该文件的请求不受影响，文件在关闭后才真正释放
+                try:
+                    os.remove(os.path.join(self.root, filename))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, files=len(self._index), bytes=self._total_bytes, max_bytes=self.max_bytes)
+
+
+_stream_cache = None
+_stream_cache_lock = threading.Lock()
+
+
+def getStreamCache() -> DiskLRUCache:
+    """
+    :return: 按 settings.STREAM_CACHE_* 创建的进程内共享缓存
+    """
+    global _stream_cache
+
+    if _stream_cache is None:
+        with _stream_cache_lock:
+            if _stream_cache is None:
+                _stream_cache = DiskLRUCache(
+                    root=settings.STREAM_CACHE_DIR,
+                    max_bytes=settings.STREAM_CACHE_MAX_BYTES,
+                    admit_hits=settings.STREAM_CACHE_ADMIT_HITS,
+                    fill_workers=settings.STREAM_CACHE_FILL_WORKERS,
+                )
+
+    return _stream_cache
+
+
+def resetStreamCache():
+    """
+    丢弃共享缓存，下次使用时按当前配置重新创建（用于测试）
+    """
+    global _stream_cache
+
+    with _stream_cache_lock:
+        _stream_cache = None
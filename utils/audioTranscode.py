@@ -0,0 +1,110 @@
+import os
+import subprocess
+
+# 转码规格: 名称 -> AAC 码率(kbps)，每个规格输出一个 .m4a 文件
+AUDIO_RENDITIONS = {
+    'low': 64,
+    'medium': 128,
+    'high': 256,
+}
+
+# 分段的 HLS 规格，播放列表和分段放在 hls 目录下，客户端边下边播
+HLS_RENDITION = 'hls'
+HLS_BITRATE = 128
+HLS_PLAYLIST = 'hls/index.m3u8'
+
+RENDITION_CODEC = 'aac'
+
+
+class TranscodeError(Exception):
+    """
+    ffmpeg 不存在或转码失败
+    """
+    pass
+
+
+def _ffmpegCommand(source_path, output_dir, ffmpeg_binary, hls_segment_seconds) -> list[str]:
+    # 一次解码，同时编码所有规格；-map 0:a:0 只取第一条音轨，丢弃内嵌的封面
+    command = [ffmpeg_binary, '-nostdin', '-v', 'error', '-y', '-i', source_path]
+
+    for rendition, bitrate in AUDIO_RENDITIONS.items():
+        command += [
+            '-map', '0:a:0', '-map_metadata', '-1',
+            '-c:a', RENDITION_CODEC, '-b:a', '{}k'.format(bitrate),
+            '-movflags', '+faststart',
+            os.path.join(output_dir, rendition + '.m4a'),
+        ]
+
+    command += [
+        '-map', '0:a:0', '-map_metadata', '-1',
+        '-c:a', RENDITION_CODEC, '-b:a', '{}k'.format(HLS_BITRATE),
+        '-f', 'hls', '-hls_time', str(hls_segment_seconds), '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(output_dir, 'hls', 'segment_%03d.ts'),
+        os.path.join(output_dir, *HLS_PLAYLIST.split('/')),
+    ]
+
+    return command
+
+
+def transcodeAudio(source_path, output_dir, ffmpeg_binary='ffmpeg', hls_segment_seconds=10, timeout=None) -> list[dict]:
+    """
+    把音频转码为各规格的文件。在进程池中执行，不使用 Django 的配置和数据库
+
+    :param source_path: 原始音频的本地路径
+    :param output_dir: 输出目录，应为空目录
+    :param ffmpeg_binary: ffmpeg 可执行文件
+    :param hls_segment_seconds: HLS 每个分段的时长，单位秒
+    :param timeout: 转码超时，单位秒
+    :return: 每个规格为 {'quality', 'bitrate', 'entry', 'files'}，entry 为播放地址对应的文件，
+            files 为需要上传的全部文件，均为相对 output_dir 的路径，以 / 分隔
+    :raise TranscodeError: ffmpeg 不存在、超时或转码失败
+    """
+    os.makedirs(os.path.join(output_dir, 'hls'), exist_ok=True)
+
+    try:
+        completed = subprocess.run(
+            _ffmpegCommand(source_path, output_dir, ffmpeg_binary, hls_segment_seconds),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+        )
+    except FileNotFoundError:
+        raise TranscodeError('{} not found'.format(ffmpeg_binary))
+    except subprocess.TimeoutExpired:
+        raise TranscodeError('transcode timed out after {}s'.format(timeout))
+
+    if completed.returncode != 0:
+        raise TranscodeError(completed.stderr.decode('utf-8', 'replace').strip()[-200:])
+
+    renditions = [
+        {
+            'quality': rendition,
+            'bitrate': bitrate,
+            'entry': rendition + '.m4a',
+            'files': [rendition + '.m4a'],
+        }
+        for rendition, bitrate in AUDIO_RENDITIONS.items()
+    ]
+
+    renditions.append({
+        'quality': HLS_RENDITION,
+        'bitrate': HLS_BITRATE,
+        'entry': HLS_PLAYLIST,
+        'files': [HLS_PLAYLIST] + [
+            'hls/' + segment for segment in sorted(os.listdir(os.path.join(output_dir, 'hls')))
+            if segment.endswith('.ts')
+        ],
+    })
+
+    return renditions
+
+
+def renditionKey(oss_key: str, relative_path: str) -> str:
+    """
+    转码文件在 oss 中的路径，由原始音频路径推出，
+    如 song/audio/abc.wav 的 low.m4a -> song/audio/abc_low.m4a，hls/index.m3u8 -> song/audio/abc_hls/index.m3u8
+
+    :param oss_key: 原始音频路径
+    :param relative_path: transcodeAudio 返回的相对路径
+    """
+    return '{}_{}'.format(oss_key.rsplit('.', 1)[0], relative_path)
@@ -0,0 +1,219 @@
+import json
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+
+from musicplayer import models
+from utils.charts import CHART_COMMUNITY, CHART_PRODUCER, CHART_SONG, WEIGHT_FOLLOW, WEIGHT_PLAYLIST_ADD, recordActivity
+from utils.communityActivity import ACTIVITY_NEW_MEMBER, recordCommunitiesActivity
+from utils.communityFeed import backfillTimeline
+from utils.counters import recountCounter
+from utils.entityCache import ENTITY_PRODUCER, ENTITY_SONG, ENTITY_SONGLIST, invalidateEntity
+from utils.songListOrder import appendPositions
+
+# 批量操作中每一项的结果
+ITEM_CREATED = 'created'
+ITEM_EXISTS = 'exists'
+ITEM_NOT_FOUND = 'not_found'
+ITEM_INVALID = 'invalid'
+ITEM_SELF = 'self'
+
+
+def _batchRelate(raw_id_list, target_model, relation_model, relation_filter: dict, relation_field: str,
+                 time_field: str, excluded_id=None, extraFields=None):
+    """
+    校验目标并插入不存在的关系。无论多少项，只有一条 IN 查询校验目标、一条查询去重、一次批量插入、
+    一条查询确认真正插入的关系
+
+    :param raw_id_list: 请求中的目标id
+    :param target_model: 目标表，如 Producer
+    :param relation_model: 关系表，如 UserFollowProducer
+    :param relation_filter: 关系中固定的一方，如 {'ordinaryUser': 用户}
+    :param relation_field: 关系表中指向目标的外键，如 'producer'
+    :param time_field: 关系表中插入时自动写入当前时间的字段，如 'follow_time'，用于区分本次插入的行
+    :param excluded_id: 不允许建立关系的目标，如用户自己的创作者id
+    :param extraFields: 传入新增关系数，返回每条新增关系的其他字段，如歌单中的 position
+    :return: ({请求中的id: 结果}, 新增关系的目标id列表)
+    """
+    results = {}
+    target_id_dict = {}
+
+    for raw_id in raw_id_list:
+        try:
+            target_id_dict[str(raw_id)] = uuid.UUID(str(raw_id))
+        except ValueError:
+            results[str(raw_id)] = ITEM_INVALID
+
+    existing_target_ids = set(target_model.objects.filter(
+        pk__in=set(target_id_dict.values()),
+    ).values_list('pk', flat=True))
+
+    related_target_ids = set(relation_model.objects.filter(
+        **relation_filter,
+        **{relation_field + '_id__in': existing_target_ids},
+    ).values_list(relation_field + '_id', flat=True))
+
+    new_target_ids = []
+
+    for raw_id, target_id in target_id_dict.items():
+        if target_id not in existing_target_ids:
+            results[raw_id] = ITEM_NOT_FOUND
+        elif target_id == excluded_id:
+            results[raw_id] = ITEM_SELF
+        elif target_id in related_target_ids:
+            results[raw_id] = ITEM_EXISTS
+        else:
+            results[raw_id] = ITEM_CREATED
+
+            # 同一个id在请求中出现多次时只插入一次
+            if target_id not in new_target_ids:
+                new_target_ids.append(target_id)
+
+    extra_fields_list = extraFields(len(new_target_ids)) if extraFields and new_target_ids else None
+
+    new_relations = [
+        relation_model(
+            **relation_filter, **{relation_field + '_id': target_id},
+            **(extra_fields_list[index] if extra_fields_list else {}),
+        )
+        for index, target_id in enumerate(new_target_ids)
+    ]
+
+    # 去重之后并发插入的重复关系由唯一约束忽略
+    relation_model.objects.bulk_create(new_relations, ignore_conflicts=True)
+
+    if not new_relations:
+        return results, new_target_ids
+
+    # 被忽略的行不会返回主键，按插入时写入的时间找出真正由本次插入的关系，
+    # 其余的已由并发的请求插入，按已存在处理，不重复计入排行和缓存失效
+    inserted_keys = {
+        (getattr(relation, relation_field + '_id'), getattr(relation, time_field)) for relation in new_relations
+    }
+    created_target_ids = {
+        target_id for target_id, time_value in relation_model.objects.filter(
+            **relation_filter,
+            **{relation_field + '_id__in': new_target_ids},
+        ).values_list(relation_field + '_id', time_field)
+        if (target_id, time_value) in inserted_keys
+    }
+
+    for raw_id, target_id in target_id_dict.items():
+        if results[raw_id] == ITEM_CREATED and target_id not in created_target_ids:
+            results[raw_id] = ITEM_EXISTS
+
+    return results, [target_id for target_id in new_target_ids if target_id in created_target_ids]
+
+
+def followProducers(ordinary_user, raw_pid_list) -> dict:
+    """
+    :param ordinary_user: 关注的用户
+    :param raw_pid_list: 创作者id
+    :return: {请求中的创作者id: 结果}，结果为 ITEM_CREATED 等
+    """
+    with transaction.atomic():
+        results, new_pid_list = _batchRelate(
+            raw_pid_list, models.Producer, models.UserFollowProducer,
+            relation_filter={'ordinaryUser': ordinary_user},
+            relation_field='producer',
+            time_field='follow_time',
+            excluded_id=ordinary_user.producer_id,
+        )
+        # 按关系表重新计数，与其他请求并发插入时也准确
+        recountCounter('producer_follower', new_pid_list)
+
+    if new_pid_list:
+        invalidateEntity(ENTITY_PRODUCER, *new_pid_list)
+        recordActivity(CHART_PRODUCER, {producer_pid: WEIGHT_FOLLOW for producer_pid in new_pid_list})
+
+    return results
+
+
+def followCommunities(ordinary_user, raw_cid_list) -> dict:
+    """
+    :param ordinary_user: 关注的用户
+    :param raw_cid_list: 社群id
+    :return: {请求中的社群id: 结果}
+    """
+    with transaction.atomic():
+        results, new_cid_list = _batchRelate(
+            raw_cid_list, models.Community, models.UserFollowCommunity,
+            relation_filter={'ordinaryUser': ordinary_user},
+            relation_field='community',
+            time_field='follow_time',
+        )
+        recountCounter('community_member', new_cid_list)
+        recordCommunitiesActivity(new_cid_list, ACTIVITY_NEW_MEMBER)
+
+    if new_cid_list:
+        backfillTimeline(ordinary_user, new_cid_list)
+        recordActivity(CHART_COMMUNITY, {community_cid: WEIGHT_FOLLOW for community_cid in new_cid_list})
+
+    return results
+
+
+def addSongsToSongList(songlist, raw_sid_list) -> dict:
+    """
+    :param songlist: 用户自己的歌单
+    :param raw_sid_list: 歌曲id，新加入的歌曲按请求中的顺序追加到歌单末尾
+    :return: {请求中的歌曲id: 结果}
+    """
+    with transaction.atomic():
+        results, new_sid_list = _batchRelate(
+            raw_sid_list, models.Song, models.SongAndSongList,
+            relation_filter={'songList': songlist},
+            relation_field='song',
+            time_field='collect_time',
+            extraFields=lambda count: [{'position': position} for position in appendPositions(songlist, count)],
+        )
+        recountCounter('song_songlist', new_sid_list)
+
+    if new_sid_list:
+        invalidateEntity(ENTITY_SONGLIST, songlist.slid)
+        invalidateEntity(ENTITY_SONG, *new_sid_list)
+        recordActivity(CHART_SONG, {song_sid: WEIGHT_PLAYLIST_ADD for song_sid in new_sid_list})
+
+    return results
+
+
+def importSongsToSongList(songlist, lines) -> dict:
+    """
+    从 JSON-lines 导入歌曲，每行一个带 sid 的对象，与 utils.songListOrder.iterSongListLines 导出的格式相同。
+    逐行读取，每 settings.BATCH_OPERATION_MAX_ITEMS 行调用一次 addSongsToSongList，
+    大文件不会全部载入内存，超过 settings.SONGLIST_IMPORT_MAX_ITEMS 行的部分不导入
+
+    :param songlist: 用户自己的歌单
+    :param lines: 可逐行迭代的文件，行可以是 bytes 或 str
+    :return: {结果: 行数}，另有 truncated 表示是否有未导入的行
+    """
+    summary = Counter()
+    song_sid_list = []
+    truncated = False
+
+    def flush():
+        summary.update(addSongsToSongList(songlist, song_sid_list).values())
+        song_sid_list.clear()
+
+    for line_number, line in enumerate(lines):
+        if line_number >= settings.SONGLIST_IMPORT_MAX_ITEMS:
+            truncated = True
+            break
+
+        try:
+            song_sid = json.loads(line)['sid']
+        except (ValueError, TypeError, KeyError):
+            if line.strip():
+                summary[ITEM_INVALID] += 1
+            continue
+
+        song_sid_list.append(song_sid)
+
+        if len(song_sid_list) >= settings.BATCH_OPERATION_MAX_ITEMS:
+            flush()
+
+    if song_sid_list:
+        flush()
+
+    return dict(summary, truncated=truncated)
@@ -0,0 +1,239 @@
+import heapq
+import logging
+import threading
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from musicplayer import models
+
+logger = logging.getLogger(__name__)
+
+# 排行榜类型
+CHART_SONG = 'song'
+CHART_PRODUCER = 'producer'
+CHART_COMMUNITY = 'community'
+
+CHARTS = (CHART_SONG, CHART_PRODUCER, CHART_COMMUNITY)
+
+# 窗口名 -> 包含今天在内的天数
+CHART_WINDOWS = {
+    'daily': 1,
+    'weekly': 7,
+}
+
+# 各类行为的得分
+WEIGHT_PLAY = 1
+WEIGHT_PLAYLIST_ADD = 5
+WEIGHT_COMMENT = 3
+WEIGHT_FOLLOW = 10
+
+# 同一进程内串行地读改写缓存中的榜单，多个进程之间的竞争由 recomputeCharts 纠正
+_topk_lock = threading.Lock()
+
+
+def _getCache():
+    return caches[settings.ENTITY_CACHE_ALIAS]
+
+
+def _windowStart(window: str, today):
+    return today - timedelta(days=CHART_WINDOWS[window] - 1)
+
+
+def _cacheKey(chart: str, window: str, start_day) -> str:
+    # 键中带有窗口的起始日期，跨天后自然换成新的榜单
+    return 'chart:{}:{}:{}'.format(chart, window, start_day.isoformat())
+
+
+def _loadTopK(chart: str, start_day) -> list:
+    # 按窗口内的得分之和取前 K 名，只在缓存缺失或重新计算后执行
+    return [
+        (entity_id.hex, total)
+        for entity_id, total in models.ChartScore.objects.filter(
+            chart=chart,
+            day__gte=start_day,
+        ).values('entity_id').annotate(
+            total=Sum('score'),
+        ).order_by('-total', 'entity_id').values_list('entity_id', 'total')[:settings.CHART_TOP_K]
+    ]
+
+
+def getChart(chart: str, window: str, limit: int) -> list:
+    """
+    读取缓存中的榜单，命中时只取前 limit 项
+
+    :param chart: 排行榜类型，如 CHART_SONG
+    :param window: CHART_WINDOWS 中的窗口名
+    :param limit: 返回的条数，不超过 settings.CHART_TOP_K
+    :return: [(实体id, 得分)]，按得分从高到低排列，实体id为 32 位十六进制
+    """
+    start_day = _windowStart(window, timezone.localdate())
+    cache = _getCache()
+    key = _cacheKey(chart, window, start_day)
+
+    entries = cache.get(key)
+
+    if entries is None:
+        entries = _loadTopK(chart, start_day)
+        cache.set(key, entries, timeout=settings.CHART_CACHE_TIMEOUT)
+
+    return entries[:limit]
+
+
+def recordActivity(chart: str, increments: dict, day=None):
+    """
+    累加实体当天的得分，事务提交后更新缓存中的榜单。
+    排行榜不影响用户的操作，写入失败时只记录日志，由 recomputeCharts 补上
+
+    :param chart: 排行榜类型，如 CHART_SONG
+    :param increments: {实体id: 增加的得分}
+    :param day: 得分计入的日期，默认为今天
+    """
+    increments = {entity_id: weight for entity_id, weight in increments.items() if weight}
+
+    if not increments:
+        return
+
+    day = day or timezone.localdate()
+
+    try:
+        with transaction.atomic():
+            # 先补齐不存在的行，再用 F() 在数据库中累加，多个进程同时写入时得分不会丢失
+            models.ChartScore.objects.bulk_create([
+                models.ChartScore(chart=chart, entity_id=entity_id, day=day)
+                for entity_id in increments
+            ], ignore_conflicts=True)
+
+            # 得分相同的实体合并成一条 UPDATE，批量关注、收藏只有一条
+            entity_ids_by_weight = defaultdict(list)
+
+            for entity_id, weight in increments.items():
+                entity_ids_by_weight[weight].append(entity_id)
+
+            for weight, entity_ids in entity_ids_by_weight.items():
+                models.ChartScore.objects.filter(chart=chart, entity_id__in=entity_ids, day=day).update(
+                    score=F('score') + weight,
+                )
+    except DatabaseError:
+        logger.exception('chart %s score update failed', chart)
+        return
+
+    entity_ids = list(increments)
+    transaction.on_commit(lambda: _refreshTopK(chart, entity_ids))
+
+
+def _refreshTopK(chart: str, entity_ids: list):
+    """
+    用数据库中的准确得分更新各窗口的前 K 名。
+    窗口内的得分只增不减，不在榜单中的实体得分都不高于榜单的最后一名，
+    所以只需把这次变化的实体与榜单合并，不用重新扫描得分表
+    """
+    today = timezone.localdate()
+    longest_start = min(_windowStart(window, today) for window in CHART_WINDOWS)
+
+    score_rows = models.ChartScore.objects.filter(
+        chart=chart,
+        entity_id__in=entity_ids,
+        day__gte=longest_start,
+    ).values_list('entity_id', 'day', 'score')
+
+    cache = _getCache()
+
+    with _topk_lock:
+        for window in CHART_WINDOWS:
+            start_day = _windowStart(window, today)
+            key = _cacheKey(chart, window, start_day)
+            entries = cache.get(key)
+
+            # 榜单不在缓存中时，下次读取会从得分表重新加载
+            if entries is None:
+                continue
+
+            window_scores = Counter()
+
+            for entity_id, day, score in score_rows:
+                if day >= start_day:
+                    window_scores[entity_id.hex] += score
+
+            merged = dict(entries)
+            merged.update(window_scores)
+
+            cache.set(
+                key,
+                heapq.nlargest(settings.CHART_TOP_K, merged.items(), key=lambda entry: entry[1]),
+                timeout=settings.CHART_CACHE_TIMEOUT,
+            )
+
+
+def _countByDay(queryset, entity_field: str, time_field: str) -> list:
+    # 按实体和日期分组计数，日期按 settings.TIME_ZONE 划分
+    return queryset.annotate(
+        day=TruncDate(time_field),
+    ).values(entity_field, 'day').annotate(
+        count=Count('pk'),
+    ).values_list(entity_field, 'day', 'count')
+
+
+def recomputeCharts(days: int = None) -> dict:
+    """
+    按收听统计、收藏、评论、关注等源表重新计算最近 days 天的得分并重建缓存中的榜单，
+    纠正增量更新在多进程竞争、写入失败和源数据删除后产生的偏差。由 recompute_charts 命令定期执行
+
+    :param days: 重新计算的天数，默认为最长的窗口
+    :return: {排行榜类型: 写入的得分行数}
+    """
+    days = days or max(CHART_WINDOWS.values())
+    today = timezone.localdate()
+    start_day = today - timedelta(days=days - 1)
+
+    scores = {chart: Counter() for chart in CHARTS}
+
+    for song_sid, day, play_count in models.SongPlayDaily.objects.filter(
+            day__gte=start_day,
+    ).values_list('song_id', 'day', 'play_count'):
+        scores[CHART_SONG][(song_sid, day)] += play_count * WEIGHT_PLAY
+
+    for chart, weight, queryset, entity_field, time_field in (
+            (CHART_SONG, WEIGHT_PLAYLIST_ADD, models.SongAndSongList.objects, 'song_id', 'collect_time'),
+            (CHART_SONG, WEIGHT_COMMENT, models.SongComment.objects, 'song_id', 'release_time'),
+            (CHART_PRODUCER, WEIGHT_FOLLOW, models.UserFollowProducer.objects, 'producer_id', 'follow_time'),
+            (CHART_COMMUNITY, WEIGHT_FOLLOW, models.UserFollowCommunity.objects, 'community_id', 'follow_time'),
+    ):
+        for entity_id, day, count in _countByDay(
+                queryset.filter(**{time_field + '__date__gte': start_day}), entity_field, time_field,
+        ):
+            scores[chart][(entity_id, day)] += count * weight
+
+    with transaction.atomic():
+        models.ChartScore.objects.filter(day__gte=start_day).delete()
+        # 早于保留天数的得分不再属于任何窗口
+        models.ChartScore.objects.filter(
+            day__lt=today - timedelta(days=settings.CHART_RETENTION_DAYS),
+        ).delete()
+
+        for chart, chart_scores in scores.items():
+            models.ChartScore.objects.bulk_create([
+                models.ChartScore(chart=chart, entity_id=entity_id, day=day, score=score)
+                for (entity_id, day), score in chart_scores.items()
+                if score
+            ], batch_size=1000)
+
+    cache = _getCache()
+
+    with _topk_lock:
+        for chart in CHARTS:
+            for window in CHART_WINDOWS:
+                window_start = _windowStart(window, today)
+                cache.set(
+                    _cacheKey(chart, window, window_start),
+                    _loadTopK(chart, window_start),
+                    timeout=settings.CHART_CACHE_TIMEOUT,
+                )
+
+    return {chart: sum(1 for score in chart_scores.values() if score) for chart, chart_scores in scores.items()}
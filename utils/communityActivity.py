@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from musicplayer import models
+
+# 社群活跃行为 -> 汇总表中的计数字段
+ACTIVITY_POST = 'post_count'
+ACTIVITY_COMMENT = 'comment_count'
+ACTIVITY_NEW_MEMBER = 'new_member_count'
+
+# 热门社群的活跃度 = 各计数乘以权重之和
+ACTIVITY_WEIGHTS = {
+    ACTIVITY_POST: 3,
+    ACTIVITY_COMMENT: 1,
+    ACTIVITY_NEW_MEMBER: 2,
+}
+
+
+def recordCommunityActivity(community_cid, activity: str):
+    """
+    累加社群当天的活跃计数，应与发帖、评论、关注在同一事务中调用
+
+    :param community_cid: 社群id
+    :param activity: 计数字段，如 ACTIVITY_POST
+    """
+    recordCommunitiesActivity([community_cid], activity)
+
+
+def recordCommunitiesActivity(community_cid_list, activity: str):
+    """
+    每个社群当天的活跃计数加一。先补齐当天的行，再用 F() 在数据库中累加，多个请求同时更新时计数不会丢失
+
+    :param community_cid_list: 社群id，不应重复
+    :param activity: 计数字段，如 ACTIVITY_POST
+    """
+    day = timezone.localdate()
+
+    models.CommunityActivityDaily.objects.bulk_create([
+        models.CommunityActivityDaily(community_id=community_cid, day=day)
+        for community_cid in community_cid_list
+    ], ignore_conflicts=True)
+
+    models.CommunityActivityDaily.objects.filter(community_id__in=community_cid_list, day=day).update(**{
+        activity: F(activity) + 1,
+    })
+
+
+def _activityScore():
+    return sum(Sum(activity) * weight for activity, weight in ACTIVITY_WEIGHTS.items())
+
+
+def getTopCommunities(limit: int) -> list:
+    """
+    最近 settings.COMMUNITY_ACTIVITY_DAYS 天活跃度最高的社群。
+    结果在实体缓存中保存 settings.COMMUNITY_TOP_CACHE_TIMEOUT 秒，命中时直接返回，
+    过期后从汇总表重新计算，汇总表每个社群每天只有一行
+
+    :param limit: 返回的社群数，不超过 settings.COMMUNITY_TOP_MAX
+    :return: [{'cid', 'name', 'music_type', 'profile_picture_thumb_url', 'member_count', 'score'}]
+    """
+    start_day = timezone.localdate() - timedelta(days=settings.COMMUNITY_ACTIVITY_DAYS - 1)
+    cache = caches[settings.ENTITY_CACHE_ALIAS]
+    # 键中带有窗口的起始日期，跨天后立即换成新的窗口
+    key = 'community:top:{}'.format(start_day.isoformat())
+
+    top_communities = cache.get(key, version=settings.ENTITY_CACHE_VERSION)
+
+    if top_communities is None:
+        top_communities = [
+            {
+                'cid': community_info['community_id'],
+                'name': community_info['community__cname'],
+                'music_type': community_info['community__music_type'],
+                'profile_picture_thumb_url': (
+                    community_info['community__profile_picture_thumb_url']
+                    or community_info['community__profile_picture_url']
+                ),
+                'member_count': community_info['community__member_count'],
+                'score': community_info['score'],
+            }
+            for community_info in models.CommunityActivityDaily.objects.filter(
+                day__gte=start_day,
+            ).values(
+                'community_id',
+            ).annotate(
+                score=_activityScore(),
+            ).filter(
+                score__gt=0,
+            ).order_by('-score', 'community_id').values(
+                'community_id', 'score',
+                'community__cname', 'community__music_type', 'community__profile_picture_url',
+                'community__profile_picture_thumb_url', 'community__member_count',
+            )[:settings.COMMUNITY_TOP_MAX]
+        ]
+
+        cache.set(
+            key, top_communities, timeout=settings.COMMUNITY_TOP_CACHE_TIMEOUT, version=settings.ENTITY_CACHE_VERSION,
+        )
+
+    return top_communities[:limit]
@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.db.models import Count
+
+from musicplayer import models
+from utils.pagination import paginateMergedQuerysets
+
+
+def _isFanOutOnWrite(community_cid) -> bool:
+    # 关注人数达到上限的社群发帖时不写入关注者的时间线，读取时直接查询帖子表。
+    # 是否写扩散按发帖时的人数决定，之后人数回落到上限以下（如 reconcile_counters 修正计数）时，
+    # 期间的帖子不会补写进时间线，见 queryFeedPage
+    member_count = models.Community.objects.filter(cid=community_cid).values_list('member_count', flat=True).first()
+    return member_count is not None and member_count < settings.FEED_FANOUT_MAX_MEMBERS
+
+
+def fanOutBlog(blog) -> int:
+    """
+    把新帖子写入所属社群每个关注者的时间线，帖子内容上传完成后调用。
+    大社群不写入，写入的行数不超过 settings.FEED_FANOUT_MAX_MEMBERS
+
+    :param blog: 新帖子
+    :return: 写入的时间线条数
+    """
+    if not _isFanOutOnWrite(blog.community_id):
+        return 0
+
+    follower_uid_list = list(models.UserFollowCommunity.objects.filter(
+        community_id=blog.community_id,
+    ).values_list('ordinaryUser_id', flat=True))
+
+    models.FeedItem.objects.bulk_create([
+        models.FeedItem(ordinaryUser_id=follower_uid, blog_id=blog.bid, create_time=blog.create_time)
+        for follower_uid in follower_uid_list
+    ], batch_size=1000, ignore_conflicts=True)
+
+    return len(follower_uid_list)
+
+
+def backfillTimeline(ordinary_user, community_cid_list) -> int:
+    """
+    用户关注社群后，把其中写扩散的社群最近的 settings.FEED_BACKFILL_COUNT 条帖子补进时间线
+
+    :param ordinary_user: 关注社群的用户
+    :param community_cid_list: 新关注的社群id
+    :return: 写入的时间线条数
+    """
+    fan_out_cids = models.Community.objects.filter(
+        cid__in=community_cid_list,
+        member_count__lt=settings.FEED_FANOUT_MAX_MEMBERS,
+    ).values_list('cid', flat=True)
+
+    feed_items = [
+        models.FeedItem(ordinaryUser=ordinary_user, blog_id=blog_bid, create_time=create_time)
+        for community_cid in fan_out_cids
+        for blog_bid, create_time in models.Blog.objects.filter(
+            community_id=community_cid, content_url__isnull=False,
+        ).order_by('-create_time', '-bid').values_list('bid', 'create_time')[:settings.FEED_BACKFILL_COUNT]
+    ]
+
+    models.FeedItem.objects.bulk_create(feed_items, ignore_conflicts=True)
+
+    return len(feed_items)
+
+
+def queryFeedPage(ordinary_user, cursor, limit):
+    """
+    合并用户的时间线和关注的大社群的帖子，按发帖时间从新到旧分页。
+    社群在写扩散期间写入的帖子在变成大社群后会从两边同时读到，合并时去重；
+    反过来，大社群期间发的帖子没有写入时间线，人数回落到 settings.FEED_FANOUT_MAX_MEMBERS 以下后不再能读到。
+    关注人数只在 reconcile_counters 修正计数时减少，这种情况很少，暂不补写。
+    内容还没有上传完成的帖子不返回
+
+    :param ordinary_user: 读取动态的用户
+    :param cursor: 上一页返回的游标，第一页为None
+    :param limit: 每页条数
+    :return: (当前页的帖子id列表, 下一页游标)
+    :raise ValueError: 游标格式不合法
+    """
+    large_community_cids = models.UserFollowCommunity.objects.filter(
+        ordinaryUser=ordinary_user,
+        community__member_count__gte=settings.FEED_FANOUT_MAX_MEMBERS,
+    ).values('community_id')
+
+    page, next_cursor = paginateMergedQuerysets(
+        sources=[
+            (models.FeedItem.objects.filter(ordinaryUser=ordinary_user), ['-create_time', '-blog']),
+            (models.Blog.objects.filter(
+                community_id__in=large_community_cids, content_url__isnull=False,
+            ), ['-create_time', '-bid']),
+        ],
+        cursor=cursor,
+        limit=limit,
+    )
+
+    return [blog_bid for _, blog_bid in page], next_cursor
+
+
+def trimTimelines() -> int:
+    """
+    把每个用户的时间线截断到最近的 settings.FEED_TIMELINE_MAX 条，由 trim_feeds 命令定期执行
+
+    :return: 删除的时间线条数
+    """
+    timeline_max = settings.FEED_TIMELINE_MAX
+    deleted_total = 0
+
+    overflowed_uid_list = list(models.FeedItem.objects.values('ordinaryUser').annotate(
+        item_count=Count('id'),
+    ).filter(
+        item_count__gt=timeline_max,
+    ).values_list('ordinaryUser', flat=True))
+
+    for ordinary_user_uid in overflowed_uid_list:
+        expired_id_list = list(models.FeedItem.objects.filter(
+            ordinaryUser_id=ordinary_user_uid,
+        ).order_by('-create_time', '-blog').values_list('id', flat=True)[timeline_max:])
+
+        deleted_count, _ = models.FeedItem.objects.filter(id__in=expired_id_list).delete()
+        deleted_total += deleted_count
+
+    return deleted_total
@@ -0,0 +1,85 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from musicplayer import models
+
+# 计数字段: 名称 -> (计数所在的表, 计数字段, 被计数的关系表, 关系表中指向计数所在表的外键)
+COUNTERS = {
+    'producer_follower': (models.Producer, 'follower_count', models.UserFollowProducer, 'producer'),
+    'song_comment': (models.Song, 'comment_count', models.SongComment, 'song'),
+    'song_songlist': (models.Song, 'songlist_count', models.SongAndSongList, 'song'),
+    'community_member': (models.Community, 'member_count', models.UserFollowCommunity, 'community'),
+    'song_comment_like': (models.SongComment, 'likes', models.SongCommentLike, 'songComment'),
+    'blog_like': (models.Blog, 'likes', models.BlogLike, 'blog'),
+    'blog_comment_like': (models.BlogComment, 'likes', models.BlogCommentLike, 'blogComment'),
+}
+
+# 由 utils.likes 在各进程内缓冲、定期写入的计数。点赞记录已经插入而增量还在缓冲中时按关系表重新计数，
+# 缓冲写入后会重复计算，只能在所有服务进程停止后修复
+BUFFERED_COUNTERS = {'song_comment_like', 'blog_like', 'blog_comment_like'}
+
+
+def adjustCounter(counter: str, pk, delta: int):
+    """
+    在数据库中用 F() 增减计数，应与关系表的增删在同一事务中调用，事务回滚时计数一起回滚
+
+    :param counter: COUNTERS 中的名称
+    :param pk: 计数所在行的主键
+    :param delta: 增加的数量，负数为减少
+    """
+    counter_model, counter_field, _, _ = COUNTERS[counter]
+    counter_model.objects.filter(pk=pk).update(**{counter_field: F(counter_field) + delta})
+
+
+def recountCounter(counter: str, pk_list):
+    """
+    按关系表重新计算指定行的计数，用于批量增删关系后在同一事务中更新计数，
+    与 bulk_create(ignore_conflicts=True) 一起使用时不需要知道哪些行真正插入
+
+    :param counter: COUNTERS 中的名称
+    :param pk_list: 计数所在行的主键
+    """
+    counter_model, counter_field, relation_model, relation_field = COUNTERS[counter]
+    counter_model.objects.filter(pk__in=pk_list).update(
+        **{counter_field: _actualCount(relation_model, relation_field)}
+    )
+
+
+def _actualCount(relation_model, relation_field):
+    # 关系表中指向外层行的记录数
+    return Coalesce(Subquery(
+        relation_model.objects.filter(
+            **{relation_field: OuterRef('pk')}
+        ).order_by().values(relation_field).annotate(
+            count=Count('pk'),
+        ).values('count')
+    ), 0)
+
+
+def reconcileCounters(batch_size: int = 1000, include_buffered: bool = False) -> dict:
+    """
+    找出与关系表实际记录数不一致的计数并修复。
+    修复时在同一条 UPDATE 中重新计数，不会覆盖检查之后并发发生的增减
+
+    :param batch_size: 每条 UPDATE 修复的行数
+    :param include_buffered: 是否修复 BUFFERED_COUNTERS 中的计数，只能在所有服务进程停止后开启
+    :return: {计数名称: 修复的行数}
+    """
+    repaired = {}
+
+    for counter, (counter_model, counter_field, relation_model, relation_field) in COUNTERS.items():
+        if counter in BUFFERED_COUNTERS and not include_buffered:
+            continue
+
+        drifted_pk_list = list(counter_model.objects.annotate(
+            actual_count=_actualCount(relation_model, relation_field),
+        ).exclude(
+            **{counter_field: F('actual_count')}
+        ).values_list('pk', flat=True))
+
+        for start in range(0, len(drifted_pk_list), batch_size):
+            recountCounter(counter, drifted_pk_list[start:start + batch_size])
+
+        repaired[counter] = len(drifted_pk_list)
+
+    return repaired
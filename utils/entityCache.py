@@ -0,0 +1,119 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from musicplayer import models
+
+# 缓存的实体类型
+ENTITY_SONG = 'song'
+ENTITY_PRODUCER = 'producer'
+ENTITY_SONGLIST = 'songlist'
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def _getCache():
+    return caches[settings.ENTITY_CACHE_ALIAS]
+
+
+def _countStat(entity: str, stat: str):
+    with _stats_lock:
+        entity_stats = _stats.setdefault(entity, {'hit': 0, 'miss': 0, 'invalidate': 0})
+        entity_stats[stat] += 1
+
+
+def getEntityCacheStats() -> dict:
+    """
+    :return: 本进程内各实体的命中、未命中、失效次数，如 {'song': {'hit': 3, 'miss': 1, 'invalidate': 0}}
+    """
+    with _stats_lock:
+        return {entity: dict(entity_stats) for entity, entity_stats in _stats.items()}
+
+
+def _normalizeId(entity_id) -> str:
+    # 请求参数中的 uuid 可能带或不带连字符，统一成 32 位十六进制
+    try:
+        return uuid.UUID(str(entity_id)).hex
+    except ValueError:
+        return str(entity_id)
+
+
+def _generationKey(entity: str, entity_id) -> str:
+    return 'entity:{}:{}:generation'.format(entity, _normalizeId(entity_id))
+
+
+def _payloadKey(entity: str, entity_id, generation: int, variant: str) -> str:
+    return 'entity:{}:{}:{}:{}'.format(entity, _normalizeId(entity_id), generation, variant)
+
+
+def getCachedPayload(entity: str, entity_id, loader, variant: str = ''):
+    """
+    读穿缓存：命中时直接返回序列化好的响应数据，未命中时调用 loader 从数据库加载并写入缓存。
+    缓存键中带有实体的代数(generation)，失效时只需更换代数，同一实体的所有变体（如分页）一起失效；
+    settings.ENTITY_CACHE_VERSION 在响应结构变化时递增，使旧结构的缓存全部作废
+
+    :param entity: 实体类型，如 ENTITY_SONG
+    :param entity_id: 实体id
+    :param loader: 无参函数，返回可序列化的响应数据，实体不存在时返回None（None不会被缓存）
+    :param variant: 同一实体的不同视图，如分页参数
+    :return: 响应数据
+    """
+    cache = _getCache()
+    version = settings.ENTITY_CACHE_VERSION
+
+    generation = cache.get(_generationKey(entity, entity_id), 0, version=version)
+    payload_key = _payloadKey(entity, entity_id, generation, variant)
+
+    payload = cache.get(payload_key, version=version)
+
+    if payload is not None:
+        _countStat(entity, 'hit')
+        return payload
+
+    _countStat(entity, 'miss')
+    payload = loader()
+
+    if payload is not None:
+        cache.set(payload_key, payload, timeout=settings.ENTITY_CACHE_TIMEOUT, version=version)
+
+    return payload
+
+
+def invalidateEntity(entity: str, *entity_ids):
+    """
+    写接口修改实体后调用，更换实体的代数使其全部缓存失效
+
+    :param entity: 实体类型，如 ENTITY_SONG
+    :param entity_ids: 实体id
+    """
+    cache = _getCache()
+    version = settings.ENTITY_CACHE_VERSION
+
+    # 用时间戳作为新的代数，不依赖 incr 的原子性，也不会回到曾经用过的值。
+    # 代数的存活时间远长于数据，代数过期回到 0 时，旧代数 0 下的数据早已过期
+    generation = time.time_ns()
+
+    cache.set_many(
+        {_generationKey(entity, entity_id): generation for entity_id in entity_ids},
+        timeout=settings.ENTITY_CACHE_TIMEOUT * 10,
+        version=version,
+    )
+
+    for _ in entity_ids:
+        _countStat(entity, 'invalidate')
+
+
+def invalidateSongs(**filter_kwargs):
+    """
+    歌曲的缓存数据中包含专辑封面和创作者信息，专辑或创作者修改后使相关歌曲全部失效
+
+    :param filter_kwargs: Song 的过滤条件，如 album_id=...、producer_id=...
+    """
+    song_sid_list = list(models.Song.objects.filter(**filter_kwargs).values_list('sid', flat=True))
+
+    if song_sid_list:
+        invalidateEntity(ENTITY_SONG, *song_sid_list)
@@ -0,0 +1,103 @@
+import io
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+# 图片格式的文件头(magic bytes)，WebP 的文件头另外判断
+_IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+]
+
+# 读取文件头的字节数
+IMAGE_HEADER_SIZE = 16
+
+# 封面、头像允许的图片格式
+ALLOWED_IMAGE_FORMATS = ('jpeg', 'png')
+
+# 缩略图规格: 名称 -> 最长边的像素数，原图更小时不放大
+IMAGE_VARIANTS = {
+    'thumb': 160,
+    'medium': 480,
+    'large': 1080,
+}
+
+# 每个规格同时生成的格式: 扩展名 -> (Pillow 格式名, Content-Type)
+IMAGE_VARIANT_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpg': ('JPEG', 'image/jpeg'),
+}
+
+# 列表接口返回的缩略图
+THUMB_VARIANT = 'thumb'
+THUMB_EXTENSION = 'webp'
+
+# 文件头合法但内容损坏、截断或尺寸过大时 Pillow 抛出的异常
+IMAGE_DECODE_ERRORS = (OSError, SyntaxError, ValueError, Image.DecompressionBombError)
+
+
+def detectImageFormat(header: bytes) -> str | None:
+    """
+    :param header: 文件开头的至少 IMAGE_HEADER_SIZE 个字节
+    :return: 图片格式，如 jpeg、png，不是图片时返回None
+    """
+    for signature, image_format in _IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+
+    return None
+
+
+def isImageFile(request_file) -> bool:
+    """
+    按文件头检验上传的文件是否为允许的图片格式，与扩展名无关
+
+    :param request_file: POST请求中获取的文件，检验后文件指针回到开头
+    """
+    request_file.seek(0)
+    header = request_file.read(IMAGE_HEADER_SIZE)
+    request_file.seek(0)
+
+    return detectImageFormat(header) in ALLOWED_IMAGE_FORMATS
+
+
+def imageVariantKey(oss_key: str, variant: str, extension: str) -> str:
+    """
+    缩略图在 oss 中的路径，由原图路径推出，如 album/cover/abc.png -> album/cover/abc_thumb.webp
+
+    :param oss_key: 原图路径
+    :param variant: IMAGE_VARIANTS 的键
+    :param extension: IMAGE_VARIANT_FORMATS 的键
+    """
+    return '{}_{}.{}'.format(oss_key.rsplit('.', 1)[0], variant, extension)
+
+
+def renderImageVariants(local_path: str):
+    """
+    生成所有规格和格式的缩略图
+
+    :param local_path: 原图的本地路径
+    :return: 生成器，每项为 (规格, 扩展名, Content-Type, 图片数据)
+    """
+    with Image.open(local_path) as source_image:
+        # 按 EXIF 方向旋转，手机拍摄的照片不会躺倒
+        image = ImageOps.exif_transpose(source_image)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+
+        for variant, max_edge in IMAGE_VARIANTS.items():
+            resized_image = image.copy()
+            resized_image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+            for extension, (pillow_format, content_type) in IMAGE_VARIANT_FORMATS.items():
+                # JPEG 不支持透明通道
+                mode = 'RGBA' if has_alpha and pillow_format != 'JPEG' else 'RGB'
+
+                buffer = io.BytesIO()
+                resized_image.convert(mode).save(buffer, pillow_format, quality=settings.IMAGE_VARIANT_QUALITY)
+
+                yield variant, extension, content_type, buffer.getvalue()
@@ -0,0 +1,141 @@
+import functools
+
+from django.http import JsonResponse
+from django.utils.functional import cached_property
+
+from utils.modelOperation import decodeJwtToken
+from utils.result import Result
+
+
+class UserContext(object):
+    """
+    一次请求的鉴权上下文，由 JwtAuthMiddleware 挂在 request.user_ctx 上。
+    令牌、用户和创作者都在第一次访问时才解析，同一请求内只解析一次
+    """
+
+    def __init__(self, request):
+        self._request = request
+
+    @cached_property
+    def token(self) -> str | None:
+        """
+        依次从 Authorization: Bearer 请求头、POST 表单、GET 参数中读取 jwt 令牌
+
+        :return: 令牌字符串，没有携带令牌时返回None
+        """
+        authorization = self._request.headers.get('Authorization', '')
+
+        if authorization.startswith('Bearer '):
+            encode_jwt = authorization[len('Bearer '):].strip()
+        elif self._request.method == 'POST':
+            encode_jwt = self._request.POST.get('encode_jwt')
+        else:
+            encode_jwt = self._request.GET.get('encode_jwt')
+
+        if encode_jwt is None or encode_jwt == '':
+            return None
+
+        return encode_jwt
+
+    @cached_property
+    def ordinary_user(self):
+        """
+        :return: 令牌对应的用户，没有令牌或者令牌无效时返回None
+        """
+        if self.token is None:
+            return None
+
+        return decodeJwtToken(self.token)
+
+    @property
+    def producer(self):
+        """
+        :return: 用户的创作者信息，用户未认证或不是创作者时返回None
+        """
+        if self.ordinary_user is None:
+            return None
+
+        return self.ordinary_user.producer
+
+
+class JwtAuthMiddleware(object):
+    """
+    为每个请求挂上 request.user_ctx，具体的校验由 jwt_required / producer_required 完成
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.user_ctx = UserContext(request)
+        return self.get_response(request)
+
+
+def _getUserContext(request) -> UserContext:
+    # 没有安装中间件时（例如直接调用视图函数）就地创建
+    if not hasattr(request, 'user_ctx'):
+        request.user_ctx = UserContext(request)
+
+    return request.user_ctx
+
+
+def _checkJwt(user_ctx: UserContext) -> JsonResponse | None:
+    # 没有 jwt 令牌字段
+    if user_ctx.token is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_UNAUTHORIZED,
+            message='no jwt token',
+        ))
+
+    # jwt 令牌解析失败
+    if user_ctx.ordinary_user is None:
+        return JsonResponse(Result.failure(
+            code=Result.HTTP_STATUS_NOT_ACCEPTABLE,
+            message='invalid jwt token',
+        ))
+
+    return None
+
+
+def jwt_required(view_func):
+    """
+    视图装饰器，要求请求携带有效的 jwt 令牌，视图中通过 request.user_ctx.ordinary_user 获取用户
+    """
+
+    @functools.wraps(view_func)
+    def wrapped_view(request, *args, **kwargs):
+        failure_response = _checkJwt(_getUserContext(request))
+
+        if failure_response is not None:
+            return failure_response
+
+        return view_func(request, *args, **kwargs)
+
+    return wrapped_view
+
+
+def producer_required(view_func):
+    """
+    视图装饰器，在 jwt_required 的基础上要求用户具有创作者权限，
+    视图中通过 request.user_ctx.producer 获取创作者
+    """
+
+    @functools.wraps(view_func)
+    def wrapped_view(request, *args, **kwargs):
+        user_ctx = _getUserContext(request)
+
+        failure_response = _checkJwt(user_ctx)
+
+        if failure_response is not None:
+            return failure_response
+
+        # 查看用户是否有创作者权限
+        if user_ctx.producer is None:
+            return JsonResponse(Result.failure(
+                code=Result.HTTP_STATUS_UNAUTHORIZED,
+                message='producer authority required'
+            ))
+
+        return view_func(request, *args, **kwargs)
+
+    return wrapped_view
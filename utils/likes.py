@@ -0,0 +1,150 @@
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+
+from utils.counters import COUNTERS, adjustCounter
+
+logger = logging.getLogger(__name__)
+
+# 接口参数中的点赞目标 -> utils.counters 中的计数名称
+LIKE_TARGETS = {
+    'song_comment': 'song_comment_like',
+    'blog': 'blog_like',
+    'blog_comment': 'blog_comment_like',
+}
+
+# (计数名称, 被点赞的id) -> 尚未写入数据库的点赞数增量
+_pending = Counter()
+_pending_lock = threading.Lock()
+# 同一时间只有一个线程在写数据库
+_flush_lock = threading.Lock()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def _likeRecords(target: str, target_id, ordinary_user):
+    _, _, like_model, like_field = COUNTERS[LIKE_TARGETS[target]]
+    return like_model, {like_field + '_id': target_id, 'ordinaryUser': ordinary_user}
+
+
+def targetExists(target: str, target_id) -> bool:
+    """
+    :param target: LIKE_TARGETS 中的点赞目标
+    :param target_id: 被点赞的评论或帖子的id
+    """
+    target_model = COUNTERS[LIKE_TARGETS[target]][0]
+    return target_model.objects.filter(pk=target_id).exists()
+
+
+def addLike(target: str, target_id, ordinary_user) -> bool:
+    """
+    写入点赞记录，事务提交后把点赞数的增量放入进程内缓冲，由 flushLikes 合并写入
+
+    :param target: LIKE_TARGETS 中的点赞目标
+    :param target_id: 被点赞的评论或帖子的id
+    :param ordinary_user: 点赞的用户
+    :return: 是否新增了点赞，已经点赞过时返回False
+    """
+    like_model, like_fields = _likeRecords(target, target_id, ordinary_user)
+
+    try:
+        # 唯一约束去重，并发的重复点赞只有一个成功
+        with transaction.atomic():
+            like_model.objects.create(**like_fields)
+    except IntegrityError:
+        return False
+
+    transaction.on_commit(lambda: _addPending(LIKE_TARGETS[target], target_id, 1))
+    return True
+
+
+def removeLike(target: str, target_id, ordinary_user) -> bool:
+    """
+    :param target: LIKE_TARGETS 中的点赞目标
+    :param target_id: 被点赞的评论或帖子的id
+    :param ordinary_user: 取消点赞的用户
+    :return: 是否删除了点赞，没有点赞过时返回False
+    """
+    like_model, like_fields = _likeRecords(target, target_id, ordinary_user)
+
+    deleted_count, _ = like_model.objects.filter(**like_fields).delete()
+
+    if deleted_count:
+        transaction.on_commit(lambda: _addPending(LIKE_TARGETS[target], target_id, -deleted_count))
+
+    return deleted_count > 0
+
+
+def _addPending(counter: str, target_id, delta: int):
+    with _pending_lock:
+        _pending[(counter, target_id)] += delta
+
+    if settings.LIKE_FLUSH_INTERVAL == 0:
+        flushLikes()
+        return
+
+    _ensureFlusher()
+
+
+def _ensureFlusher():
+    global _flusher
+
+    if _flusher is not None:
+        return
+
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flushLoop, name='like-flusher', daemon=True)
+            _flusher.start()
+            # 进程正常退出时写入缓冲中剩余的增量
+            atexit.register(flushLikes)
+
+
+def _flushLoop():
+    while True:
+        time.sleep(settings.LIKE_FLUSH_INTERVAL)
+
+        # 后台线程有自己的数据库连接，按请求的方式在前后清理
+        close_old_connections()
+
+        try:
+            flushLikes()
+        except Exception:
+            logger.exception('like flush crashed')
+        finally:
+            close_old_connections()
+
+
+def flushLikes() -> int:
+    """
+    把缓冲中的点赞数增量写入数据库。同一目标在一个周期内的多次点赞合并成一条 UPDATE，
+    热门评论每个周期每个进程只加锁一次
+
+    :return: 更新的行数
+    """
+    with _flush_lock:
+        with _pending_lock:
+            pending = {key: delta for key, delta in _pending.items() if delta}
+            _pending.clear()
+
+        pending_items = list(pending.items())
+
+        for index, ((counter, target_id), delta) in enumerate(pending_items):
+            try:
+                adjustCounter(counter, target_id, delta)
+            except Exception:
+                # 写入失败时把未写入的增量放回缓冲，下次重试
+                logger.exception('like count update of %s %s failed', counter, target_id)
+
+                with _pending_lock:
+                    for key, remaining_delta in pending_items[index:]:
+                        _pending[key] += remaining_delta
+
+                return index
+
+    return len(pending_items)
@@ -0,0 +1,246 @@
+import atexit
+import logging
+import threading
+from collections import Counter, deque
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from musicplayer import models
+from utils import charts
+
+logger = logging.getLogger(__name__)
+
+# 收听事件类型
+EVENT_PLAY = 'p'
+EVENT_SKIP = 's'
+EVENT_COMPLETE = 'c'
+
+# 接口参数中的事件名 -> 事件类型
+EVENT_TYPES = {
+    'play': EVENT_PLAY,
+    'skip': EVENT_SKIP,
+    'complete': EVENT_COMPLETE,
+}
+
+# 播放进度的上限，与 ListeningEvent.position_ms 的整数列一致
+POSITION_MS_MAX = 2 ** 31 - 1
+
+# 由事件本身的数据引起的写入失败，重试无法成功；其余异常视为数据库暂时不可用
+_DATA_ERRORS = (DataError, IntegrityError, ValueError, TypeError, OverflowError)
+
+# 事件类型 -> 汇总表中的计数字段
+_COUNT_FIELDS = {
+    EVENT_PLAY: 'play_count',
+    EVENT_SKIP: 'skip_count',
+    EVENT_COMPLETE: 'complete_count',
+}
+
+_buffer = deque()
+_buffer_lock = threading.Lock()
+# 同一时间只有一个线程在写数据库，保证汇总的增量不会重复计算
+_flush_lock = threading.Lock()
+_flush_wakeup = threading.Event()
+_flusher = None
+
+_stats = {'recorded': 0, 'flushed': 0, 'dropped': 0, 'rejected': 0, 'flush_error': 0}
+
+
+def getListeningEventStats() -> dict:
+    """
+    :return: 本进程收到、写入、因缓冲区满丢弃、因数据无法写入而丢弃的事件数，写入失败的次数，以及缓冲区中的事件数
+    """
+    with _buffer_lock:
+        return dict(_stats, buffered=len(_buffer))
+
+
+def recordEvents(ordinary_user_uid, events):
+    """
+    把事件放入进程内缓冲区后立即返回。缓冲区达到 settings.LISTENING_EVENT_BATCH_SIZE 条
+    或距上次写入超过 settings.LISTENING_EVENT_FLUSH_INTERVAL 秒时由后台线程写入数据库；
+    该设置为 0 时在当前线程中立即写入
+
+    :param ordinary_user_uid: 收听的用户
+    :param events: [(歌曲id, 事件类型, 播放进度毫秒)]，事件类型为 EVENT_PLAY 等
+    """
+    event_time = timezone.now()
+
+    with _buffer_lock:
+        for song_sid, event_type, position_ms in events:
+            _buffer.append(models.ListeningEvent(
+                song_id=song_sid,
+                ordinaryUser_id=ordinary_user_uid,
+                event_type=event_type,
+                position_ms=position_ms,
+                event_time=event_time,
+            ))
+
+        _stats['recorded'] += len(events)
+
+        # 数据库长时间不可用时丢弃最早的事件，避免内存无限增长
+        overflow = len(_buffer) - settings.LISTENING_EVENT_BUFFER_MAX
+        for _ in range(max(0, overflow)):
+            _buffer.popleft()
+        _stats['dropped'] += max(0, overflow)
+
+        buffered = len(_buffer)
+
+    if settings.LISTENING_EVENT_FLUSH_INTERVAL == 0:
+        flushEvents()
+        return
+
+    _ensureFlusher()
+
+    if buffered >= settings.LISTENING_EVENT_BATCH_SIZE:
+        _flush_wakeup.set()
+
+
+def _ensureFlusher():
+    global _flusher
+
+    if _flusher is not None:
+        return
+
+    with _buffer_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flushLoop, name='listening-event-flusher', daemon=True)
+            _flusher.start()
+            # 进程正常退出时写入缓冲区中剩余的事件
+            atexit.register(flushEvents)
+
+
+def _flushLoop():
+    while True:
+        _flush_wakeup.wait(settings.LISTENING_EVENT_FLUSH_INTERVAL)
+        _flush_wakeup.clear()
+
+        # 后台线程有自己的数据库连接，按请求的方式在前后清理
+        close_old_connections()
+
+        try:
+            flushEvents()
+        except Exception:
+            logger.exception('listening event flush crashed')
+        finally:
+            close_old_connections()
+
+
+def _takeBatch() -> list:
+    with _buffer_lock:
+        batch_size = min(len(_buffer), settings.LISTENING_EVENT_BATCH_SIZE)
+        return [_buffer.popleft() for _ in range(batch_size)]
+
+
+def _requeue(batch):
+    # 写入失败的事件放回缓冲区头部，下次重试
+    with _buffer_lock:
+        _buffer.extendleft(reversed(batch))
+        _stats['flush_error'] += 1
+
+
+def flushEvents() -> int:
+    """
+    把缓冲区中的事件按批写入数据库，并增量累加小时、天汇总。
+    因数据本身写入失败的批次拆成两半分别重试，最终只丢弃无法写入的单条事件，
+    不会让一条坏数据反复阻塞整个缓冲区；数据库不可用时整批放回缓冲区，下次重试
+
+    :return: 写入的事件数
+    """
+    flushed_count = 0
+
+    with _flush_lock:
+        while True:
+            batch = _takeBatch()
+
+            if not batch:
+                break
+
+            # 待写入的部分，后进先出，拆开的两半按原顺序写入
+            parts = [batch]
+
+            while parts:
+                part = parts.pop()
+
+                try:
+                    flushed_count += _writeBatch(part)
+                except _DATA_ERRORS:
+                    if len(part) > 1:
+                        parts.extend([part[len(part) // 2:], part[:len(part) // 2]])
+                        continue
+
+                    logger.exception('listening event of song %s rejected', part[0].song_id)
+
+                    with _buffer_lock:
+                        _stats['rejected'] += 1
+                except Exception:
+                    logger.exception('listening event batch of %d failed', len(part))
+                    _requeue(part + [event for remaining_part in reversed(parts) for event in remaining_part])
+                    return flushed_count
+
+    return flushed_count
+
+
+def _writeBatch(batch) -> int:
+    # 歌曲可能在事件写入前被删除，丢弃这些事件，避免整批因外键失败
+    existing_song_sids = set(models.Song.objects.filter(
+        sid__in={event.song_id for event in batch},
+    ).values_list('sid', flat=True))
+
+    batch = [event for event in batch if event.song_id in existing_song_sids]
+
+    if not batch:
+        return 0
+
+    hourly_counts = Counter()
+    daily_counts = Counter()
+
+    for event in batch:
+        hour = event.event_time.replace(minute=0, second=0, microsecond=0)
+        hourly_counts[(event.song_id, hour, event.event_type)] += 1
+        daily_counts[(event.song_id, timezone.localdate(event.event_time), event.event_type)] += 1
+
+    with transaction.atomic():
+        models.ListeningEvent.objects.bulk_create(batch)
+
+        _accumulate(models.SongPlayHourly, 'hour', hourly_counts)
+        _accumulate(models.SongPlayDaily, 'day', daily_counts)
+
+        # 开始播放计入歌曲排行榜，跨天的批次按事件的日期分别累加
+        play_scores = {}
+
+        for (song_sid, day, event_type), count in daily_counts.items():
+            if event_type == EVENT_PLAY:
+                play_scores.setdefault(day, {})[song_sid] = count * charts.WEIGHT_PLAY
+
+        for day, increments in play_scores.items():
+            charts.recordActivity(charts.CHART_SONG, increments, day=day)
+
+    with _buffer_lock:
+        _stats['flushed'] += len(batch)
+
+    return len(batch)
+
+
+def _accumulate(rollup_model, period_field, counts):
+    """
+    :param rollup_model: SongPlayHourly 或 SongPlayDaily
+    :param period_field: 'hour' 或 'day'
+    :param counts: {(歌曲id, 时间段, 事件类型): 次数}
+    """
+    increments = {}
+
+    for (song_sid, period, event_type), count in counts.items():
+        increments.setdefault((song_sid, period), Counter())[_COUNT_FIELDS[event_type]] += count
+
+    # 先补齐不存在的行，再用 F() 在数据库中累加，多个进程同时写入时计数不会丢失
+    rollup_model.objects.bulk_create([
+        rollup_model(song_id=song_sid, **{period_field: period})
+        for song_sid, period in increments
+    ], ignore_conflicts=True)
+
+    for (song_sid, period), field_increments in increments.items():
+        rollup_model.objects.filter(song_id=song_sid, **{period_field: period}).update(**{
+            count_field: F(count_field) + count for count_field, count in field_increments.items()
+        })
@@ -0,0 +1,61 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLLRUCache(object):
+    """
+    进程内的有界缓存，容量满时淘汰最近最少使用的条目(LRU)，条目超过存活时间(TTL)后失效。
+    所有操作都加锁，可以在多线程的 WSGI worker 中共享同一个实例。
+    """
+
+    def __init__(self, max_size=1024, ttl=60):
+        """
+        :param max_size: 最多保存的条目数
+        :param ttl: 条目的存活时间，单位秒
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :param key: 缓存键
+        :return: 命中且未过期时返回缓存值，否则返回None
+        """
+        with self._lock:
+            entry = self._data.get(key)
+
+            if entry is None:
+                return None
+
+            expire_time, value = entry
+
+            if time.monotonic() > expire_time:
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
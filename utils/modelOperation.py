@@ -1,9 +1,18 @@
+import copy
 import time
 from datetime import datetime, timedelta
 import jwt
 
 from musicplayer import models
 from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import F
+
+from utils.lruCache import TTLLRUCache
+
+# jwt 鉴权用户缓存，uid -> (加载时的代数, OrdinaryUser)，首次使用时按配置创建
+_jwt_user_cache = None
 
 
 def generateJwtToken(ordinary_user, hours=2):
@@ -22,6 +31,7 @@ def generateJwtToken(ordinary_user, hours=2):
     payload = {
         'uid': str(ordinary_user.uid),
         'email': str(ordinary_user.email),
+        'ver': ordinary_user.token_version,
         'exp': int(expiration_time),  # 使用 'exp' 字段表示过期时间，这是JWT的一个标准字段
     }
 
@@ -57,10 +67,25 @@ def decodeJwtToken(jwt_token: str):
         if curr_time > expiration_time:
             return None
 
-        ordinary_user = models.OrdinaryUser.objects.filter(
-            uid=decoded_token['uid'],
-            email=decoded_token['email']
-        ).first()
+        # 旧版本令牌中没有 ver 字段，视为版本 0
+        token_version = decoded_token.get('ver', 0)
+
+        if not settings.JWT_USER_CACHE_ENABLED:
+            ordinary_user = models.OrdinaryUser.objects.select_related('producer').filter(
+                uid=decoded_token['uid'],
+                email=decoded_token['email'],
+                token_version=token_version,
+            ).first()
+
+            return ordinary_user
+
+        ordinary_user = getCachedUser(decoded_token['uid'])
+
+        if ordinary_user is None:
+            return None
+
+        if ordinary_user.email != decoded_token['email'] or ordinary_user.token_version != token_version:
+            return None
 
         return ordinary_user
 
@@ -69,3 +94,104 @@ def decodeJwtToken(jwt_token: str):
 
     except Exception as e:
         return None
+
+
+def _getJwtUserCache() -> TTLLRUCache:
+    global _jwt_user_cache
+
+    if _jwt_user_cache is None:
+        _jwt_user_cache = TTLLRUCache(
+            max_size=settings.JWT_USER_CACHE_MAX_SIZE,
+            ttl=settings.JWT_USER_CACHE_TTL,
+        )
+
+    return _jwt_user_cache
+
+
+def _userGenerationKey(uid) -> str:
+    return 'jwtuser:{}:generation'.format(uid)
+
+
+def getCachedUser(uid):
+    """
+    从进程内缓存中读取用户，未命中时查询数据库并写入缓存。
+    每次读取都与共享缓存中用户的代数比较，其他进程修改密码、资料后本进程的副本立即作废。
+    创作者信息通过 select_related 一并取出，视图访问 ordinary_user.producer 时不会再次查询
+
+    :param uid: 用户id
+    :return: 用户对象的副本，视图修改它不会影响缓存；用户不存在返回None
+    """
+    cache = _getJwtUserCache()
+    cache_key = str(uid)
+
+    generation = caches[settings.ENTITY_CACHE_ALIAS].get(
+        _userGenerationKey(uid), 0, version=settings.ENTITY_CACHE_VERSION,
+    )
+
+    cached_entry = cache.get(cache_key)
+
+    if cached_entry is not None and cached_entry[0] == generation:
+        return copy.copy(cached_entry[1])
+
+    ordinary_user = models.OrdinaryUser.objects.select_related('producer').filter(
+        uid=uid,
+    ).first()
+
+    if ordinary_user is None:
+        return None
+
+    cache.set(cache_key, (generation, ordinary_user))
+
+    return copy.copy(ordinary_user)
+
+
+def invalidateJwtUserCache(uid):
+    """
+    用户信息被修改后调用，删除本进程缓存中的用户，并更换共享缓存中用户的代数，
+    其余 worker 进程在下一次请求时重新查询数据库，修改密码后旧令牌在所有进程中立即失效
+
+    :param uid: 用户id
+    """
+    if _jwt_user_cache is not None:
+        _jwt_user_cache.delete(str(uid))
+
+    # 代数只需比进程内缓存的副本存活得久，副本过期后会重新查询数据库
+    caches[settings.ENTITY_CACHE_ALIAS].set(
+        _userGenerationKey(uid), time.time_ns(),
+        timeout=settings.JWT_USER_CACHE_TTL * 2, version=settings.ENTITY_CACHE_VERSION,
+    )
+
+
+def bulkUpsert(model, objs: list, unique_fields: list[str], update_fields: list[str]):
+    """
+    批量插入，唯一键冲突时更新指定字段（INSERT ... ON DUPLICATE KEY UPDATE）。
+    MySQL 不支持指定冲突字段，由表上的唯一索引决定，其余数据库需要给出 unique_fields
+
+    :param model: Model层定义的模型类
+    :param objs: 待写入的模型对象列表
+    :param unique_fields: 决定是否冲突的唯一字段
+    :param update_fields: 冲突时更新的字段
+    """
+    if not connection.features.supports_update_conflicts_with_target:
+        unique_fields = None
+
+    return model.objects.bulk_create(
+        objs,
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=update_fields,
+    )
+
+
+def producerInfoAnnotations(producer_path='producer') -> dict:
+    """
+    创作者的名称和头像保存在普通用户表中。返回用于 annotate 的表达式，
+    在主查询中 JOIN 取出，代替逐行访问关联对象或额外关联 producer_view
+
+    :param producer_path: 从被查询模型到 Producer 的关联路径，如 'producer'、'song__producer'
+    :return: {'producer_name': ..., 'producer_profile_picture_url': ...}
+    """
+    return {
+        'producer_name': F(producer_path + '__ordinaryuser__username'),
+        'producer_profile_picture_url': F(producer_path + '__ordinaryuser__profile_picture_url'),
+    }
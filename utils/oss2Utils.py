@@ -1,30 +1,115 @@
+import json
+import os
+import threading
+import time
+
 import oss2
 from django.core.files.uploadedfile import TemporaryUploadedFile
+from oss2.credentials import Credentials, CredentialsProvider
 from oss2.models import PutObjectResult
 from django.conf import settings
 
 
+class ReloadableCredentialsProvider(CredentialsProvider):
+    """
+    每次请求签名时提供当前的访问密钥。
+    配置了 settings.ALIYUN_CREDENTIALS_FILE 时从该 JSON 文件读取，文件修改后自动重新加载，轮换密钥不需要重启；
+    否则使用 settings.ALIYUN_ACCESS_KEY_ID / ALIYUN_ACCESS_KEY_SECRET
+    """
+
+    # 检查密钥文件是否修改的最小间隔，单位秒
+    CHECK_INTERVAL = 5
+
+    def __init__(self):
+        self._credentials = None
+        self._file_mtime = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def get_credentials(self):
+        credentials_file = settings.ALIYUN_CREDENTIALS_FILE
+
+        if not credentials_file:
+            return Credentials(settings.ALIYUN_ACCESS_KEY_ID, settings.ALIYUN_ACCESS_KEY_SECRET)
+
+        if self._credentials is None or time.monotonic() - self._last_check >= self.CHECK_INTERVAL:
+            with self._lock:
+                self._reload(credentials_file)
+
+        return self._credentials
+
+    def reload(self):
+        """
+        立即重新读取密钥文件
+        """
+        with self._lock:
+            self._file_mtime = None
+
+            if settings.ALIYUN_CREDENTIALS_FILE:
+                self._reload(settings.ALIYUN_CREDENTIALS_FILE)
+
+    def _reload(self, credentials_file):
+        self._last_check = time.monotonic()
+        file_mtime = os.stat(credentials_file).st_mtime_ns
+
+        if file_mtime == self._file_mtime:
+            return
+
+        # 文件格式: {"access_key_id": "...", "access_key_secret": "...", "security_token": "..."}
+        with open(credentials_file, encoding='utf-8') as f:
+            credentials_info = json.load(f)
+
+        self._credentials = Credentials(
+            credentials_info['access_key_id'],
+            credentials_info['access_key_secret'],
+            credentials_info.get('security_token', ''),
+        )
+        self._file_mtime = file_mtime
+
+
 class OSS2Utils:
     bucket_name = 'tjmusicplayer'
     endpoint_profile = 'https://'
     endpoint = 'oss-cn-hangzhou.aliyuncs.com'
 
+    credentials_provider = ReloadableCredentialsProvider()
+
+    _bucket = None
+    _bucket_lock = threading.Lock()
+
     @staticmethod
     def get_auth():
-        aliyun_access_key_id = settings.ALIYUN_ACCESS_KEY_ID
-        aliyun_secret_access_key = settings.ALIYUN_ACCESS_KEY_SECRET
-        auth = oss2.Auth(aliyun_access_key_id, aliyun_secret_access_key)
-        return auth
+        # 签名时才读取密钥，密钥轮换后已创建的 Bucket 继续可用
+        return oss2.ProviderAuth(OSS2Utils.credentials_provider)
 
     @staticmethod
     def get_bucket():
-        auth = OSS2Utils.get_auth()
-        bucket = oss2.Bucket(
-            auth=auth,
-            endpoint=OSS2Utils.endpoint_profile + OSS2Utils.endpoint,
-            bucket_name=OSS2Utils.bucket_name,
-        )
-        return bucket
+        """
+        第一次使用时创建，此后所有线程共用同一个 Bucket，
+        其 HTTP 会话保持 settings.OSS_HTTP_POOL_SIZE 个长连接，上传时不必重新建立 TLS 连接
+        """
+        if OSS2Utils._bucket is None:
+            with OSS2Utils._bucket_lock:
+                if OSS2Utils._bucket is None:
+                    OSS2Utils._bucket = oss2.Bucket(
+                        auth=OSS2Utils.get_auth(),
+                        endpoint=OSS2Utils.endpoint_profile + OSS2Utils.endpoint,
+                        bucket_name=OSS2Utils.bucket_name,
+                        session=oss2.Session(pool_size=settings.OSS_HTTP_POOL_SIZE),
+                        connect_timeout=settings.OSS_TIMEOUT,
+                    )
+
+        return OSS2Utils._bucket
+
+    @staticmethod
+    def reset():
+        """
+        丢弃共用的 Bucket 并重新读取密钥，下次使用时按当前配置重新创建
+        """
+        with OSS2Utils._bucket_lock:
+            OSS2Utils._bucket = None
+
+        OSS2Utils.credentials_provider.reload()
 
     @staticmethod
     def upload(request_file, oss_filename, oss_folder: list[str]) -> str | None:
@@ -44,9 +129,11 @@ class OSS2Utils:
         bucket = OSS2Utils.get_bucket()
 
         if isinstance(request_file, TemporaryUploadedFile):
-            result = bucket.put_object_from_file(
-                key=oss_key,
-                filename=request_file.temporary_file_path(),
+            # 大文件已经落在磁盘上，直接从临时文件分片上传，不读入内存
+            result = OSS2Utils.resumable_upload(
+                bucket=bucket,
+                local_path=request_file.temporary_file_path(),
+                oss_key=oss_key,
             )
         else:
             result = bucket.put_object(
@@ -55,13 +142,129 @@ class OSS2Utils:
             )
 
         if isinstance(result, PutObjectResult):
-            return '{}{}.{}/{}'.format(
-                OSS2Utils.endpoint_profile,  # https://
-                OSS2Utils.bucket_name,  # music_player
-                # .
-                OSS2Utils.endpoint,
-                # /
-                oss_key,
-            )
+            return OSS2Utils.get_object_url(oss_key)
         else:
             return None
+
+    @staticmethod
+    def get_object_url(oss_key) -> str:
+        return '{}{}.{}/{}'.format(
+            OSS2Utils.endpoint_profile,  # https://
+            OSS2Utils.bucket_name,  # music_player
+            # .
+            OSS2Utils.endpoint,
+            # /
+            oss_key,
+        )
+
+    @staticmethod
+    def resumable_upload(bucket, local_path, oss_key, progress_callback=None):
+        """
+        超过 settings.OSS_MULTIPART_THRESHOLD 的文件使用分片上传，多个线程并行上传分片。
+        已完成的分片记录在本地检查点中，同一文件上传到同一路径失败后重试时只上传剩余的分片
+
+        :return: oss2 的上传结果
+        """
+        return oss2.resumable_upload(
+            bucket=bucket,
+            key=oss_key,
+            filename=local_path,
+            store=oss2.ResumableStore(root=settings.OSS_CHECKPOINT_DIR),
+            multipart_threshold=settings.OSS_MULTIPART_THRESHOLD,
+            part_size=settings.OSS_PART_SIZE,
+            num_threads=settings.OSS_UPLOAD_THREADS,
+            progress_callback=progress_callback,
+        )
+
+    @staticmethod
+    def upload_local_file(local_path, oss_key, progress_callback=None) -> str | None:
+        """
+
+        :param local_path: 本地文件路径
+        :param oss_key: oss 中的完整路径，如 song/audio/xxx.mp3
+        :param progress_callback: 上传进度回调，参数为 (已上传字节数, 总字节数)
+        :return: 文件上传后的url路径
+        """
+        result = OSS2Utils.resumable_upload(
+            bucket=OSS2Utils.get_bucket(),
+            local_path=local_path,
+            oss_key=oss_key,
+            progress_callback=progress_callback,
+        )
+
+        if isinstance(result, PutObjectResult):
+            return OSS2Utils.get_object_url(oss_key)
+        else:
+            return None
+
+    @staticmethod
+    def sign_upload_url(oss_key, expires) -> str:
+        """
+
+        :param oss_key: oss 中的完整路径
+        :param expires: 有效期，单位秒
+        :return: 预签名的上传地址，客户端用 PUT 请求直接上传文件
+        """
+        return OSS2Utils.get_bucket().sign_url('PUT', oss_key, expires, slash_safe=True)
+
+    @staticmethod
+    def get_object_size(oss_key) -> int | None:
+        """
+
+        :param oss_key: oss 中的完整路径
+        :return: 文件大小，文件不存在时返回None
+        """
+        try:
+            return OSS2Utils.get_bucket().head_object(oss_key).content_length
+        except oss2.exceptions.NotFound:
+            return None
+
+    @staticmethod
+    def delete_object(oss_key):
+        OSS2Utils.get_bucket().delete_object(oss_key)
+
+    @staticmethod
+    def upload_bytes(oss_key, data: bytes, content_type) -> str | None:
+        """
+
+        :param oss_key: oss 中的完整路径
+        :param data: 文件内容
+        :param content_type: 文件的 Content-Type，浏览器按它显示图片
+        :return: 文件上传后的url路径
+        """
+        result = OSS2Utils.get_bucket().put_object(
+            key=oss_key,
+            data=data,
+            headers={'Content-Type': content_type},
+        )
+
+        if isinstance(result, PutObjectResult):
+            return OSS2Utils.get_object_url(oss_key)
+        else:
+            return None
+
+    @staticmethod
+    def read_object_range(oss_key, start, end) -> bytes:
+        """
+
+        :param oss_key: oss 中的完整路径
+        :param start: 起始字节，包含
+        :param end: 结束字节，包含
+        :return: 文件在该范围内的内容
+        """
+        return OSS2Utils.get_bucket().get_object(oss_key, byte_range=(start, end)).read()
+
+    @staticmethod
+    def open_object_range(oss_key, start, end):
+        """
+
+        :param oss_key: oss 中的完整路径
+        :param start: 起始字节，包含
+        :param end: 结束字节，包含
+        :return: 可以分块 read() 的响应流，读完后应 close()
+        """
+        return OSS2Utils.get_bucket().get_object(oss_key, byte_range=(start, end))
+
+    @staticmethod
+    def download_object(oss_key, local_path):
+        OSS2Utils.get_bucket().get_object_to_file(oss_key, local_path)
@@ -0,0 +1,171 @@
+import base64
+import json
+from datetime import date, datetime
+from uuid import UUID
+
+from django.db.models import Q
+
+from utils import utils
+
+# 每页默认条数和最大条数
+DEFAULT_PAGE_LIMIT = 20
+MAX_PAGE_LIMIT = 100
+
+
+def parseLimit(limit_str: str | None) -> int:
+    """
+    :param limit_str: 请求中的 limit 参数
+    :return: 每页条数，缺省或非法时取默认值，并限制在 [1, MAX_PAGE_LIMIT] 之间
+    """
+    limit = utils.strToInt(limit_str, DEFAULT_PAGE_LIMIT)
+    return min(max(limit, 1), MAX_PAGE_LIMIT)
+
+
+def _jsonDefault(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+
+    if isinstance(value, UUID):
+        return value.hex
+
+    raise TypeError('{} is not cursor serializable'.format(type(value)))
+
+
+def encodeCursor(values: list) -> str:
+    """
+    :param values: 当前页最后一条记录的排序键
+    :return: 不透明的游标字符串，可以直接放在 URL 中
+    """
+    payload = json.dumps(values, default=_jsonDefault, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decodeCursor(cursor: str) -> list:
+    """
+    :param cursor: encodeCursor 生成的游标
+    :return: 排序键列表
+    :raise ValueError: 游标格式不合法
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(payload)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('invalid cursor') from e
+
+    if not isinstance(values, list):
+        raise ValueError('invalid cursor')
+
+    return values
+
+
+def _keysetCondition(model, ordering: list[str], cursor_values: list) -> Q:
+    """
+    生成"排在游标之后"的过滤条件，例如排序为 (-a, -b) 时为 a < va OR (a = va AND b < vb)
+    """
+    if len(cursor_values) != len(ordering):
+        raise ValueError('invalid cursor')
+
+    fields = []
+    for order_field, raw_value in zip(ordering, cursor_values):
+        field_name = order_field.lstrip('-')
+        try:
+            value = model._meta.get_field(field_name).to_python(raw_value)
+        except Exception as e:
+            raise ValueError('invalid cursor') from e
+        fields.append((field_name, order_field.startswith('-'), value))
+
+    condition = Q()
+    equal_prefix = Q()
+
+    for field_name, descending, value in fields:
+        lookup = '{}__{}'.format(field_name, 'lt' if descending else 'gt')
+        condition |= equal_prefix & Q(**{lookup: value})
+        equal_prefix &= Q(**{field_name: value})
+
+    return condition
+
+
+def paginateQueryset(queryset, ordering: list[str], cursor: str | None, limit: int):
+    """
+    键集(keyset)分页：按 ordering 排序，从游标之后取 limit 条记录。
+    每一页的开销只与页大小有关，需要排序字段上有对应的联合索引
+
+    :param queryset: 待分页的查询集，可以是模型对象或 values() 字典
+    :param ordering: 排序字段，如 ['-release_time', '-scid']，最后一个字段必须唯一
+    :param cursor: 上一页返回的游标，第一页为None
+    :param limit: 每页条数
+    :return: (当前页记录列表, 下一页游标)，没有下一页时游标为None
+    :raise ValueError: 游标格式不合法
+    """
+    queryset = queryset.order_by(*ordering)
+
+    if cursor:
+        queryset = queryset.filter(_keysetCondition(queryset.model, ordering, decodeCursor(cursor)))
+
+    page = list(queryset[:limit + 1])
+
+    if len(page) <= limit:
+        return page, None
+
+    page = page[:limit]
+    last_record = page[-1]
+
+    return page, encodeCursor([
+        last_record[order_field.lstrip('-')] if isinstance(last_record, dict)
+        else getattr(last_record, order_field.lstrip('-'))
+        for order_field in ordering
+    ])
+
+
+def paginateMergedQuerysets(sources: list[tuple], cursor: str | None, limit: int):
+    """
+    多个查询集按相同的排序键合并后做键集分页，如时间线中写扩散的记录和读扩散的帖子。
+    每个查询集只取游标之后的 limit + 1 条，合并去重后取前 limit 条
+
+    :param sources: [(查询集, 排序字段)]，各查询集的排序字段一一对应且方向相同，
+                    如 ['-create_time', '-blog'] 与 ['-create_time', '-bid']，最后一个字段必须唯一
+    :param cursor: 上一页返回的游标，第一页为None
+    :param limit: 每页条数
+    :return: (当前页的排序键元组列表, 下一页游标)，没有下一页时游标为None
+    :raise ValueError: 游标格式不合法
+    """
+    cursor_values = decodeCursor(cursor) if cursor else None
+    descending = sources[0][1][0].startswith('-')
+
+    merged = set()
+
+    for queryset, ordering in sources:
+        queryset = queryset.order_by(*ordering)
+
+        if cursor_values is not None:
+            queryset = queryset.filter(_keysetCondition(queryset.model, ordering, cursor_values))
+
+        merged.update(queryset.values_list(*[order_field.lstrip('-') for order_field in ordering])[:limit + 1])
+
+    page = sorted(merged, reverse=descending)
+
+    if len(page) <= limit:
+        return page, None
+
+    page = page[:limit]
+
+    return page, encodeCursor(list(page[-1]))
+
+
+def decodeOffsetCursor(cursor: str | None) -> int:
+    """
+    按相关度排序的结果没有稳定的键，游标中只保存偏移量
+
+    :param cursor: encodeCursor([offset]) 生成的游标
+    :return: 偏移量，第一页为0
+    :raise ValueError: 游标格式不合法
+    """
+    if not cursor:
+        return 0
+
+    values = decodeCursor(cursor)
+
+    if len(values) != 1 or not isinstance(values[0], int) or values[0] < 0:
+        raise ValueError('invalid cursor')
+
+    return values[0]
@@ -0,0 +1,151 @@
+import json
+import uuid
+
+from django.db.models import Max
+
+from musicplayer import models
+from utils.modelOperation import producerInfoAnnotations
+
+# 相邻歌曲 position 之间的间隔，在两首歌曲之间插入时取中间值，
+# 同一位置连续插入约 16 次后间隔用尽，才需要重新排列整个歌单
+POSITION_GAP = 1 << 16
+
+
+def _lockSongList(songlist):
+    # 锁住歌单行，同一歌单分配 position 的事务依次执行，position 不会重复
+    models.SongList.objects.select_for_update().filter(slid=songlist.slid).values_list('slid').first()
+
+
+def appendPositions(songlist, count: int) -> list:
+    """
+    为追加到歌单末尾的歌曲分配 position，应在插入歌曲的事务中调用
+
+    :param songlist: 歌单
+    :param count: 追加的歌曲数
+    :return: 按追加顺序排列的 position
+    """
+    _lockSongList(songlist)
+
+    last_position = models.SongAndSongList.objects.filter(
+        songList=songlist,
+    ).aggregate(last_position=Max('position'))['last_position'] or 0
+
+    return [last_position + POSITION_GAP * (index + 1) for index in range(count)]
+
+
+def moveSongs(songlist, raw_sid_list, after_sid=None) -> int:
+    """
+    把歌曲按给定顺序连续地移动到 after_sid 之后，after_sid 为空时移动到歌单开头。
+    前后两首歌曲之间的间隔足够时只修改被移动的行，间隔用尽时重新排列整个歌单。
+    应在事务中调用
+
+    :param songlist: 用户自己的歌单
+    :param raw_sid_list: 被移动的歌曲id，不能重复
+    :param after_sid: 移动到这首歌曲之后，不能是被移动的歌曲
+    :return: 修改 position 的行数
+    :raise ValueError: 歌曲id不合法、重复或不在歌单中
+    """
+    try:
+        song_sid_list = [uuid.UUID(str(raw_sid)) for raw_sid in raw_sid_list]
+        after_sid = uuid.UUID(str(after_sid)) if after_sid else None
+    except ValueError:
+        raise ValueError('invalid song id')
+
+    if not song_sid_list or len(set(song_sid_list)) != len(song_sid_list) or after_sid in song_sid_list:
+        raise ValueError('song ids should be distinct and not include after_sid')
+
+    _lockSongList(songlist)
+
+    songlist_records = models.SongAndSongList.objects.filter(songList=songlist)
+
+    moved_id_dict = dict(songlist_records.filter(song_id__in=song_sid_list).values_list('song_id', 'id'))
+
+    if len(moved_id_dict) != len(song_sid_list):
+        raise ValueError('song not in song list')
+
+    other_records = songlist_records.exclude(song_id__in=song_sid_list).order_by('position', 'id')
+
+    if after_sid is None:
+        prev_position = None
+        next_record = other_records.values_list('position', flat=True).first()
+    else:
+        prev_position = other_records.filter(song_id=after_sid).values_list('position', flat=True).first()
+
+        if prev_position is None:
+            raise ValueError('song not in song list')
+
+        next_record = other_records.filter(position__gt=prev_position).values_list('position', flat=True).first()
+
+    moved_count = len(song_sid_list)
+
+    if prev_position is None and next_record is None:
+        new_positions = [POSITION_GAP * (index + 1) for index in range(moved_count)]
+    elif next_record is None:
+        new_positions = [prev_position + POSITION_GAP * (index + 1) for index in range(moved_count)]
+    elif prev_position is None:
+        new_positions = [next_record - POSITION_GAP * (moved_count - index) for index in range(moved_count)]
+    elif next_record - prev_position > moved_count:
+        step = (next_record - prev_position) // (moved_count + 1)
+        new_positions = [prev_position + step * (index + 1) for index in range(moved_count)]
+    else:
+        return _rebalance(songlist, [moved_id_dict[song_sid] for song_sid in song_sid_list], after_sid)
+
+    models.SongAndSongList.objects.bulk_update([
+        models.SongAndSongList(id=moved_id_dict[song_sid], position=position)
+        for song_sid, position in zip(song_sid_list, new_positions)
+    ], ['position'])
+
+    return moved_count
+
+
+def _rebalance(songlist, moved_id_list: list, after_sid) -> int:
+    # 被移动的歌曲插入 after_sid 之后，整个歌单按 POSITION_GAP 重新编号，只写入 position 改变的行
+    moved_id_set = set(moved_id_list)
+    ordered_records = [
+        record for record in models.SongAndSongList.objects.filter(
+            songList=songlist,
+        ).order_by('position', 'id').values_list('id', 'song_id', 'position')
+        if record[0] not in moved_id_set
+    ]
+
+    insert_index = 0 if after_sid is None else next(
+        index + 1 for index, (_, song_sid, _) in enumerate(ordered_records) if song_sid == after_sid
+    )
+    position_dict = {record_id: position for record_id, _, position in ordered_records}
+
+    ordered_id_list = [record_id for record_id, _, _ in ordered_records]
+    ordered_id_list[insert_index:insert_index] = moved_id_list
+
+    changed_records = [
+        models.SongAndSongList(id=record_id, position=POSITION_GAP * (index + 1))
+        for index, record_id in enumerate(ordered_id_list)
+        if position_dict.get(record_id) != POSITION_GAP * (index + 1)
+    ]
+
+    models.SongAndSongList.objects.bulk_update(changed_records, ['position'], batch_size=1000)
+
+    return len(changed_records)
+
+
+def iterSongListLines(songlist, chunk_size: int = 1000):
+    """
+    按歌单顺序逐行生成 JSON，每行一首歌曲。逐批从数据库读取，大歌单导出时不会全部载入内存
+
+    :param songlist: 歌单
+    :param chunk_size: 每次从数据库读取的行数
+    :return: JSON-lines 格式的行，每行以换行符结尾
+    """
+    for record in models.SongAndSongList.objects.filter(
+            songList=songlist,
+    ).annotate(
+        **producerInfoAnnotations('song__producer'),
+    ).order_by('position', 'id').values(
+        'song_id', 'song__sname', 'song__album__aname', 'producer_name', 'collect_time',
+    ).iterator(chunk_size=chunk_size):
+        yield json.dumps({
+            'sid': str(record['song_id']),
+            'sname': record['song__sname'],
+            'album_aname': record['song__album__aname'],
+            'producer_username': record['producer_name'],
+            'collect_time': record['collect_time'].strftime('%Y-%m-%d %H:%M:%S'),
+        }, ensure_ascii=False) + '\n'
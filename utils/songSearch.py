@@ -0,0 +1,368 @@
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Q
+
+from musicplayer import models
+from utils.modelOperation import bulkUpsert
+
+# 中日韩文字，按 n-gram 切分；其余的字母数字按单词切分
+_CJK_CHARS = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+_TOKEN_PATTERN = re.compile(
+    r'(?P<cjk>[{cjk}]+)|(?P<word>[^\W_{cjk}]+)'.format(cjk=_CJK_CHARS)
+)
+
+# 各字段命中时的权重，歌曲名最高
+FIELD_WEIGHTS = {
+    'sname': 3.0,
+    'aname': 2.0,
+    'producer_name': 1.0,
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    索引时的分词：中日韩文字切成单字和二元组(bigram)，其余按单词切分并转为小写
+
+    :param text: 待分词的文本
+    :return: 词项列表，可能有重复
+    """
+    terms = []
+
+    for match in _TOKEN_PATTERN.finditer((text or '').lower()):
+        if match.group('word') is not None:
+            terms.append(match.group('word'))
+            continue
+
+        run = match.group('cjk')
+        terms.extend(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+
+    return terms
+
+
+def tokenizeQuery(keyword: str) -> list[tuple[str, bool]]:
+    """
+    查询时的分词：中日韩文字只取二元组（单个字时取单字），
+    最后一个单词按前缀匹配，以支持边输入边搜索
+
+    :param keyword: 搜索框中的字符串
+    :return: (词项, 是否前缀匹配) 列表
+    """
+    query_terms = []
+    last_is_word = False
+
+    for match in _TOKEN_PATTERN.finditer((keyword or '').lower()):
+        last_is_word = match.group('word') is not None
+
+        if last_is_word:
+            query_terms.append((match.group('word'), False))
+            continue
+
+        run = match.group('cjk')
+        if len(run) == 1:
+            query_terms.append((run, False))
+        else:
+            query_terms.extend((run[i:i + 2], False) for i in range(len(run) - 1))
+
+    if last_is_word:
+        query_terms[-1] = (query_terms[-1][0], True)
+
+    return query_terms
+
+
+def _loadDocuments(**filter_kwargs) -> list[dict]:
+    """
+    从歌曲、专辑、创作者信息中生成搜索文档
+    """
+    return [
+        {
+            'song_id': song_row['sid'],
+            'sname': song_row['sname'] or '',
+            'aname': song_row['album__aname'] or '',
+            'producer_name': song_row['producer__ordinaryuser__username'] or '',
+        }
+        for song_row in models.Song.objects.filter(**filter_kwargs).values(
+            'sid', 'sname', 'album__aname', 'producer__ordinaryuser__username'
+        )
+    ]
+
+
+class SongSearchBackend(object):
+    """
+    歌曲搜索后端的公共接口。
+    索引的维护统一写入 SongSearchDocument 表，子类只需要实现 search 和写入后的附加处理
+    """
+
+    def indexSong(self, song_sid):
+        self._saveDocuments(_loadDocuments(sid=song_sid))
+
+    def indexAlbum(self, album_aid):
+        self._saveDocuments(_loadDocuments(album_id=album_aid))
+
+    def indexProducer(self, producer_pid):
+        self._saveDocuments(_loadDocuments(producer_id=producer_pid))
+
+    def removeSong(self, song_sid):
+        models.SongSearchDocument.objects.filter(song_id=song_sid).delete()
+        self._afterRemove(song_sid)
+
+    def search(self, keyword: str, offset=0, limit=20) -> list:
+        """
+        :param keyword: 搜索关键字
+        :param offset: 跳过的结果数
+        :param limit: 返回的最大结果数
+        :return: 按相关度从高到低排列的歌曲id列表
+        """
+        raise NotImplementedError
+
+    def _saveDocuments(self, documents: list[dict]):
+        if not documents:
+            return
+
+        bulkUpsert(
+            model=models.SongSearchDocument,
+            objs=[models.SongSearchDocument(**document) for document in documents],
+            unique_fields=['song'],
+            update_fields=['sname', 'aname', 'producer_name', 'update_time'],
+        )
+        self._afterSave(documents)
+
+    def _afterSave(self, documents: list[dict]):
+        pass
+
+    def _afterRemove(self, song_sid):
+        pass
+
+
+class MysqlSongSearchBackend(SongSearchBackend):
+    """
+    基于 MySQL ngram 全文索引的搜索后端，适合多进程部署
+    """
+
+    # MATCH 的列必须与全文索引的列完全一致
+    MATCH_SQL = 'MATCH (sname, aname, producer_name) AGAINST (%s IN BOOLEAN MODE)'
+
+    def search(self, keyword: str, offset=0, limit=20) -> list:
+        query_terms = tokenizeQuery(keyword)
+
+        if not query_terms:
+            return []
+
+        queryset = models.SongSearchDocument.objects.all()
+
+        # ngram 索引按二元组建立，单个字母或汉字无法用全文索引命中，这些词用 LIKE 过滤
+        for term, _ in query_terms:
+            if len(term) < 2:
+                queryset = queryset.filter(
+                    Q(sname__icontains=term) | Q(aname__icontains=term) | Q(producer_name__icontains=term)
+                )
+
+        fulltext_terms = [(term, is_prefix) for term, is_prefix in query_terms if len(term) >= 2]
+
+        if not fulltext_terms:
+            return list(queryset.order_by('sname').values_list('song_id', flat=True)[offset:offset + limit])
+
+        boolean_query = ' '.join(
+            '+{}*'.format(term) if is_prefix else '+"{}"'.format(term)
+            for term, is_prefix in fulltext_terms
+        )
+
+        return list(
+            queryset.extra(
+                select={'score': self.MATCH_SQL},
+                select_params=[boolean_query],
+                where=[self.MATCH_SQL],
+                params=[boolean_query],
+            ).order_by('-score', 'sname').values_list('song_id', flat=True)[offset:offset + limit]
+        )
+
+
+class MemorySongSearchBackend(SongSearchBackend):
+    """
+    纯 Python 的进程内倒排索引。
+    第一次搜索时从 SongSearchDocument 表全量加载，之后按 update_time 增量同步其余进程写入的文档，
+    本进程的写入立即生效。其余进程删除的文档无法增量同步，搜索结果返回前与文档表核对
+    """
+
+    def __init__(self, sync_interval=2):
+        """
+        :param sync_interval: 两次增量同步之间的最小间隔，单位秒
+        """
+        self.sync_interval = sync_interval
+
+        # 词项 -> {歌曲id: 权重}
+        self._postings = {}
+        # 歌曲id -> (词项集合, 歌曲名)，删除和更新文档时使用
+        self._documents = {}
+        # 按字典序排列的词项，前缀匹配时二分查找
+        self._sorted_terms = []
+        self._sorted_terms_dirty = False
+
+        self._watermark = None
+        self._last_sync = 0.0
+        self._lock = threading.RLock()
+
+    def search(self, keyword: str, offset=0, limit=20) -> list:
+        query_terms = tokenizeQuery(keyword)
+
+        if not query_terms:
+            return []
+
+        self._sync()
+
+        ranked_song_ids = self._rank(query_terms)
+
+        # 其余进程删除的歌曲仍在本进程的索引中，核对返回的这一页及之前的结果，
+        # 删除的歌曲从索引中移除后由后面的结果补上
+        while True:
+            window_song_ids = ranked_song_ids[:offset + limit]
+            existing_song_ids = set(models.SongSearchDocument.objects.filter(
+                song_id__in=window_song_ids,
+            ).values_list('song_id', flat=True))
+
+            removed_song_ids = set(window_song_ids) - existing_song_ids
+
+            if not removed_song_ids:
+                return window_song_ids[offset:]
+
+            with self._lock:
+                for song_id in removed_song_ids:
+                    self._removeDocument(song_id)
+
+            ranked_song_ids = [song_id for song_id in ranked_song_ids if song_id not in removed_song_ids]
+
+    def _rank(self, query_terms: list[tuple[str, bool]]) -> list:
+        with self._lock:
+            document_count = max(len(self._documents), 1)
+            scores = None
+
+            # 每个查询词至少命中一个字段，得分为字段权重乘以逆文档频率之和
+            for term, is_prefix in query_terms:
+                term_scores = {}
+
+                for matched_term in self._matchTerms(term, is_prefix):
+                    postings = self._postings[matched_term]
+                    idf = math.log(1 + document_count / len(postings))
+
+                    for song_id, weight in postings.items():
+                        term_scores[song_id] = max(term_scores.get(song_id, 0.0), weight * idf)
+
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {
+                        song_id: score + term_scores[song_id]
+                        for song_id, score in scores.items()
+                        if song_id in term_scores
+                    }
+
+                if not scores:
+                    return []
+
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], self._documents[item[0]][1]))
+
+            return [song_id for song_id, _ in ranked]
+
+    def _matchTerms(self, term: str, is_prefix: bool) -> list[str]:
+        if not is_prefix:
+            return [term] if term in self._postings else []
+
+        if self._sorted_terms_dirty:
+            self._sorted_terms = sorted(self._postings)
+            self._sorted_terms_dirty = False
+
+        matched_terms = []
+        for i in range(bisect_left(self._sorted_terms, term), len(self._sorted_terms)):
+            if not self._sorted_terms[i].startswith(term):
+                break
+            matched_terms.append(self._sorted_terms[i])
+
+        return matched_terms
+
+    def _sync(self):
+        if time.monotonic() - self._last_sync < self.sync_interval:
+            return
+
+        queryset = models.SongSearchDocument.objects.order_by('update_time')
+        if self._watermark is not None:
+            # 用 >= 防止漏掉同一时刻提交的文档，重复应用是幂等的
+            queryset = queryset.filter(update_time__gte=self._watermark)
+
+        documents = list(queryset.values('song_id', 'sname', 'aname', 'producer_name', 'update_time'))
+
+        with self._lock:
+            for document in documents:
+                self._applyDocument(document)
+
+            if documents:
+                self._watermark = documents[-1]['update_time']
+
+            self._last_sync = time.monotonic()
+
+    def _afterSave(self, documents: list[dict]):
+        with self._lock:
+            for document in documents:
+                self._applyDocument(document)
+
+    def _afterRemove(self, song_sid):
+        with self._lock:
+            self._removeDocument(song_sid)
+
+    def _applyDocument(self, document: dict):
+        song_id = document['song_id']
+        self._removeDocument(song_id)
+
+        term_weights = {}
+        for field, field_weight in FIELD_WEIGHTS.items():
+            for term in set(tokenize(document[field])):
+                term_weights[term] = term_weights.get(term, 0.0) + field_weight
+
+        for term, weight in term_weights.items():
+            if term not in self._postings:
+                self._postings[term] = {}
+                self._sorted_terms_dirty = True
+            self._postings[term][song_id] = weight
+
+        self._documents[song_id] = (set(term_weights), document['sname'])
+
+    def _removeDocument(self, song_id):
+        document = self._documents.pop(song_id, None)
+
+        if document is None:
+            return
+
+        for term in document[0]:
+            postings = self._postings[term]
+            postings.pop(song_id, None)
+
+            if not postings:
+                del self._postings[term]
+                self._sorted_terms_dirty = True
+
+
+_SEARCH_BACKENDS = {
+    'mysql': MysqlSongSearchBackend,
+    'memory': MemorySongSearchBackend,
+}
+
+_search_backend = None
+_search_backend_lock = threading.Lock()
+
+
+def getSongSearchBackend() -> SongSearchBackend:
+    """
+    :return: settings.SONG_SEARCH_BACKEND 指定的搜索后端，进程内单例
+    """
+    global _search_backend
+
+    if _search_backend is None:
+        with _search_backend_lock:
+            if _search_backend is None:
+                _search_backend = _SEARCH_BACKENDS[settings.SONG_SEARCH_BACKEND]()
+
+    return _search_backend
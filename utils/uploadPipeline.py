@@ -0,0 +1,976 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from musicplayer import models
+from utils.communityFeed import fanOutBlog
+from utils.entityCache import ENTITY_PRODUCER, ENTITY_SONG, ENTITY_SONGLIST, invalidateEntity, invalidateSongs
+from utils.modelOperation import invalidateJwtUserCache
+from utils.oss2Utils import OSS2Utils
+from utils import audioMetadata, audioTranscode, imagePipeline, utils
+
+logger = logging.getLogger(__name__)
+
+# 上传任务状态
+UPLOAD_STATUS_RECEIVING = 'c'
+UPLOAD_STATUS_DIRECT = 'd'
+UPLOAD_STATUS_PENDING = 'p'
+UPLOAD_STATUS_UPLOADING = 'u'
+UPLOAD_STATUS_SUCCESS = 's'
+UPLOAD_STATUS_FAILED = 'f'
+
+# 上传进度写入数据库的最小间隔，单位秒
+PROGRESS_REPORT_INTERVAL = 1.0
+
+
+def _afterSongUpdate(song_sid):
+    invalidateEntity(ENTITY_SONG, song_sid)
+
+
+def _afterSongAudioUpdate(song_sid):
+    # 旧音频的元数据和转码结果作废，新的提取、转码完成之前播放原始音频
+    models.Song.objects.filter(sid=song_sid).update(
+        duration_ms=None, sample_rate=None, bitrate=None, loudness_db=None, waveform_peaks=None,
+    )
+    models.SongRendition.objects.filter(song_id=song_sid).delete()
+    invalidateEntity(ENTITY_SONG, song_sid)
+
+
+def _afterAlbumUpdate(album_aid):
+    invalidateSongs(album_id=album_aid)
+
+
+def _afterUserUpdate(user_uid):
+    invalidateJwtUserCache(user_uid)
+
+    producer_pid = models.OrdinaryUser.objects.filter(uid=user_uid).values_list('producer_id', flat=True).first()
+
+    if producer_pid is not None:
+        invalidateEntity(ENTITY_PRODUCER, producer_pid)
+        invalidateSongs(producer_id=producer_pid)
+
+
+def _afterSongListUpdate(songlist_slid):
+    invalidateEntity(ENTITY_SONGLIST, songlist_slid)
+
+
+def _afterBlogUpdate(blog_bid):
+    # 帖子内容上传完成后才写入关注者的时间线
+    blog = models.Blog.objects.filter(bid=blog_bid).only('bid', 'community_id', 'create_time').first()
+
+    if blog is not None:
+        fanOutBlog(blog)
+
+
+def _producerOwner(ordinary_user):
+    if ordinary_user.producer_id is None:
+        return None
+
+    return {'producer_id': ordinary_user.producer_id}
+
+
+class UploadTarget(object):
+    """
+    上传结果写回的位置
+    """
+
+    def __init__(self, model, url_field, oss_folder, allowed_extensions, owner_filter=None, after_update=None,
+                 thumb_field=None, post_process=None):
+        """
+        :param model: 写回的模型
+        :param url_field: 写回的地址字段
+        :param oss_folder: oss 中的存储路径
+        :param allowed_extensions: 允许的扩展名
+        :param owner_filter: 参数为用户，返回该用户可以修改的行的过滤条件（无权修改时返回None）；
+                为None时只能由服务端接口写入，客户端直接发起的上传不允许使用
+        :param after_update: 写回后的处理，参数为行的主键
+        :param thumb_field: 图片类目标的缩略图地址字段，上传成功后在后台生成缩略图并写回该字段
+        :param post_process: 上传成功后在后台执行的处理，POST_PROCESS_JOBS 的键；暂存文件留给它使用并由它删除
+        """
+        self.model = model
+        self.url_field = url_field
+        self.oss_folder = oss_folder
+        self.allowed_extensions = allowed_extensions
+        self.owner_filter = owner_filter
+        self.after_update = after_update
+        self.thumb_field = thumb_field
+        self.post_process = post_process
+
+    def isOwnedBy(self, ordinary_user, target_id) -> bool:
+        """
+        :return: 用户是否可以修改主键为 target_id 的行
+        """
+        if self.owner_filter is None:
+            return False
+
+        owner_kwargs = self.owner_filter(ordinary_user)
+
+        if owner_kwargs is None:
+            return False
+
+        try:
+            return self.model.objects.filter(pk=target_id, **owner_kwargs).exists()
+        except ValidationError:
+            return False
+
+
+UPLOAD_TARGETS = {
+    'song_audio': UploadTarget(
+        model=models.Song, url_field='audio_url',
+        oss_folder=['song', 'audio'], allowed_extensions=['.wav', '.mp3', '.ogg'],
+        owner_filter=_producerOwner, after_update=_afterSongAudioUpdate, post_process='song_audio',
+    ),
+    'song_lyrics': UploadTarget(
+        model=models.Song, url_field='lyrics_url',
+        oss_folder=['song', 'lyrics'], allowed_extensions=['.lrc'],
+        owner_filter=_producerOwner, after_update=_afterSongUpdate,
+    ),
+    'album_cover': UploadTarget(
+        model=models.Album, url_field='cover_url',
+        oss_folder=['album', 'cover'], allowed_extensions=['.jpg', '.jpeg', '.png'],
+        owner_filter=_producerOwner, after_update=_afterAlbumUpdate,
+        thumb_field='cover_thumb_url', post_process='image_variants',
+    ),
+    'user_profile_picture': UploadTarget(
+        model=models.OrdinaryUser, url_field='profile_picture_url',
+        oss_folder=['user', 'profilePhoto'], allowed_extensions=['.jpg', '.jpeg', '.png'],
+        owner_filter=lambda ordinary_user: {'uid': ordinary_user.uid}, after_update=_afterUserUpdate,
+        thumb_field='profile_picture_thumb_url', post_process='image_variants',
+    ),
+    'songlist_cover': UploadTarget(
+        model=models.SongList, url_field='cover_picture_url',
+        oss_folder=['songlist', 'cover'], allowed_extensions=['.jpg', '.jpeg', '.png'],
+        owner_filter=lambda ordinary_user: {'ordinaryUser_id': ordinary_user.uid}, after_update=_afterSongListUpdate,
+        thumb_field='cover_thumb_url', post_process='image_variants',
+    ),
+    # 社群没有所有者，封面只能在创建社群时上传
+    'community_profile_picture': UploadTarget(
+        model=models.Community, url_field='profile_picture_url',
+        oss_folder=['community', 'profilePhoto'], allowed_extensions=['.jpg', '.jpeg', '.png'],
+        thumb_field='profile_picture_thumb_url', post_process='image_variants',
+    ),
+    # 帖子内容只能在发帖时上传
+    'blog_content': UploadTarget(
+        model=models.Blog, url_field='content_url',
+        oss_folder=['community', 'blog'], allowed_extensions=['.md'],
+        after_update=_afterBlogUpdate,
+    ),
+}
+
+
+class OssUploadStorage(object):
+    """
+    上传到阿里云 oss
+    """
+
+    def save(self, local_path, oss_key, progress_callback) -> str | None:
+        return OSS2Utils.upload_local_file(
+            local_path=local_path,
+            oss_key=oss_key,
+            progress_callback=progress_callback,
+        )
+
+    def signUploadUrl(self, oss_key, expires) -> str:
+        return OSS2Utils.sign_upload_url(oss_key, expires)
+
+    def objectSize(self, oss_key) -> int | None:
+        return OSS2Utils.get_object_size(oss_key)
+
+    def objectUrl(self, oss_key) -> str:
+        return OSS2Utils.get_object_url(oss_key)
+
+    def delete(self, oss_key):
+        OSS2Utils.delete_object(oss_key)
+
+    def saveBytes(self, oss_key, data, content_type) -> str | None:
+        return OSS2Utils.upload_bytes(oss_key, data, content_type)
+
+    def readHeader(self, oss_key, size) -> bytes:
+        return OSS2Utils.read_object_range(oss_key, 0, size - 1)
+
+    def download(self, oss_key, local_path):
+        OSS2Utils.download_object(oss_key, local_path)
+
+    def objectKey(self, url) -> str | None:
+        url_prefix = OSS2Utils.get_object_url('')
+        return url[len(url_prefix):] if url and url.startswith(url_prefix) else None
+
+    def readRange(self, oss_key, start, end, chunk_size):
+        object_stream = OSS2Utils.open_object_range(oss_key, start, end)
+
+        try:
+            yield from iter(lambda: object_stream.read(chunk_size), b'')
+        finally:
+            object_stream.close()
+
+
+class LocalUploadStorage(object):
+    """
+    复制到本地目录 settings.UPLOAD_LOCAL_ROOT，用于开发和测试，不访问外网
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    # 直传地址中令牌的签名盐值
+    SIGNING_SALT = 'utils.uploadPipeline.LocalUploadStorage'
+
+    def _localPath(self, oss_key) -> str:
+        return os.path.join(settings.UPLOAD_LOCAL_ROOT, *oss_key.split('/'))
+
+    def save(self, local_path, oss_key, progress_callback) -> str | None:
+        dst_path = self._localPath(oss_key)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+
+        total_bytes = os.path.getsize(local_path)
+        copied_bytes = 0
+
+        with open(local_path, 'rb') as src_file, open(dst_path, 'wb') as dst_file:
+            while True:
+                chunk = src_file.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                dst_file.write(chunk)
+                copied_bytes += len(chunk)
+                progress_callback(copied_bytes, total_bytes)
+
+        return self.objectUrl(oss_key)
+
+    def signUploadUrl(self, oss_key, expires) -> str:
+        # 模拟 oss 的预签名地址：PUT 到本服务的 localDirectUpload 接口
+        token = signing.dumps(oss_key, salt=self.SIGNING_SALT)
+        return '{}?{}'.format(settings.UPLOAD_LOCAL_DIRECT_URL, urlencode({'token': token}))
+
+    def receiveSignedUpload(self, token, stream):
+        """
+        localDirectUpload 接口收到的直传请求
+
+        :param token: signUploadUrl 生成的令牌
+        :param stream: 请求体
+        :raise signing.BadSignature: 令牌不合法或已过期
+        """
+        oss_key = signing.loads(token, salt=self.SIGNING_SALT, max_age=settings.DIRECT_UPLOAD_EXPIRES)
+
+        dst_path = self._localPath(oss_key)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+
+        with open(dst_path, 'wb') as dst_file:
+            shutil.copyfileobj(stream, dst_file, self.CHUNK_SIZE)
+
+    def objectSize(self, oss_key) -> int | None:
+        try:
+            return os.path.getsize(self._localPath(oss_key))
+        except FileNotFoundError:
+            return None
+
+    def objectUrl(self, oss_key) -> str:
+        return settings.UPLOAD_LOCAL_URL + oss_key
+
+    def delete(self, oss_key):
+        try:
+            os.remove(self._localPath(oss_key))
+        except FileNotFoundError:
+            pass
+
+    def saveBytes(self, oss_key, data, content_type) -> str | None:
+        dst_path = self._localPath(oss_key)
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+
+        with open(dst_path, 'wb') as dst_file:
+            dst_file.write(data)
+
+        return self.objectUrl(oss_key)
+
+    def readHeader(self, oss_key, size) -> bytes:
+        with open(self._localPath(oss_key), 'rb') as src_file:
+            return src_file.read(size)
+
+    def download(self, oss_key, local_path):
+        shutil.copyfile(self._localPath(oss_key), local_path)
+
+    def objectKey(self, url) -> str | None:
+        url_prefix = settings.UPLOAD_LOCAL_URL
+        return url[len(url_prefix):] if url and url.startswith(url_prefix) else None
+
+    def readRange(self, oss_key, start, end, chunk_size):
+        with open(self._localPath(oss_key), 'rb') as src_file:
+            src_file.seek(start)
+            remaining = end - start + 1
+
+            while remaining > 0:
+                chunk = src_file.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+_UPLOAD_STORAGES = {
+    'oss': OssUploadStorage,
+    'local': LocalUploadStorage,
+}
+
+
+def getUploadStorage():
+    """
+    :return: settings.UPLOAD_STORAGE_BACKEND 指定的存储
+    """
+    return _UPLOAD_STORAGES[settings.UPLOAD_STORAGE_BACKEND]()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _getExecutor() -> ThreadPoolExecutor:
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.UPLOAD_WORKERS,
+                    thread_name_prefix='upload',
+                )
+
+    return _executor
+
+
+def _stageFile(request_file, extension) -> str:
+    """
+    把请求中的文件写到暂存目录，请求结束后 Django 的临时文件会被删除
+    """
+    os.makedirs(settings.UPLOAD_STAGING_DIR, exist_ok=True)
+    staged_path = os.path.join(settings.UPLOAD_STAGING_DIR, uuid.uuid4().hex + extension)
+
+    with open(staged_path, 'wb') as staged_file:
+        for chunk in request_file.chunks():
+            staged_file.write(chunk)
+
+    return staged_path
+
+
+def _newOssKey(target, extension) -> str:
+    return '{}/{}'.format('/'.join(UPLOAD_TARGETS[target].oss_folder), uuid.uuid4().hex + extension)
+
+
+def submitUpload(request_file, extension, target, target_id, ordinary_user=None) -> models.UploadJob:
+    """
+    暂存文件并创建上传任务，事务提交后交给后台线程上传，不等待上传完成
+
+    :param request_file: POST请求中获取的文件
+    :param extension: 经过 checkFileExtension 检验的扩展名
+    :param target: 上传结果写回的位置，UPLOAD_TARGETS 的键
+    :param target_id: 写回的行的主键
+    :param ordinary_user: 发起上传的用户，只有该用户可以查询任务状态
+    :return: 上传任务
+    """
+    if target not in UPLOAD_TARGETS:
+        raise ValueError('unknown upload target {}'.format(target))
+
+    upload_job = models.UploadJob.objects.create(
+        ordinaryUser=ordinary_user,
+        target=target,
+        target_id=str(target_id),
+        oss_key=_newOssKey(target, extension),
+        staged_path=_stageFile(request_file, extension),
+        bytes_total=request_file.size,
+    )
+
+    transaction.on_commit(lambda: dispatchUploadJob(upload_job.jid))
+
+    return upload_job
+
+
+def dispatchUploadJob(job_jid):
+    """
+    把任务交给后台线程池；settings.UPLOAD_WORKERS 为 0 时在当前线程中同步执行
+    """
+    if settings.UPLOAD_WORKERS == 0:
+        runUploadJob(job_jid)
+        return
+
+    _getExecutor().submit(_runInWorker, runUploadJob, job_jid)
+
+
+def _runInWorker(job_function, job_jid):
+    # 工作线程有自己的数据库连接，按请求的方式在前后清理
+    close_old_connections()
+
+    try:
+        job_function(job_jid)
+    except Exception:
+        logger.exception('%s %s crashed', job_function.__name__, job_jid)
+    finally:
+        close_old_connections()
+
+
+def _updateJob(job_jid, **fields):
+    # update() 不会触发 auto_now，手动更新修改时间
+    models.UploadJob.objects.filter(jid=job_jid).update(update_time=timezone.now(), **fields)
+
+
+def _progressReporter(job_jid):
+    last_report_time = [0.0]
+
+    def report(consumed_bytes, total_bytes):
+        now = time.monotonic()
+        finished = total_bytes is not None and consumed_bytes >= total_bytes
+
+        if not finished and now - last_report_time[0] < PROGRESS_REPORT_INTERVAL:
+            return
+
+        last_report_time[0] = now
+        _updateJob(job_jid, bytes_uploaded=consumed_bytes)
+
+    return report
+
+
+def _finishUpload(upload_job, upload_url, bytes_total):
+    """
+    把文件地址写回目标行，任务标记为成功；随后在后台执行目标的 post_process
+    """
+    upload_target = UPLOAD_TARGETS[upload_job.target]
+
+    updated_fields = {upload_target.url_field: upload_url}
+
+    if upload_target.thumb_field is not None:
+        # 旧图的缩略图作废，新缩略图生成之前列表接口返回原图
+        updated_fields[upload_target.thumb_field] = None
+
+    upload_target.model.objects.filter(pk=upload_job.target_id).update(**updated_fields)
+
+    if upload_target.after_update is not None:
+        upload_target.after_update(upload_job.target_id)
+
+    _updateJob(
+        upload_job.jid,
+        status=UPLOAD_STATUS_SUCCESS,
+        url=upload_url,
+        bytes_total=bytes_total,
+        bytes_uploaded=bytes_total,
+        error=None,
+    )
+
+    if upload_target.post_process is not None:
+        transaction.on_commit(lambda: dispatchPostProcessJob(upload_job.jid))
+
+
+def runUploadJob(job_jid):
+    """
+    上传暂存文件，失败时按指数退避重试，最多 settings.UPLOAD_MAX_ATTEMPTS 次。
+    成功后把地址写回目标行并删除暂存文件；最终失败时保留暂存文件，便于排查和重新提交
+    """
+    upload_job = models.UploadJob.objects.filter(jid=job_jid).first()
+
+    if upload_job is None or upload_job.status not in (UPLOAD_STATUS_PENDING, UPLOAD_STATUS_UPLOADING):
+        return
+
+    storage = getUploadStorage()
+
+    attempt = upload_job.attempts
+
+    while True:
+        attempt += 1
+        _updateJob(job_jid, status=UPLOAD_STATUS_UPLOADING, attempts=attempt, bytes_uploaded=0)
+
+        try:
+            upload_url = storage.save(upload_job.staged_path, upload_job.oss_key, _progressReporter(job_jid))
+            error = None if upload_url is not None else 'storage returned no url'
+        except Exception as e:
+            upload_url = None
+            error = '{}: {}'.format(type(e).__name__, e)
+
+        if upload_url is not None:
+            break
+
+        logger.warning('upload job %s attempt %d failed: %s', job_jid, attempt, error)
+
+        if attempt >= settings.UPLOAD_MAX_ATTEMPTS:
+            _updateJob(job_jid, status=UPLOAD_STATUS_FAILED, error=error[:200])
+            return
+
+        _updateJob(job_jid, error=error[:200])
+        time.sleep(settings.UPLOAD_RETRY_DELAY * 2 ** (attempt - 1))
+
+    _finishUpload(upload_job, upload_url, upload_job.bytes_total)
+
+    # 有后续处理时暂存文件留给它使用，由它删除
+    if UPLOAD_TARGETS[upload_job.target].post_process is None:
+        _removeStagedFile(upload_job.staged_path)
+
+
+def _removeStagedFile(staged_path):
+    if not staged_path:
+        return
+
+    try:
+        os.remove(staged_path)
+    except FileNotFoundError:
+        pass
+
+
+def dispatchPostProcessJob(job_jid):
+    """
+    把上传任务的后续处理交给后台线程池；settings.UPLOAD_WORKERS 为 0 时在当前线程中同步执行
+    """
+    if settings.UPLOAD_WORKERS == 0:
+        # 与线程池中一样只记录日志，后续处理失败不影响已经成功的上传请求
+        try:
+            runPostProcessJob(job_jid)
+        except Exception:
+            logger.exception('runPostProcessJob %s crashed', job_jid)
+        return
+
+    _getExecutor().submit(_runInWorker, runPostProcessJob, job_jid)
+
+
+def runPostProcessJob(job_jid):
+    upload_job = models.UploadJob.objects.filter(jid=job_jid).first()
+
+    if upload_job is None or upload_job.status != UPLOAD_STATUS_SUCCESS:
+        return
+
+    POST_PROCESS_JOBS[UPLOAD_TARGETS[upload_job.target].post_process](upload_job)
+
+
+def _localSourceFile(upload_job, storage) -> str:
+    """
+    :return: 上传文件的本地路径，通常是暂存文件；直传的文件没有暂存文件，先从存储下载
+    """
+    if upload_job.staged_path and os.path.exists(upload_job.staged_path):
+        return upload_job.staged_path
+
+    os.makedirs(settings.UPLOAD_STAGING_DIR, exist_ok=True)
+    local_path = os.path.join(settings.UPLOAD_STAGING_DIR, uuid.uuid4().hex)
+    storage.download(upload_job.oss_key, local_path)
+
+    return local_path
+
+
+def runImageVariantJob(upload_job):
+    """
+    为上传成功的图片生成各规格的缩略图，存放在 imagePipeline.imageVariantKey 推出的路径下，
+    然后把缩略图地址写回目标行
+    """
+    upload_target = UPLOAD_TARGETS[upload_job.target]
+    storage = getUploadStorage()
+
+    local_path = _localSourceFile(upload_job, storage)
+
+    try:
+        thumb_url = None
+
+        for variant, extension, content_type, data in imagePipeline.renderImageVariants(local_path):
+            variant_url = storage.saveBytes(
+                imagePipeline.imageVariantKey(upload_job.oss_key, variant, extension), data, content_type,
+            )
+
+            if variant == imagePipeline.THUMB_VARIANT and extension == imagePipeline.THUMB_EXTENSION:
+                thumb_url = variant_url
+    except imagePipeline.IMAGE_DECODE_ERRORS as e:
+        # 通过了文件头检验但无法解码的图片，任务标记为失败，列表接口继续返回原图地址
+        logger.warning('image variants of upload job %s failed: %s', upload_job.jid, e)
+        _updateJob(upload_job.jid, status=UPLOAD_STATUS_FAILED, error='invalid image: {}'.format(e)[:200])
+        return
+    finally:
+        _removeStagedFile(local_path)
+
+    upload_target.model.objects.filter(
+        pk=upload_job.target_id,
+        # 生成期间又上传了新图片时不覆盖
+        **{upload_target.url_field: upload_job.url},
+    ).update(**{upload_target.thumb_field: thumb_url})
+
+    if upload_target.after_update is not None:
+        upload_target.after_update(upload_job.target_id)
+
+
+_transcode_executor = None
+
+
+def _transcode(source_path, output_dir) -> list[dict]:
+    """
+    在进程池中转码，转码占满 CPU 时不影响本进程处理请求；settings.TRANSCODE_WORKERS 为 0 时直接执行
+    """
+    global _transcode_executor
+
+    transcode_args = (
+        source_path, output_dir, settings.FFMPEG_BINARY, settings.HLS_SEGMENT_SECONDS, settings.TRANSCODE_TIMEOUT,
+    )
+
+    if settings.TRANSCODE_WORKERS == 0:
+        return audioTranscode.transcodeAudio(*transcode_args)
+
+    if _transcode_executor is None:
+        with _executor_lock:
+            if _transcode_executor is None:
+                # 本进程有多个线程，用 spawn 启动子进程，避免 fork 时复制其他线程持有的锁
+                _transcode_executor = ProcessPoolExecutor(
+                    max_workers=settings.TRANSCODE_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+
+    return _transcode_executor.submit(audioTranscode.transcodeAudio, *transcode_args).result()
+
+
+def _extractSongMetadata(upload_job, local_path):
+    """
+    提取时长、采样率、码率、响度和波形峰值写回歌曲，之后的接口不需要再读取音频文件
+    """
+    try:
+        metadata = audioMetadata.extractAudioMetadata(
+            local_path, ffmpeg_binary=settings.FFMPEG_BINARY, timeout=settings.TRANSCODE_TIMEOUT,
+        )
+    except (audioMetadata.AudioMetadataError, OSError) as e:
+        logger.warning('metadata extraction of upload job %s failed: %s', upload_job.jid, e)
+        return
+
+    # 提取期间又上传了新音频时不覆盖
+    if models.Song.objects.filter(sid=upload_job.target_id, audio_url=upload_job.url).update(**metadata):
+        _afterSongUpdate(upload_job.target_id)
+
+
+def _transcodeSongAudio(upload_job, local_path, storage):
+    """
+    把歌曲音频转码为各个规格，存放在 audioTranscode.renditionKey 推出的路径下，
+    然后整体替换歌曲的转码记录。转码失败时只记录日志，歌曲继续使用原始音频
+    """
+    output_dir = tempfile.mkdtemp(prefix='transcode_', dir=settings.UPLOAD_STAGING_DIR)
+
+    try:
+        renditions = _transcode(local_path, output_dir)
+
+        song_renditions = []
+
+        for rendition in renditions:
+            rendition_bytes = 0
+
+            for relative_path in rendition['files']:
+                file_path = os.path.join(output_dir, *relative_path.split('/'))
+                rendition_bytes += os.path.getsize(file_path)
+
+                storage.save(
+                    file_path, audioTranscode.renditionKey(upload_job.oss_key, relative_path), lambda *args: None,
+                )
+
+            song_renditions.append(models.SongRendition(
+                song_id=upload_job.target_id,
+                quality=rendition['quality'],
+                codec=audioTranscode.RENDITION_CODEC,
+                bitrate=rendition['bitrate'],
+                url=storage.objectUrl(audioTranscode.renditionKey(upload_job.oss_key, rendition['entry'])),
+                bytes=rendition_bytes,
+            ))
+    except audioTranscode.TranscodeError as e:
+        logger.warning('transcode of upload job %s failed: %s', upload_job.jid, e)
+        return
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    with transaction.atomic():
+        # 转码期间又上传了新音频时丢弃结果
+        if not models.Song.objects.select_for_update().filter(
+                sid=upload_job.target_id, audio_url=upload_job.url,
+        ).exists():
+            return
+
+        models.SongRendition.objects.filter(song_id=upload_job.target_id).delete()
+        models.SongRendition.objects.bulk_create(song_renditions)
+
+    _afterSongUpdate(upload_job.target_id)
+
+
+def runSongAudioJob(upload_job):
+    """
+    上传成功的歌曲音频先提取元数据，再转码为各个规格
+    """
+    storage = getUploadStorage()
+
+    local_path = _localSourceFile(upload_job, storage)
+
+    try:
+        _extractSongMetadata(upload_job, local_path)
+        _transcodeSongAudio(upload_job, local_path, storage)
+    finally:
+        _removeStagedFile(local_path)
+
+
+# 上传成功后的处理，UploadTarget.post_process 的取值
+POST_PROCESS_JOBS = {
+    'image_variants': runImageVariantJob,
+    'song_audio': runSongAudioJob,
+}
+
+
+class UploadRequestError(Exception):
+    """
+    客户端发起的上传（分片上传、直传）请求不合法，message 直接返回给客户端
+    """
+    pass
+
+
+def _chunkDir(upload_job) -> str:
+    return upload_job.staged_path + '.parts'
+
+
+def _chunkPath(upload_job, chunk_index) -> str:
+    return os.path.join(_chunkDir(upload_job), str(chunk_index))
+
+
+def chunkCount(upload_job) -> int:
+    return max(-(-upload_job.bytes_total // upload_job.chunk_size), 1)
+
+
+def _expectedChunkSize(upload_job, chunk_index) -> int:
+    if chunk_index < chunkCount(upload_job) - 1:
+        return upload_job.chunk_size
+
+    return upload_job.bytes_total - upload_job.chunk_size * chunk_index
+
+
+def _checkClientUpload(ordinary_user, target, target_id, filename) -> str:
+    """
+    检查客户端发起的上传：目标存在且用户有权修改，文件扩展名合法
+
+    :return: 文件扩展名
+    :raise UploadRequestError: 检查不通过
+    """
+    upload_target = UPLOAD_TARGETS.get(target)
+
+    if upload_target is None or not upload_target.isOwnedBy(ordinary_user, target_id):
+        raise UploadRequestError('upload target not found')
+
+    extension = utils.checkFileExtension(filename=filename or '', allowed_extensions=upload_target.allowed_extensions)
+
+    if extension is None:
+        raise UploadRequestError('invalid file extension')
+
+    return extension
+
+
+def createChunkedUpload(ordinary_user, target, target_id, filename, total_size) -> models.UploadJob:
+    """
+    创建浏览器分片上传的任务，此后客户端按 chunk_size 切分文件，逐片调用 saveChunk，
+    全部到齐后调用 completeChunkedUpload 进入上传流水线
+
+    :param ordinary_user: 发起上传的用户
+    :param target: 上传结果写回的位置，UPLOAD_TARGETS 的键
+    :param target_id: 写回的行的主键
+    :param filename: 原始文件名，用于检验扩展名
+    :param total_size: 文件大小
+    :return: 状态为接收分片中的上传任务
+    :raise UploadRequestError: 参数不合法或没有修改权限
+    """
+    extension = _checkClientUpload(ordinary_user, target, target_id, filename)
+
+    if total_size is None or not 0 < total_size <= settings.UPLOAD_MAX_SIZE:
+        raise UploadRequestError('invalid file size')
+
+    staged_path = os.path.join(settings.UPLOAD_STAGING_DIR, uuid.uuid4().hex + extension)
+
+    upload_job = models.UploadJob.objects.create(
+        ordinaryUser=ordinary_user,
+        target=target,
+        target_id=str(target_id),
+        oss_key=_newOssKey(target, extension),
+        staged_path=staged_path,
+        status=UPLOAD_STATUS_RECEIVING,
+        bytes_total=total_size,
+        chunk_size=settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+    )
+
+    os.makedirs(_chunkDir(upload_job), exist_ok=True)
+
+    return upload_job
+
+
+def saveChunk(upload_job, chunk_index, chunk_file):
+    """
+    保存一个分片。分片先写入临时文件再改名，重复上传同一分片是幂等的，客户端可以并行、乱序上传
+
+    :raise UploadRequestError: 任务不在接收分片状态，或分片序号、大小不合法
+    """
+    if upload_job.status != UPLOAD_STATUS_RECEIVING:
+        raise UploadRequestError('upload job is not receiving chunks')
+
+    if chunk_index is None or not 0 <= chunk_index < chunkCount(upload_job):
+        raise UploadRequestError('invalid chunk index')
+
+    if chunk_file.size != _expectedChunkSize(upload_job, chunk_index):
+        raise UploadRequestError('invalid chunk size')
+
+    chunk_path = _chunkPath(upload_job, chunk_index)
+    temp_path = '{}.{}.tmp'.format(chunk_path, uuid.uuid4().hex)
+
+    with open(temp_path, 'wb') as temp_file:
+        for data in chunk_file.chunks():
+            temp_file.write(data)
+
+    os.replace(temp_path, chunk_path)
+
+
+def receivedChunks(upload_job) -> list[int]:
+    """
+    :return: 已收到的分片序号，断点续传时客户端据此跳过已上传的分片
+    """
+    try:
+        names = os.listdir(_chunkDir(upload_job))
+    except FileNotFoundError:
+        return []
+
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+def completeChunkedUpload(upload_job):
+    """
+    所有分片到齐后按顺序拼接成暂存文件，把任务交给上传流水线
+
+    :raise UploadRequestError: 任务不在接收分片状态，或还有分片没有收到
+    """
+    if upload_job.status != UPLOAD_STATUS_RECEIVING:
+        raise UploadRequestError('upload job is not receiving chunks')
+
+    if len(receivedChunks(upload_job)) != chunkCount(upload_job):
+        raise UploadRequestError('missing chunks')
+
+    # 用条件更新抢占任务，重复提交完成请求时只有一个生效
+    if models.UploadJob.objects.filter(
+            jid=upload_job.jid,
+            status=UPLOAD_STATUS_RECEIVING,
+    ).update(status=UPLOAD_STATUS_PENDING, update_time=timezone.now()) == 0:
+        raise UploadRequestError('upload job is not receiving chunks')
+
+    try:
+        with open(upload_job.staged_path, 'wb') as staged_file:
+            for chunk_index in range(chunkCount(upload_job)):
+                with open(_chunkPath(upload_job, chunk_index), 'rb') as chunk_file:
+                    shutil.copyfileobj(chunk_file, staged_file)
+    except OSError as e:
+        _updateJob(upload_job.jid, status=UPLOAD_STATUS_FAILED, error=str(e)[:200])
+        raise
+
+    shutil.rmtree(_chunkDir(upload_job), ignore_errors=True)
+
+    if UPLOAD_TARGETS[upload_job.target].thumb_field is not None:
+        with open(upload_job.staged_path, 'rb') as staged_file:
+            header = staged_file.read(imagePipeline.IMAGE_HEADER_SIZE)
+
+        if imagePipeline.detectImageFormat(header) not in imagePipeline.ALLOWED_IMAGE_FORMATS:
+            _removeStagedFile(upload_job.staged_path)
+            _updateJob(upload_job.jid, status=UPLOAD_STATUS_FAILED, error='invalid image file')
+            raise UploadRequestError('invalid image file')
+
+    transaction.on_commit(lambda: dispatchUploadJob(upload_job.jid))
+
+
+def createDirectUpload(ordinary_user, target, target_id, filename) -> tuple[models.UploadJob, str]:
+    """
+    创建浏览器直传任务：客户端用返回的预签名地址把文件直接 PUT 到对象存储，
+    完成后调用 completeDirectUpload，文件内容不经过本服务
+
+    :param ordinary_user: 发起上传的用户
+    :param target: 上传结果写回的位置，UPLOAD_TARGETS 的键
+    :param target_id: 写回的行的主键
+    :param filename: 原始文件名，用于检验扩展名
+    :return: (状态为等待直传的上传任务, 预签名的上传地址)
+    :raise UploadRequestError: 参数不合法或没有修改权限
+    """
+    extension = _checkClientUpload(ordinary_user, target, target_id, filename)
+
+    upload_job = models.UploadJob.objects.create(
+        ordinaryUser=ordinary_user,
+        target=target,
+        target_id=str(target_id),
+        oss_key=_newOssKey(target, extension),
+        status=UPLOAD_STATUS_DIRECT,
+    )
+
+    upload_url = getUploadStorage().signUploadUrl(upload_job.oss_key, settings.DIRECT_UPLOAD_EXPIRES)
+
+    return upload_job, upload_url
+
+
+def completeDirectUpload(upload_job):
+    """
+    客户端直传完成后的回调：确认对象已经存在且大小合法，把地址写回目标行。
+    大小不合法的对象会被删除，任务标记为失败
+
+    :raise UploadRequestError: 任务不在等待直传状态、对象不存在或大小不合法
+    """
+    if upload_job.status != UPLOAD_STATUS_DIRECT:
+        raise UploadRequestError('upload job is not waiting for direct upload')
+
+    storage = getUploadStorage()
+    object_size = storage.objectSize(upload_job.oss_key)
+
+    if object_size is None:
+        raise UploadRequestError('uploaded object not found')
+
+    if not 0 < object_size <= settings.UPLOAD_MAX_SIZE:
+        storage.delete(upload_job.oss_key)
+        _updateJob(upload_job.jid, status=UPLOAD_STATUS_FAILED, error='invalid file size')
+        raise UploadRequestError('invalid file size')
+
+    # 图片按文件头检验，扩展名可以伪造
+    if UPLOAD_TARGETS[upload_job.target].thumb_field is not None:
+        header = storage.readHeader(upload_job.oss_key, imagePipeline.IMAGE_HEADER_SIZE)
+
+        if imagePipeline.detectImageFormat(header) not in imagePipeline.ALLOWED_IMAGE_FORMATS:
+            storage.delete(upload_job.oss_key)
+            _updateJob(upload_job.jid, status=UPLOAD_STATUS_FAILED, error='invalid image file')
+            raise UploadRequestError('invalid image file')
+
+    # 用条件更新抢占任务，重复回调时只有一个生效
+    if models.UploadJob.objects.filter(
+            jid=upload_job.jid,
+            status=UPLOAD_STATUS_DIRECT,
+    ).update(status=UPLOAD_STATUS_UPLOADING, update_time=timezone.now()) == 0:
+        raise UploadRequestError('upload job is not waiting for direct upload')
+
+    _finishUpload(upload_job, storage.objectUrl(upload_job.oss_key), object_size)
+
+
+def resumeUploadJobs() -> int:
+    """
+    重新提交进程退出时没有完成的任务，暂存文件已丢失的任务标记为失败。
+    只处理超过 settings.UPLOAD_STALE_TIMEOUT 秒没有更新的任务，其余进程正在上传的任务会定期更新进度，
+    重启一个进程时不会打断它们
+
+    :return: 重新提交的任务数
+    """
+    resumed_count = 0
+
+    for upload_job in models.UploadJob.objects.filter(
+            status__in=[UPLOAD_STATUS_PENDING, UPLOAD_STATUS_UPLOADING],
+            update_time__lt=timezone.now() - timedelta(seconds=settings.UPLOAD_STALE_TIMEOUT),
+    ).only('jid', 'staged_path', 'update_time'):
+        # 按读到的修改时间认领任务，多个进程同时启动时每个任务只被一个进程处理
+        if models.UploadJob.objects.filter(
+                jid=upload_job.jid,
+                update_time=upload_job.update_time,
+        ).update(update_time=timezone.now()) == 0:
+            continue
+
+        if not upload_job.staged_path or not os.path.exists(upload_job.staged_path):
+            _updateJob(upload_job.jid, status=UPLOAD_STATUS_FAILED, error='staged file lost')
+            continue
+
+        runUploadJob(upload_job.jid)
+        resumed_count += 1
+
+    return resumed_count
@@ -68,6 +68,20 @@ def strToDate(date_str: str) -> date | None:
         return None
 
 
+def strToInt(int_str: str, default: int | None = None) -> int | None:
+    """
+    Convert a string to an int. If the conversion fails, return the default value.
+
+    :param int_str: A string representing an integer.
+    :param default: The value returned when the conversion fails.
+    :return: An int if conversion is successful, otherwise default.
+    """
+    try:
+        return int(int_str)
+    except (ValueError, TypeError):
+        return default
+
+
 def jsonArrayToList(json_array: str) -> list | None:
     """
     将 JSON 数组字符串转换为 Python 列表。